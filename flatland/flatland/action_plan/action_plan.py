@@ -20,6 +20,10 @@ ActionPlan = List[ActionPlanElement]
 # An action plan dict gathers all the actions for every agent identified by the dictionary key = agent_handle
 ActionPlanDict = Dict[int, ActionPlan]
 
+# compiled action plans use this for steps without an action
+NO_ACTION = -1
+_RAIL_ENV_ACTIONS = list(RailEnvActions)
+
 
 class ControllerFromTrainruns():
     """Takes train runs, derives the actions from it and re-acts them."""
@@ -33,6 +37,46 @@ class ControllerFromTrainruns():
         self.trainrun_dict: Dict[int, Trainrun] = trainrun_dict
         self.action_plan: ActionPlanDict = [self._create_action_plan_for_agent(agent_id, chosen_path)
                                             for agent_id, chosen_path in trainrun_dict.items()]
+        # action of every agent at every step, NO_ACTION where the action plan has none
+        self.action_table: np.ndarray = np.full((len(self.action_plan), 1), NO_ACTION, dtype=np.int8)
+        for agent_id in range(len(self.action_plan)):
+            self._compile_action_plan(agent_id)
+
+    def update_trainruns(self, trainrun_dict: Dict[int, Trainrun]):
+        """
+        Replaces the train runs of some agents, e.g. after replanning, and recompiles only their rows of the
+        action table.
+
+        Parameters
+        ----------
+        trainrun_dict
+            The new train runs by agent id.
+        """
+        for agent_id, trainrun in trainrun_dict.items():
+            self.trainrun_dict[agent_id] = trainrun
+            self.action_plan[agent_id] = self._create_action_plan_for_agent(agent_id, trainrun)
+            self._compile_action_plan(agent_id)
+
+    def _compile_action_plan(self, agent_id: int):
+        """Writes the action plan of the agent into its row of `action_table`, widening the table if needed."""
+        action_plan = self.action_plan[agent_id]
+        last_step = max((element.scheduled_at for element in action_plan), default=0)
+        if last_step >= self.action_table.shape[1]:
+            width = max(last_step + 1, 2 * self.action_table.shape[1])
+            action_table = np.full((self.action_table.shape[0], width), NO_ACTION, dtype=np.int8)
+            action_table[:, :self.action_table.shape[1]] = self.action_table
+            self.action_table = action_table
+
+        row = self.action_table[agent_id]
+        row[:] = NO_ACTION
+        # same semantics as scanning the plan in `get_action_at_step`: an element is found at its step
+        # only if no earlier element is scheduled at or after that step
+        latest = -1
+        for element in action_plan:
+            if element.scheduled_at > latest:
+                if element.scheduled_at >= 0:
+                    row[element.scheduled_at] = element.action
+                latest = element.scheduled_at
 
     def get_waypoint_before_or_at_step(self, agent_id: int, step: int) -> Waypoint:
         """
@@ -84,13 +128,12 @@ class ControllerFromTrainruns():
         WalkingElement, optional
 
         """
-        for action_plan_element in self.action_plan[agent_id]:
-            scheduled_at = action_plan_element.scheduled_at
-            if scheduled_at > current_step:
-                return None
-            elif current_step == scheduled_at:
-                return action_plan_element.action
-        return None
+        if not 0 <= current_step < self.action_table.shape[1]:
+            return None
+        action = self.action_table[agent_id, current_step]
+        if action == NO_ACTION:
+            return None
+        return _RAIL_ENV_ACTIONS[action]
 
     def act(self, current_step: int) -> Dict[int, RailEnvActions]:
         """
@@ -108,12 +151,11 @@ class ControllerFromTrainruns():
         Dict[int, RailEnvActions]
 
         """
-        action_dict = {}
-        for agent_id in range(len(self.env.agents)):
-            action: Optional[RailEnvActions] = self.get_action_at_step(agent_id, current_step)
-            if action is not None:
-                action_dict[agent_id] = action
-        return action_dict
+        if not 0 <= current_step < self.action_table.shape[1]:
+            return {}
+        actions = self.action_table[:len(self.env.agents), current_step]
+        return {agent_id: _RAIL_ENV_ACTIONS[actions[agent_id]]
+                for agent_id in np.flatnonzero(actions != NO_ACTION).tolist()}
 
     def print_action_plan(self):
         """Pretty-prints `ActionPlanDict` of this `ControllerFromTrainruns`  to stdout."""
@@ -13,6 +13,7 @@ from flatland.envs.rail_generators import complex_rail_generator
 from flatland.envs.schedule_generators import complex_schedule_generator
 from flatland.evaluators.service import FlatlandRemoteEvaluationService
 from flatland.utils.rendertools import RenderTool
+from flatland.utils.scenario_farm import generate_scenarios, scenario_grid
 
 
 @click.command()
@@ -100,5 +101,40 @@ def evaluator(tests, service_id, shuffle, disable_timeouts, results_path):
     grader.run()
 
 
+@click.command()
+@click.option('--out',
+              type=click.Path(exists=False),
+              help="Folder where the test cases and their manifest are written",
+              required=True
+              )
+@click.option('--width', type=int, multiple=True, required=True, help="Width of the grid, repeat for several values")
+@click.option('--height', type=int, multiple=True, required=True, help="Height of the grid, repeat for several values")
+@click.option('--cities', type=int, multiple=True, required=True,
+              help="Maximum number of cities, repeat for several values")
+@click.option('--agents', type=int, multiple=True, required=True, help="Number of agents, repeat for several values")
+@click.option('--malfunction_rate', type=float, multiple=True, default=[0.],
+              help="Malfunction rate per step and agent, repeat for several values")
+@click.option('--min_duration', type=int, multiple=True, default=[0],
+              help="Minimum malfunction duration, repeat for several values")
+@click.option('--max_duration', type=int, multiple=True, default=[0],
+              help="Maximum malfunction duration, repeat for several values")
+@click.option('--seeds', type=int, default=10, help="Number of tests per level, seeded 1, 2, ...")
+@click.option('--ddl_scale', type=float, default=0.2, help="Deadline scale")
+@click.option('--processes', type=int, default=0, help="Number of processes, 0 for one per CPU")
+def scenario_farm(out, width, height, cities, agents, malfunction_rate, min_duration, max_duration, seeds, ddl_scale,
+                  processes):
+    """Generates a suite of test cases, one level per combination of parameters and one test per seed"""
+    scenarios = scenario_grid({"width": list(width),
+                               "height": list(height),
+                               "max_num_cities": list(cities),
+                               "number_of_agents": list(agents),
+                               "malfunction_rate": list(malfunction_rate),
+                               "min_duration": list(min_duration),
+                               "max_duration": list(max_duration)},
+                              seeds=range(1, seeds + 1))
+    manifest = generate_scenarios(scenarios, out, ddl_scale=ddl_scale, processes=processes or None)
+    print(manifest["summary"])
+
+
 if __name__ == "__main__":
     sys.exit(demo())  # pragma: no cover
@@ -7,8 +7,11 @@ The ObservationBuilder-derived custom classes implement 2 functions, reset() and
 + `get()` is called whenever an observation has to be computed, potentially for each agent independently in case of \
 multi-agent environments.
 
++ `get_batch()` can be implemented by builders whose observations have a fixed size, to write the observations of \
+all agents into preallocated arrays instead of building one observation structure per agent.
+
 """
-from typing import Optional, List
+from typing import Optional, List, Tuple, Union
 
 import numpy as np
 
@@ -22,6 +25,8 @@ class ObservationBuilder:
 
     def __init__(self):
         self.env = None
+        # buffers of get_batch, reused as long as their shape does not change
+        self._batch_buffers = {}
 
     def set_env(self, env: Environment):
         self.env: Environment = env
@@ -72,6 +77,40 @@ class ObservationBuilder:
         """
         raise NotImplementedError()
 
+    def get_batch(self, handles: Optional[List[int]] = None) -> Union[np.ndarray, Tuple[np.ndarray, ...]]:
+        """
+        Computes the observations of the agents with handle in the `handles` list, all the agents by default, as
+        arrays with one row per agent: the observations of `get_many`, stacked along a first axis of size
+        `len(handles)`.
+
+        The arrays are buffers of the builder, reused by the next calls as long as their shape does not change:
+        they are overwritten by the next call and must not be modified, copy them to keep them. Together with
+        `RailEnv(compute_observations=False)`, the observations are computed once per step, straight into the
+        buffers.
+
+        Parameters
+        ----------
+        handles : list of handles, optional
+            List with the handles of the agents for which to compute the observations.
+
+        Returns
+        -------
+        np.ndarray or tuple of np.ndarray
+            The observations, specific to the corresponding environment.
+        """
+        raise NotImplementedError()
+
+    def _get_batch_buffer(self, name: str, shape: Tuple[int, ...], dtype=float) -> np.ndarray:
+        """
+        Returns the buffer `name` of `get_batch`, allocated again only when its shape or dtype changes.
+        The content of the buffer is left as it was at the previous call.
+        """
+        buffer = self._batch_buffers.get(name)
+        if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+            buffer = np.empty(shape, dtype=dtype)
+            self._batch_buffers[name] = buffer
+        return buffer
+
     def _get_one_hot_for_agent_direction(self, agent):
         """Retuns the agent's direction to one-hot encoding."""
         direction = np.zeros(4)
@@ -1,11 +1,11 @@
+import heapq
+
 import numpy as np
-import random
 
 from flatland.core.grid.grid_utils import IntVector2D, IntVector2DDistance
 from flatland.core.grid.grid_utils import IntVector2DArray
 from flatland.core.grid.grid_utils import Vec2dOperations as Vec2d
 from flatland.core.transition_map import GridTransitionMap
-from flatland.utils.ordered_set import OrderedSet
 
 
 class AStarNode:
@@ -60,153 +60,111 @@ def a_star(grid_map: GridTransitionMap, start: IntVector2D, end: IntVector2D,
     """
     """
     Returns a list of tuples as a path from the given start to end.
-    If no path is found, returns path to closest point to end.
+    If no path is found, returns an empty list.
+
+    The open nodes are kept in a heap. Nodes with f below 3 times the f of the start are expanded first, preferring
+    the most cells merged into already reserved rails, then the lowest h, then the highest g. The others are expanded
+    by lowest f, then most merged cells and lowest h. Remaining ties go to the node opened first (to the node opened
+    last beyond 3 times the f of the start). An open node is only replaced by a path merging more reserved rails.
     """
-    rail_shape = grid_map.grid.shape
-
-    start_node = AStarNode(start, None)
-    end_node = AStarNode(end, None)
-    start_node.h = a_star_distance_function(start_node.pos, end_node.pos)
-    start_f = start_node.g + start_node.h
-    start_h = start_node.h
-
-    start_node.f = start_node.g + start_node.h
-
-    open_nodes = OrderedSet()
-    closed_nodes = OrderedSet()
-    open_nodes.add(start_node)
-
-    while len(open_nodes) > 0:
-        # get node with current shortest est. path (lowest f)
-        current_node = None
-        for item in open_nodes:
-            if current_node is None:
-                current_node = item
-                continue
-            if item.f < current_node.f:
-                    current_node = item
-            # elif item.g== current_node.g and item.merged > current_node.merged:
-            #         current_node = item
-
-
-        for item in open_nodes:
-
-
-            if item.f <3 * start_f:
-                # if item.h - start_h >= 0 and current_node.h - start_h >= 0 and item.h < current_node.h:
-                #     current_node = item
-                # elif item.h - start_h < 0 and current_node.h - start_h >= 0:
-                #     current_node = item
-                # el
-                if item.merged == 0 and current_node.merged==0 and item.g < current_node.g:
-                    current_node = item
-                elif item.merged > current_node.merged:
-                    current_node = item
-                elif item.merged  == current_node.merged and item.h < current_node.h:
-                    current_node = item
-                elif item.merged  == current_node.merged and item.h == current_node.h and item.g > current_node.g:
-                    current_node = item
-
-            elif item.f >=3* start_f and current_node.f >=3* start_f:
-                if item.f < current_node.f:
-                    current_node = item
-                elif item.f == current_node.f and item.merged > current_node.merged:
-                    current_node = item
-                elif item.f == current_node.f and item.merged == current_node.merged and item.h < current_node.h :
-                    current_node = item
-                elif item.f == current_node.f and item.merged == current_node.merged and item.h == current_node.h and random.sample([True,False],1):
-                    current_node = item
-
-        # pop current off open list, add to closed list
-        open_nodes.remove(current_node)
-        closed_nodes.add(current_node)
+    height, width = grid_map.grid.shape
+    reserve = getattr(grid_map, "reserve", None)
+    end = tuple(end)
+    end_cell = end[0] * width + end[1]
+    start_cell = start[0] * width + start[1]
+
+    forbidden = None
+    if forbidden_cells is not None and len(forbidden_cells) > 0:
+        cells = np.array(forbidden_cells, dtype=int).reshape(-1, 2)
+        cells = cells[(cells[:, 0] >= 0) & (cells[:, 0] < height) & (cells[:, 1] >= 0) & (cells[:, 1] < width)]
+        forbidden = np.zeros(height * width, dtype=bool)
+        forbidden[cells[:, 0] * width + cells[:, 1]] = True
+        # the path may always start and end in forbidden cells
+        forbidden[start_cell] = False
+        forbidden[end_cell] = False
+
+    # per cell state, indexed by row * width + column
+    g_score = np.full(height * width, np.inf)
+    merged = np.zeros(height * width)
+    parent = np.full(height * width, -1, dtype=np.int64)
+    closed = np.zeros(height * width, dtype=bool)
+
+    start_h = float(a_star_distance_function(start, end))
+    max_inside_f = 3 * start_h
+    g_score[start_cell] = 0.0
+
+    def heap_entry(g, h, merged_cells, cell):
+        nonlocal counter
+        counter += 1
+        f = g + h
+        if f < max_inside_f:
+            return 0, 0.0, -merged_cells, h, -g, counter, cell, g, merged_cells
+        return 1, f, -merged_cells, h, 0.0, -counter, cell, g, merged_cells
+
+    counter = 0
+    open_heap = [heap_entry(0.0, start_h, 0.0, start_cell)]
+
+    while len(open_heap) > 0:
+        # get the node to expand, skipping the entries of nodes closed or replaced since they were pushed
+        *_, current_cell, current_g, current_merged = heapq.heappop(open_heap)
+        if closed[current_cell] or current_g != g_score[current_cell] or current_merged != merged[current_cell]:
+            continue
+        closed[current_cell] = True
+        current_pos = divmod(current_cell, width)
 
         # found the goal
-        if current_node.pos == end_node.pos :
-
+        if current_cell == end_cell:
             path = []
-            current = current_node
-            while current is not None:
-                path.append(current.pos)
-                current = current.parent
-
+            cell = current_cell
+            while cell >= 0:
+                path.append(divmod(int(cell), width))
+                cell = parent[cell]
             # return reversed path
             return path[::-1]
 
-        # generate children
-        children = []
-        if current_node.parent is not None:
-            prev_pos = current_node.parent.pos
-        else:
-            prev_pos = None
+        prev_pos = divmod(int(parent[current_cell]), width) if parent[current_cell] >= 0 else None
 
         for new_pos in [(0, -1), (0, 1), (-1, 0), (1, 0)]:
             # update the "current" pos
-            node_pos: IntVector2D = Vec2d.add(current_node.pos, new_pos)
+            node_pos: IntVector2D = (current_pos[0] + new_pos[0], current_pos[1] + new_pos[1])
 
             # is node_pos inside the grid?
-            if node_pos[0] >= rail_shape[0] or node_pos[0] < 0 or node_pos[1] >= rail_shape[1] or node_pos[1] < 0:
+            if node_pos[0] >= height or node_pos[0] < 0 or node_pos[1] >= width or node_pos[1] < 0:
                 continue
+            node_cell = node_pos[0] * width + node_pos[1]
 
-            # validate positions
-            #
-            if not grid_map.validate_new_transition(prev_pos, current_node.pos, node_pos,
-                                                    end_node.pos) and respect_transition_validity:
+            # already in closed list?
+            if closed[node_cell]:
                 continue
-            # create new node
-            new_node = AStarNode(node_pos, current_node)
 
             # Skip paths through forbidden regions if they are provided
-            if forbidden_cells is not None:
-                if node_pos in forbidden_cells and new_node != start_node and new_node != end_node:
-                    continue
-
-            children.append(new_node)
-
-        # loop through children
-        for child in children:
+            if forbidden is not None and forbidden[node_cell]:
+                continue
 
+            # validate positions
+            if respect_transition_validity and \
+                    not grid_map.validate_new_transition(prev_pos, current_pos, node_pos, end):
+                continue
 
             # create the f, g, and h values
-            child.g = current_node.g + 1.0
+            on_rail = min(int(grid_map.grid[node_pos]), 1)
             # this heuristic avoids diagonal paths
-            child.merged = child.parent.merged+grid_map.reserve[child.pos] * np.clip(grid_map.grid[child.pos], 0, 1)
-
+            child_merged = current_merged
+            if reserve is not None:
+                child_merged += float(reserve[node_pos]) * on_rail
+            child_g = current_g + 1.0
+            child_h = float(a_star_distance_function(node_pos, end))
             if avoid_rails:
-                child.h = a_star_distance_function(child.pos, end_node.pos) + np.clip(grid_map.grid[child.pos], 0, 1)
-            else:
-                child.h = a_star_distance_function(child.pos, end_node.pos) #+ 20 - np.clip(grid_map.grid[child.pos], 0, 1)*10  #- 10 if child.merged > 0 and np.clip(grid_map.grid[child.pos], 0, 1) ==0 else 0
-            child.f = child.g + child.h
-
-            # if child.f >  start_f + grid_map.width//5 :
-            #     continue
-
-            # already in closed list?
-            if child in closed_nodes:
-                # for key in closed_nodes.keys():
-                #     if key == child:
-                #         if  child.merged == key.merged and child.h < key.h:
-                #             closed_nodes.remove(key)
-                #             open_nodes.add(child)
-                #         break
-                continue
+                child_h += on_rail
 
             # already in the open list?
-            if child in open_nodes:
-                for key in open_nodes.keys():
-                    if key == child:
-                        if  child.merged > key.merged :
-                            open_nodes.remove(key)
-                            open_nodes.add(child)
-                        elif  child.merged == key.merged and child.h < key.h:
-                            open_nodes.remove(key)
-                            open_nodes.add(child)
-                        break
+            if g_score[node_cell] < np.inf and child_merged <= merged[node_cell]:
                 continue
 
-            # add the child to the open list
-            open_nodes.add(child)
+            g_score[node_cell] = child_g
+            merged[node_cell] = child_merged
+            parent[node_cell] = current_cell
+            heapq.heappush(open_heap, heap_entry(child_g, child_h, child_merged, node_cell))
 
-        # no full path found
-        if len(open_nodes) == 0:
-            return []
+    # no full path found
+    return []
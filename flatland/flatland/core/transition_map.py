@@ -142,6 +142,31 @@ class GridTransitionMap(TransitionMap):
         else:
             self.random_generator.seed(random_seed)
         self.grid = np.zeros((height, width), dtype=self.transitions.get_type())
+        # transition bits of the grid, with the copy of the grid they were computed from
+        self._transition_bits = None
+        self._transition_bits_grid = None
+
+    def get_transition_bits(self) -> np.ndarray:
+        """
+        Returns the transition bits of every cell, most significant bit first, as a read-only uint8 array of shape
+        (height, width, bits), e.g. (height, width, 16) for the rail transitions.
+
+        The array is computed once per rail and shared by all its users, e.g. the observation builders; it is only
+        recomputed when the grid has been replaced or modified.
+
+        Returns
+        -------
+        np.ndarray
+            The transition bits, 0 or 1.
+        """
+        if self._transition_bits is None or self._transition_bits_grid.shape != self.grid.shape \
+                or not np.array_equal(self._transition_bits_grid, self.grid):
+            grid = np.ascontiguousarray(self.grid, dtype=self.grid.dtype.newbyteorder('>'))
+            transition_bits = np.unpackbits(grid[..., np.newaxis].view(np.uint8), axis=-1)
+            transition_bits.flags.writeable = False
+            self._transition_bits = transition_bits
+            self._transition_bits_grid = self.grid.copy()
+        return self._transition_bits
 
     def get_full_transitions(self, row, column):
         """
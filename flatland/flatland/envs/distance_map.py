@@ -1,3 +1,6 @@
+import hashlib
+import os
+import tempfile
 from collections import deque
 from typing import List, Optional
 
@@ -8,6 +11,140 @@ from flatland.core.transition_map import GridTransitionMap
 from flatland.envs.agent_utils import EnvAgent
 
 
+class DistanceMapCache:
+    """
+    Content-addressed disk cache of distance maps, keyed by a hash of the rail grid and the targets.
+
+    Each entry is an int32 .npy file with the distance maps of the distinct targets, -1 where a target cannot be
+    reached. When the files exceed `max_bytes`, the least recently used ones are removed.
+
+    Parameters
+    ----------
+    directory : str
+        Directory of the cache files, created if needed. Several processes may share it.
+    max_bytes : int
+        Size cap of the cache directory.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 1 << 30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(grid: np.ndarray, targets: List) -> str:
+        """
+        Key of the distance maps of the given distinct targets, in this order, on the given grid.
+        """
+        digest = hashlib.sha1()
+        digest.update(str(grid.shape).encode())
+        digest.update(np.ascontiguousarray(grid, dtype=np.uint16).tobytes())
+        digest.update(np.array(targets, dtype=np.int32).tobytes())
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".npy")
+
+    def load(self, key: str) -> Optional[np.ndarray]:
+        """
+        The cached int32 distance maps, or None.
+        """
+        try:
+            distance_maps = np.load(self._path(key))
+        except (FileNotFoundError, ValueError, EOFError):
+            # missing or unreadable
+            self.stats["misses"] += 1
+            return None
+        try:
+            # mark as recently used
+            os.utime(self._path(key))
+        except FileNotFoundError:
+            # evicted meanwhile by another process
+            pass
+        self.stats["hits"] += 1
+        return distance_maps
+
+    def store(self, key: str, distance_maps: np.ndarray):
+        """
+        Stores int32 distance maps and evicts the least recently used entries above the size cap.
+        """
+        file_descriptor, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(file_descriptor, "wb") as file_out:
+            np.save(file_out, distance_maps.astype(np.int32))
+        os.replace(temp_path, self._path(key))
+        self.stats["stores"] += 1
+        self._evict()
+
+    def _entries(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".npy"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def size_bytes(self) -> int:
+        """
+        Total size of the cached distance maps.
+        """
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self):
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                self.stats["evictions"] += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        """
+        Removes all cached distance maps.
+        """
+        for _, _, path in self._entries():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+# Cache used by all distance maps, see `set_distance_map_cache`.
+# Set from the FLATLAND_DISTANCE_MAP_CACHE environment variable on first use.
+_distance_map_cache = None
+_distance_map_cache_configured = False
+
+
+def set_distance_map_cache(cache: Optional[DistanceMapCache]):
+    """
+    Sets the cache looked up by `DistanceMap.get()` before computing distance maps; None disables caching.
+    """
+    global _distance_map_cache, _distance_map_cache_configured
+    _distance_map_cache = cache
+    _distance_map_cache_configured = True
+
+
+def get_distance_map_cache() -> Optional[DistanceMapCache]:
+    """
+    The cache set with `set_distance_map_cache`, else one in the FLATLAND_DISTANCE_MAP_CACHE directory if that
+    environment variable is set.
+    """
+    global _distance_map_cache, _distance_map_cache_configured
+    if not _distance_map_cache_configured:
+        directory = os.environ.get("FLATLAND_DISTANCE_MAP_CACHE")
+        _distance_map_cache = DistanceMapCache(directory) if directory else None
+        _distance_map_cache_configured = True
+    return _distance_map_cache
+
+
 class DistanceMap:
     def __init__(self, agents: List[EnvAgent], env_height: int, env_width: int):
         self.env_height = env_height
@@ -63,6 +200,19 @@ class DistanceMap:
 
         """
         self.agents_previous_computation = self.agents
+
+        cache = get_distance_map_cache()
+        if cache is not None:
+            targets = list(dict.fromkeys(agent.target for agent in agents))
+            target_index = {target: i for i, target in enumerate(targets)}
+            key = cache.key(rail.grid, targets)
+            distance_maps = cache.load(key)
+            if distance_maps is not None and distance_maps.shape == (len(targets), self.env_height,
+                                                                     self.env_width, 4):
+                self.distance_map = distance_maps[[target_index[agent.target] for agent in agents]].astype(float)
+                self.distance_map[self.distance_map < 0] = np.inf
+                return
+
         self.distance_map = np.inf * np.ones(shape=(len(agents),
                                                     self.env_height,
                                                     self.env_width,
@@ -78,6 +228,11 @@ class DistanceMap:
                     self.distance_map[computed_targets.index(agent.target), :, :, :])
             computed_targets.append(agent.target)
 
+        if cache is not None:
+            first_agents = [computed_targets.index(target) for target in targets]
+            distance_maps = self.distance_map[first_agents]
+            cache.store(key, np.where(np.isinf(distance_maps), -1, distance_maps).astype(np.int32))
+
     def _distance_map_walker(self, rail: GridTransitionMap, position, target_nr: int):
         """
         Utility function to compute distance maps from each cell in the rail network (and each possible
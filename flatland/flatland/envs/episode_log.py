@@ -0,0 +1,165 @@
+"""
+Append-only binary episode logs.
+
+An episode log starts with a header (magic, format version, number of agents) followed by one fixed-width block of
+`EPISODE_STEP_DTYPE` records per time step, one record per agent. Steps are appended while the episode runs, so memory
+does not grow with the episode length, and any step can be read back without loading the others.
+"""
+import os
+import struct
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from flatland.envs.agent_utils import EnvAgent
+
+EPISODE_LOG_MAGIC = b"FLEPISOD"
+EPISODE_LOG_VERSION = 1
+# magic, version, number of agents
+_HEADER = struct.Struct("<8sII")
+
+# State of an agent after a step and the action it was given in that step.
+# Positions are (-1, -1) when the agent is not on the grid, actions -1 when it was given none.
+EPISODE_STEP_DTYPE = np.dtype([("position", np.int16, (2,)),
+                               ("direction", np.int8),
+                               ("status", np.int8),
+                               ("malfunction", np.int32),
+                               ("action", np.int8)])
+
+
+class EpisodeRecorder:
+    """
+    Streams the agent states of an episode into an episode log.
+
+    Set it as `RailEnv.episode_recorder` to record every step, as `record_steps` does in memory.
+    Steps are buffered and written every `flush_every` steps, and when the recorder is flushed or closed.
+
+    Parameters
+    ----------
+    filename : str
+        File of the episode log, overwritten if it exists.
+    n_agents : int, optional
+        Number of agents; taken from the first recorded step if not given.
+    flush_every : int
+        Number of steps buffered before they are written.
+    """
+
+    def __init__(self, filename: str, n_agents: Optional[int] = None, flush_every: int = 100):
+        self.filename = filename
+        self.flush_every = flush_every
+        self.n_agents = None
+        self.n_steps = 0
+        self._file = open(filename, "wb")
+        self._buffer = None
+        self._buffered = 0
+        if n_agents is not None:
+            self._start(n_agents)
+
+    def _start(self, n_agents: int):
+        self.n_agents = n_agents
+        self._file.write(_HEADER.pack(EPISODE_LOG_MAGIC, EPISODE_LOG_VERSION, n_agents))
+        self._buffer = np.empty((self.flush_every, n_agents), dtype=EPISODE_STEP_DTYPE)
+
+    def record(self, agents: List[EnvAgent], action_dict: Dict[int, int]):
+        """
+        Appends the state of the agents after a step and the actions of that step.
+        """
+        if self.n_agents is None:
+            self._start(len(agents))
+        assert len(agents) == self.n_agents, "Number of agents changed during the episode"
+
+        records = self._buffer[self._buffered]
+        records["position"] = [agent.position if agent.position is not None else (-1, -1) for agent in agents]
+        records["direction"] = [agent.direction for agent in agents]
+        records["status"] = [agent.status for agent in agents]
+        records["malfunction"] = [agent.malfunction_data["malfunction"] for agent in agents]
+        records["action"] = -1
+        for handle, action in action_dict.items():
+            if action is not None:
+                records["action"][handle] = action
+        self._buffered += 1
+        self.n_steps += 1
+        if self._buffered == self.flush_every:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the buffered steps to the file.
+        """
+        if self._buffered > 0:
+            self._file.write(self._buffer[:self._buffered].tobytes())
+            self._buffered = 0
+        self._file.flush()
+
+    def close(self):
+        if not self._file.closed:
+            if self.n_agents is None:
+                self._start(0)
+            self.flush()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class EpisodeReader:
+    """
+    Random access to the steps of an episode log, memory-mapped so that only the steps read are loaded.
+
+    The steps written after the reader was opened are mapped by `refresh`.
+
+    Parameters
+    ----------
+    filename : str
+        File written by `EpisodeRecorder`.
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        with open(filename, "rb") as file_in:
+            magic, version, self.n_agents = _HEADER.unpack(file_in.read(_HEADER.size))
+        if magic != EPISODE_LOG_MAGIC or version != EPISODE_LOG_VERSION:
+            raise ValueError("{} is not an episode log of version {}".format(filename, EPISODE_LOG_VERSION))
+        self.steps = None
+        self.refresh()
+
+    def refresh(self):
+        """
+        Maps all the complete steps currently in the file.
+        """
+        n_steps = 0
+        if self.n_agents > 0:
+            n_steps = (os.path.getsize(self.filename) - _HEADER.size) // (self.n_agents * EPISODE_STEP_DTYPE.itemsize)
+        if n_steps == 0:
+            self.steps = np.empty((0, self.n_agents), dtype=EPISODE_STEP_DTYPE)
+        else:
+            self.steps = np.memmap(self.filename, dtype=EPISODE_STEP_DTYPE, mode="r", offset=_HEADER.size,
+                                   shape=(n_steps, self.n_agents))
+
+    def __len__(self) -> int:
+        return len(self.steps)
+
+    def __getitem__(self, step: int) -> np.ndarray:
+        """
+        The `EPISODE_STEP_DTYPE` records of all agents at a step.
+        """
+        return self.steps[step]
+
+    def get_episode_step(self, step: int) -> List[List[int]]:
+        """
+        A step in the format of `RailEnv.cur_episode`: [row, column, direction, malfunction] of every agent,
+        with position (0, 0) for agents not on the grid.
+        """
+        records = self.steps[step]
+        positions = np.maximum(records["position"], 0)
+        return np.column_stack([positions, records["direction"], records["malfunction"]]).tolist()
+
+    def get_actions(self, step: int) -> Dict[int, int]:
+        """
+        The actions given in a step, as the action dict passed to `RailEnv.step`.
+        """
+        actions = self.steps[step]["action"]
+        return {handle: action for handle, action in enumerate(actions.tolist()) if action >= 0}
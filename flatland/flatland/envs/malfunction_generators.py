@@ -1,6 +1,6 @@
 """Malfunction generators for rail systems"""
 
-from typing import Callable, NamedTuple, Optional, Tuple
+from typing import Callable, List, NamedTuple, Optional, Tuple
 
 import numpy as np
 from numpy.random.mtrand import RandomState
@@ -28,13 +28,15 @@ def _malfunction_prob(rate: float) -> float:
         return 1 - np.exp(-rate)
 
 
-def malfunction_from_file(filename: str, load_from_package=None) -> Tuple[MalfunctionGenerator, MalfunctionProcessData]:
+def malfunction_from_file(filename: str, load_from_package=None,
+                          schedule=False) -> Tuple[MalfunctionGenerator, MalfunctionProcessData]:
     """
     Utility to load pickle file
 
     Parameters
     ----------
     input_file : Pickle file generated by env.save() or editor
+    schedule : if True, return a `MalfunctionScheduleGen` which samples all malfunctions at reset
 
     Returns
     -------
@@ -67,6 +69,11 @@ def malfunction_from_file(filename: str, load_from_package=None) -> Tuple[Malfun
         min_number_of_steps_broken = 0
         max_number_of_steps_broken = 0
 
+    if schedule:
+        process_data = MalfunctionProcessData(mean_malfunction_rate, min_number_of_steps_broken,
+                                              max_number_of_steps_broken)
+        return MalfunctionScheduleGen(process_data), process_data
+
     def generator(agent: EnvAgent = None, np_random: RandomState = None, reset=False) -> Optional[Malfunction]:
         """
         Generate malfunctions for agents
@@ -169,6 +176,81 @@ class ParamMalfunctionGen(object):
             self.max_number_of_steps_broken)
 
 
+class MalfunctionSchedule:
+    """
+    Malfunctions of all agents during an episode, sampled in advance.
+
+    `durations[t, handle]` is the number of broken steps the agent gets at time step t (0 at reset), or 0.
+    Malfunctions are drawn with the same process as `ParamMalfunctionGen`: an agent which is not broken breaks with
+    probability `1 - exp(-malfunction_rate)` at every time step at which the env induces malfunctions (reset and
+    steps after the second), for a uniform number of steps. The timeline is extended when the env runs past it.
+
+    Parameters
+    ----------
+    parameters : malfunction rate and duration bounds
+    n_agents : number of agents
+    n_steps : number of time steps sampled in advance, after the reset
+    np_random : random state to draw from
+    """
+
+    # the env induces malfunctions at reset and from this step on
+    FIRST_STEP = 3
+
+    def __init__(self, parameters: MalfunctionParameters, n_agents: int, n_steps: int, np_random: RandomState):
+        self.parameters = parameters
+        self.np_random = np_random
+        self.durations = np.zeros((0, n_agents), dtype=np.int32)
+        # first time step at which each agent is fixed again
+        self._fixed_at = np.zeros(n_agents, dtype=np.int64)
+        self.extend(n_steps + 1)
+
+    def extend(self, length: int):
+        """
+        Samples the malfunctions up to time step `length - 1`.
+        """
+        start, n_agents = self.durations.shape
+        if length <= start:
+            return
+        durations = np.zeros((length - start, n_agents), dtype=np.int32)
+        breaks = self.np_random.rand(length - start, n_agents) < _malfunction_prob(self.parameters.malfunction_rate)
+        broken_steps = self.np_random.randint(self.parameters.min_duration, self.parameters.max_duration + 1,
+                                              size=(length - start, n_agents)) + 1
+        for t in np.flatnonzero(breaks.any(axis=1)):
+            time_step = start + t
+            if 0 < time_step < self.FIRST_STEP:
+                continue
+            breaking = breaks[t] & (self._fixed_at <= time_step)
+            durations[t, breaking] = broken_steps[t, breaking]
+            self._fixed_at[breaking] = time_step + broken_steps[t, breaking]
+        self.durations = np.concatenate([self.durations, durations])
+
+    def get(self, time_step: int, handle: int) -> int:
+        """
+        Number of broken steps of the agent starting at the time step, 0 if it does not break.
+        """
+        if time_step >= len(self.durations):
+            self.extend(max(time_step + 1, 2 * len(self.durations)))
+        return self.durations[time_step, handle]
+
+    def get_malfunctions(self, handle: int) -> List[Tuple[int, int]]:
+        """
+        The (time step, number of broken steps) of the sampled malfunctions of an agent, e.g. for an oracle planner.
+        """
+        time_steps = np.flatnonzero(self.durations[:, handle])
+        return list(zip(time_steps.tolist(), self.durations[time_steps, handle].tolist()))
+
+
+class MalfunctionScheduleGen(ParamMalfunctionGen):
+    """
+    Same malfunction process as `ParamMalfunctionGen`, sampled for the whole episode at reset instead of with
+    one random draw per agent and step. The env then looks up the malfunctions in the `MalfunctionSchedule`,
+    which it exposes as `RailEnv.malfunction_schedule`.
+    """
+
+    def generate_schedule(self, n_agents: int, n_steps: Optional[int], np_random: RandomState) -> MalfunctionSchedule:
+        return MalfunctionSchedule(self.get_process_data(), n_agents, n_steps or 0, np_random)
+
+
 class NoMalfunctionGen(ParamMalfunctionGen):
     def __init__(self):
         self.mean_malfunction_rate = 0.
@@ -2,6 +2,7 @@
 Collection of environment-specific ObservationBuilder.
 """
 import collections
+import itertools
 from typing import Optional, List, Dict, Tuple
 
 import numpy as np
@@ -11,7 +12,7 @@ from flatland.core.env_observation_builder import ObservationBuilder
 from flatland.core.env_prediction_builder import PredictionBuilder
 from flatland.core.grid.grid4_utils import get_new_position
 from flatland.core.grid.grid_utils import coordinate_to_position
-from flatland.envs.agent_utils import RailAgentStatus, EnvAgent
+from flatland.envs.agent_utils import RailAgentStatus
 from flatland.utils.ordered_set import OrderedSet
 
 
@@ -30,6 +31,20 @@ Node = collections.namedtuple('Node', 'dist_own_target_encountered '
                                         'num_agents_ready_to_depart '
                                         'childs')
 
+# Static part of a branch of the tree observation: the cells walked from the first cell of the branch to the next
+# switch, dead-end or cycle. It only depends on the rail and the targets, so it is computed once per reset.
+BranchSegment = collections.namedtuple('BranchSegment', 'cells '
+                                                        'transitions '
+                                                        'states '
+                                                        'position_indices '
+                                                        'cell_set '
+                                                        'target_indices '
+                                                        'unusable_switch '
+                                                        'is_switch '
+                                                        'is_dead_end '
+                                                        'is_terminal')
+
+
 class TreeObsForRailEnv(ObservationBuilder):
     """
     TreeObsForRailEnv object.
@@ -39,12 +54,18 @@ class TreeObsForRailEnv(ObservationBuilder):
     network to simplify the representation of the state of the environment for each agent.
 
     For details about the features in the tree observation see the get() function.
+
+    With `segment_cache` enabled (the default), the walk along each branch is computed once per reset and cached
+    as a `BranchSegment`; at every step only the agents and predictions are overlaid onto the cached segments.
+    The observations are the same as with the cell by cell walk of `_explore_branch`.
     """
 
 
     tree_explored_actions_char = ['L', 'F', 'R', 'B']
+    # features of a node in the encoding of flatten_tree: the fields of Node except the children
+    num_node_features = len(Node._fields) - 1
 
-    def __init__(self, max_depth: int, predictor: PredictionBuilder = None):
+    def __init__(self, max_depth: int, predictor: PredictionBuilder = None, segment_cache: bool = True):
         super().__init__()
         self.max_depth = max_depth
         self.observation_dim = 11
@@ -52,9 +73,12 @@ class TreeObsForRailEnv(ObservationBuilder):
         self.location_has_agent_direction = {}
         self.predictor = predictor
         self.location_has_target = None
+        self.segment_cache = segment_cache
+        self._segments = {}
 
     def reset(self):
         self.location_has_target = {tuple(agent.target): 1 for agent in self.env.agents}
+        self._segments = {}
 
     def get_many(self, handles: Optional[List[int]] = None) -> Dict[int, Node]:
         """
@@ -64,6 +88,78 @@ class TreeObsForRailEnv(ObservationBuilder):
 
         if handles is None:
             handles = []
+        self._update_lookup_tables(handles)
+        observations = super().get_many(handles)
+
+        return observations
+
+    def get_batch(self, handles: Optional[List[int]] = None) -> np.ndarray:
+        """
+        The tree observations of the agents with handle in `handles`, all the agents by default, flattened by
+        `flatten_tree` into a buffer of shape (len(handles), num_nodes, num_node_features) reused by the next
+        calls, see `ObservationBuilder.get_batch`. The rows of agents without observation are filled with -inf.
+        """
+        if handles is None:
+            handles = list(range(self.env.get_num_agents()))
+        observations = self._get_batch_buffer("observations", (len(handles), self.num_nodes, self.num_node_features))
+        self._update_lookup_tables(handles)
+        for i, handle in enumerate(handles):
+            self.flatten_tree(self.get(handle), observations[i])
+        return observations
+
+    @property
+    def num_nodes(self) -> int:
+        """
+        Number of nodes of a complete tree observation: 1 + 4 + ... + 4 ** max_depth.
+        """
+        return (4 ** (self.max_depth + 1) - 1) // 3
+
+    def flatten_tree(self, node: Optional[Node], out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Encodes a tree observation as a fixed size array of shape (num_nodes, num_node_features).
+
+        The rows are the features of the nodes in the order of `get`: each node is followed by the subtrees of its
+        'L', 'F', 'R' and 'B' children, the columns are the fields of `Node` without `childs`. The missing nodes
+        of the tree, together with their subtrees, are filled with -inf, as is the whole array if `node` is None.
+
+        Parameters
+        ----------
+        node : Node, optional
+            A tree observation returned by `get`.
+        out : np.ndarray, optional
+            Array into which to write the encoding.
+
+        Returns
+        -------
+        np.ndarray
+            The encoding, `out` if given.
+        """
+        if out is None:
+            out = np.empty((self.num_nodes, self.num_node_features))
+        self._flatten_node(node, out, 0, 0)
+        return out
+
+    def _flatten_node(self, node, out: np.ndarray, index: int, depth: int) -> int:
+        """
+        Utility function writing the subtree of `node` at `depth` from row `index` of `out`; returns the row after
+        the subtree.
+        """
+        if not isinstance(node, Node):
+            subtree_size = (4 ** (self.max_depth - depth + 1) - 1) // 3
+            out[index:index + subtree_size] = -np.inf
+            return index + subtree_size
+        out[index] = node[:-1]
+        index += 1
+        if depth < self.max_depth:
+            for action_char in self.tree_explored_actions_char:
+                index = self._flatten_node(node.childs.get(action_char), out, index, depth + 1)
+        return index
+
+    def _update_lookup_tables(self, handles: List[int]):
+        """
+        Utility function updating the predictions and the lookup tables of the agents' positions, once per step
+        before the observations of the agents with handle in `handles` are computed.
+        """
         if self.predictor:
             self.max_prediction_depth = 0
             self.predicted_pos = {}
@@ -106,10 +202,6 @@ class TreeObsForRailEnv(ObservationBuilder):
                 self.location_has_agent_ready_to_depart[tuple(_agent.initial_position)] = \
                     self.location_has_agent_ready_to_depart.get(tuple(_agent.initial_position), 0) + 1
 
-        observations = super().get_many(handles)
-
-        return observations
-
     def get(self, handle: int = 0) -> Node:
         """
         Computes the current observation for agent `handle` in env
@@ -223,6 +315,7 @@ class TreeObsForRailEnv(ObservationBuilder):
         #print("root node type:", type(root_node_observation))
 
         visited = OrderedSet()
+        visited_chunks = []
 
         # Start from the current orientation, and see which transitions are available;
         # organize them as [left, forward, right, back], relative to the current orientation
@@ -237,14 +330,19 @@ class TreeObsForRailEnv(ObservationBuilder):
             if possible_transitions[branch_direction]:
                 new_cell = get_new_position(agent_virtual_position, branch_direction)
 
-                branch_observation, branch_visited = \
-                    self._explore_branch(handle, new_cell, branch_direction, 1, 1)
+                if self.segment_cache:
+                    branch_observation = self._explore_cached_branch(handle, new_cell, branch_direction, 1, 1,
+                                                                     visited_chunks)
+                else:
+                    branch_observation, branch_visited = \
+                        self._explore_branch(handle, new_cell, branch_direction, 1, 1)
+                    visited |= branch_visited
                 root_node_observation.childs[self.tree_explored_actions_char[i]] = branch_observation
-
-                visited |= branch_visited
             else:
                 # add cells filled with infinity if no transition is possible
                 root_node_observation.childs[self.tree_explored_actions_char[i]] = -np.inf
+        if self.segment_cache:
+            visited = OrderedSet.fromkeys(itertools.chain.from_iterable(visited_chunks))
         self.env.dev_obs_dict[handle] = visited
 
         return root_node_observation
@@ -323,44 +421,8 @@ class TreeObsForRailEnv(ObservationBuilder):
             # Register possible future conflict
             predicted_time = int(tot_dist * time_per_cell)
             if self.predictor and predicted_time < self.max_prediction_depth:
-                int_position = coordinate_to_position(self.env.width, [position])
-                if tot_dist < self.max_prediction_depth:
-
-                    pre_step = max(0, predicted_time - 1)
-                    post_step = min(self.max_prediction_depth - 1, predicted_time + 1)
-
-                    # Look for conflicting paths at distance tot_dist
-                    if int_position in np.delete(self.predicted_pos[predicted_time], handle, 0):
-                        conflicting_agent = np.where(self.predicted_pos[predicted_time] == int_position)
-                        for ca in conflicting_agent[0]:
-                            if direction != self.predicted_dir[predicted_time][ca] and cell_transitions[
-                                self._reverse_dir(
-                                    self.predicted_dir[predicted_time][ca])] == 1 and tot_dist < potential_conflict:
-                                potential_conflict = tot_dist
-                            if self.env.agents[ca].status == RailAgentStatus.DONE and tot_dist < potential_conflict:
-                                potential_conflict = tot_dist
-
-                    # Look for conflicting paths at distance num_step-1
-                    elif int_position in np.delete(self.predicted_pos[pre_step], handle, 0):
-                        conflicting_agent = np.where(self.predicted_pos[pre_step] == int_position)
-                        for ca in conflicting_agent[0]:
-                            if direction != self.predicted_dir[pre_step][ca] \
-                                and cell_transitions[self._reverse_dir(self.predicted_dir[pre_step][ca])] == 1 \
-                                and tot_dist < potential_conflict:  # noqa: E125
-                                potential_conflict = tot_dist
-                            if self.env.agents[ca].status == RailAgentStatus.DONE and tot_dist < potential_conflict:
-                                potential_conflict = tot_dist
-
-                    # Look for conflicting paths at distance num_step+1
-                    elif int_position in np.delete(self.predicted_pos[post_step], handle, 0):
-                        conflicting_agent = np.where(self.predicted_pos[post_step] == int_position)
-                        for ca in conflicting_agent[0]:
-                            if direction != self.predicted_dir[post_step][ca] and cell_transitions[self._reverse_dir(
-                                self.predicted_dir[post_step][ca])] == 1 \
-                                and tot_dist < potential_conflict:  # noqa: E125
-                                potential_conflict = tot_dist
-                            if self.env.agents[ca].status == RailAgentStatus.DONE and tot_dist < potential_conflict:
-                                potential_conflict = tot_dist
+                potential_conflict = self._potential_conflict(handle, position, direction, cell_transitions, tot_dist,
+                                                              predicted_time, potential_conflict)
 
             if position in self.location_has_target and position != agent.target:
                 if tot_dist < other_target_encountered:
@@ -489,6 +551,248 @@ class TreeObsForRailEnv(ObservationBuilder):
             node.childs.clear()
         return node, visited
 
+    def _potential_conflict(self, handle, position, direction, cell_transitions, tot_dist, predicted_time,
+                            potential_conflict):
+        """
+        Utility function returning the distance to the closest possible future conflict with another agent's
+        predicted path, given a cell at distance `tot_dist` reached at `predicted_time`.
+        """
+        int_position = coordinate_to_position(self.env.width, [position])
+        if tot_dist < self.max_prediction_depth:
+
+            pre_step = max(0, predicted_time - 1)
+            post_step = min(self.max_prediction_depth - 1, predicted_time + 1)
+
+            # Look for conflicting paths at distance tot_dist
+            if int_position in np.delete(self.predicted_pos[predicted_time], handle, 0):
+                conflicting_agent = np.where(self.predicted_pos[predicted_time] == int_position)
+                for ca in conflicting_agent[0]:
+                    if direction != self.predicted_dir[predicted_time][ca] and cell_transitions[
+                        self._reverse_dir(
+                            self.predicted_dir[predicted_time][ca])] == 1 and tot_dist < potential_conflict:
+                        potential_conflict = tot_dist
+                    if self.env.agents[ca].status == RailAgentStatus.DONE and tot_dist < potential_conflict:
+                        potential_conflict = tot_dist
+
+            # Look for conflicting paths at distance num_step-1
+            elif int_position in np.delete(self.predicted_pos[pre_step], handle, 0):
+                conflicting_agent = np.where(self.predicted_pos[pre_step] == int_position)
+                for ca in conflicting_agent[0]:
+                    if direction != self.predicted_dir[pre_step][ca] \
+                        and cell_transitions[self._reverse_dir(self.predicted_dir[pre_step][ca])] == 1 \
+                        and tot_dist < potential_conflict:  # noqa: E125
+                        potential_conflict = tot_dist
+                    if self.env.agents[ca].status == RailAgentStatus.DONE and tot_dist < potential_conflict:
+                        potential_conflict = tot_dist
+
+            # Look for conflicting paths at distance num_step+1
+            elif int_position in np.delete(self.predicted_pos[post_step], handle, 0):
+                conflicting_agent = np.where(self.predicted_pos[post_step] == int_position)
+                for ca in conflicting_agent[0]:
+                    if direction != self.predicted_dir[post_step][ca] and cell_transitions[self._reverse_dir(
+                        self.predicted_dir[post_step][ca])] == 1 \
+                        and tot_dist < potential_conflict:  # noqa: E125
+                        potential_conflict = tot_dist
+                    if self.env.agents[ca].status == RailAgentStatus.DONE and tot_dist < potential_conflict:
+                        potential_conflict = tot_dist
+        return potential_conflict
+
+    def _walk_segment(self, position, direction) -> BranchSegment:
+        """
+        Utility function walking from `position` along `direction` until the next switch, dead-end or cycle, in the
+        same way as `_explore_branch` does, but without looking at the agents. The walk does not stop at targets;
+        `_explore_cached_branch` cuts the segment at the observing agent's own target.
+        """
+        cells = []
+        transitions = []
+        states = []
+        seen = set()
+        unusable_switch = None
+        is_switch = False
+        is_dead_end = False
+        is_terminal = False
+        while True:
+            cell_transitions = self.env.rail.get_transitions(*position, direction)
+            transition_bit = bin(self.env.rail.get_full_transitions(*position))
+            total_transitions = transition_bit.count("1")
+            cells.append((position, direction))
+            transitions.append(cell_transitions)
+
+            state = (position[0], position[1], direction)
+            if state in seen:
+                is_terminal = True
+                break
+            seen.add(state)
+            states.append(state)
+
+            # Treat crossings as straight rail cells
+            if int(transition_bit, 2) == int('1000010000100001', 2):
+                total_transitions = 2
+            num_transitions = np.count_nonzero(cell_transitions)
+
+            # Detect Switches that can only be used by other agents.
+            if unusable_switch is None and total_transitions > 2 > num_transitions:
+                unusable_switch = len(cells) - 1
+
+            if num_transitions == 1:
+                if total_transitions == 1:
+                    is_dead_end = True
+                    break
+                direction = int(np.argmax(cell_transitions))
+                position = get_new_position(position, direction)
+            elif num_transitions > 0:
+                is_switch = True
+                break
+            else:
+                # Wrong cell type, but let's cover it and treat it as a dead-end, just in case
+                print("WRONG CELL TYPE detected in tree-search (0 transitions possible) at cell", position[0],
+                      position[1], direction)
+                is_terminal = True
+                break
+
+        position_indices = {}
+        for index, (cell, _) in enumerate(cells):
+            position_indices.setdefault(cell, []).append(index)
+        target_indices = [(index, cell) for index, (cell, _) in enumerate(cells) if cell in self.location_has_target]
+        return BranchSegment(cells=cells,
+                             transitions=transitions,
+                             states=states,
+                             position_indices=position_indices,
+                             cell_set=frozenset(position_indices),
+                             target_indices=target_indices,
+                             unusable_switch=unusable_switch,
+                             is_switch=is_switch,
+                             is_dead_end=is_dead_end,
+                             is_terminal=is_terminal)
+
+    def _explore_cached_branch(self, handle, position, direction, tot_dist, depth, visited_chunks):
+        """
+        Same as `_explore_branch`, but the walk along the branch is looked up in the segment cache and only the
+        agents and predictions are evaluated on it. The visited cells are appended to `visited_chunks` in the
+        order `_explore_branch` visits them.
+        """
+        if depth >= self.max_depth + 1:
+            return []
+
+        key = (position, direction)
+        segment = self._segments.get(key)
+        if segment is None:
+            segment = self._walk_segment(position, direction)
+            self._segments[key] = segment
+
+        agent = self.env.agents[handle]
+        target = tuple(agent.target)
+        num_cells = len(segment.cells)
+        is_switch = segment.is_switch
+        is_dead_end = segment.is_dead_end
+        is_terminal = segment.is_terminal
+        is_target = False
+        own_target_encountered = np.inf
+        num_checked = len(segment.states)
+
+        # The walk ends at the own target, if it is on the segment
+        own_target_indices = segment.position_indices.get(target)
+        if own_target_indices is not None:
+            num_cells = own_target_indices[0] + 1
+            num_checked = num_cells - 1
+            own_target_encountered = tot_dist + num_cells - 1
+            is_target = True
+            is_switch = is_dead_end = is_terminal = False
+
+        other_target_encountered = np.inf
+        for index, cell in segment.target_indices:
+            if index >= num_cells:
+                break
+            if cell != target:
+                other_target_encountered = tot_dist + index
+                break
+
+        unusable_switch = np.inf
+        if segment.unusable_switch is not None and segment.unusable_switch < num_checked:
+            unusable_switch = tot_dist + segment.unusable_switch
+
+        other_agent_encountered = np.inf
+        other_agent_same_direction = 0
+        other_agent_opposite_direction = 0
+        malfunctioning_agent = 0
+        min_fractional_speed = 1.
+        other_agent_ready_to_depart_encountered = 0
+        for cell in segment.cell_set.intersection(self.location_has_agent):
+            for index in segment.position_indices[cell]:
+                if index >= num_cells:
+                    break
+                if tot_dist + index < other_agent_encountered:
+                    other_agent_encountered = tot_dist + index
+                if self.location_has_agent_malfunction[cell] > malfunctioning_agent:
+                    malfunctioning_agent = self.location_has_agent_malfunction[cell]
+                other_agent_ready_to_depart_encountered += self.location_has_agent_ready_to_depart.get(cell, 0)
+                if self.location_has_agent_direction[cell] == segment.cells[index][1]:
+                    other_agent_same_direction += 1
+                    if self.location_has_agent_speed[cell] < min_fractional_speed:
+                        min_fractional_speed = self.location_has_agent_speed[cell]
+                else:
+                    other_agent_opposite_direction += self.location_has_agent[cell]
+
+        potential_conflict = np.inf
+        if self.predictor:
+            time_per_cell = np.reciprocal(agent.speed_data["speed"])
+            for index in range(num_cells):
+                predicted_time = int((tot_dist + index) * time_per_cell)
+                if predicted_time >= self.max_prediction_depth:
+                    break
+                cell, cell_direction = segment.cells[index]
+                potential_conflict = self._potential_conflict(handle, cell, cell_direction,
+                                                              segment.transitions[index], tot_dist + index,
+                                                              predicted_time, potential_conflict)
+
+        visited_chunks.append(segment.states[:num_cells] if is_target else segment.states)
+        position, direction = segment.cells[num_cells - 1]
+        tot_dist += num_cells - 1
+
+        if is_target:
+            dist_to_next_branch = tot_dist
+            dist_min_to_target = 0
+        elif is_terminal:
+            dist_to_next_branch = np.inf
+            dist_min_to_target = self.env.distance_map.get()[handle, position[0], position[1], direction]
+        else:
+            dist_to_next_branch = tot_dist
+            dist_min_to_target = self.env.distance_map.get()[handle, position[0], position[1], direction]
+
+        node = Node(dist_own_target_encountered=own_target_encountered,
+                    dist_other_target_encountered=other_target_encountered,
+                    dist_other_agent_encountered=other_agent_encountered,
+                    dist_potential_conflict=potential_conflict,
+                    dist_unusable_switch=unusable_switch,
+                    dist_to_next_branch=dist_to_next_branch,
+                    dist_min_to_target=dist_min_to_target,
+                    num_agents_same_direction=other_agent_same_direction,
+                    num_agents_opposite_direction=other_agent_opposite_direction,
+                    num_agents_malfunctioning=malfunctioning_agent,
+                    speed_min_fractional=min_fractional_speed,
+                    num_agents_ready_to_depart=other_agent_ready_to_depart_encountered,
+                    childs={})
+
+        if depth == self.max_depth:
+            return node
+
+        possible_transitions = segment.transitions[num_cells - 1]
+        for i, branch_direction in enumerate([(direction + 4 + i) % 4 for i in range(-1, 3)]):
+            if is_dead_end and self.env.rail.get_transition((*position, direction), (branch_direction + 2) % 4):
+                # Swap forward and back in case of dead-end, so that an agent can learn that going forward takes
+                # it back
+                new_cell = get_new_position(position, (branch_direction + 2) % 4)
+                node.childs[self.tree_explored_actions_char[i]] = self._explore_cached_branch(
+                    handle, new_cell, (branch_direction + 2) % 4, tot_dist + 1, depth + 1, visited_chunks)
+            elif is_switch and possible_transitions[branch_direction]:
+                new_cell = get_new_position(position, branch_direction)
+                node.childs[self.tree_explored_actions_char[i]] = self._explore_cached_branch(
+                    handle, new_cell, branch_direction, tot_dist + 1, depth + 1, visited_chunks)
+            else:
+                # no exploring possible, add just cells with infinity
+                node.childs[self.tree_explored_actions_char[i]] = -np.inf
+        return node
+
     def util_print_obs_subtree(self, tree: Node):
         """
         Utility function to print tree observations returned by this object.
@@ -528,13 +832,75 @@ class TreeObsForRailEnv(ObservationBuilder):
         return int((direction + 2) % 4)
 
 
+class LayerOverlay(np.lib.mixins.NDArrayOperatorsMixin):
+    """
+    Read-only array-like of the observation layers of one agent: layers shared by all the agents with a few cells
+    overridden for this agent. Single cells are read without copying the shared layers; anything else, as well as
+    numpy functions and operators, works on the dense array, which is built once on first use.
+    """
+
+    def __init__(self, shared: np.ndarray, cells: Dict[Tuple[int, int, int], float]):
+        self.shared = shared
+        self.cells = cells
+        self._dense = None
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return self.shared.shape
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self.shared.dtype
+
+    @property
+    def ndim(self) -> int:
+        return self.shared.ndim
+
+    def __len__(self):
+        return len(self.shared)
+
+    def __array__(self, dtype=None, copy=None):
+        if self._dense is None:
+            dense = self.shared.copy()
+            for index, value in self.cells.items():
+                dense[index] = value
+            dense.flags.writeable = False
+            self._dense = dense
+        return self._dense if dtype is None else self._dense.astype(dtype)
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        if any(isinstance(output, LayerOverlay) for output in kwargs.get("out", ())):
+            return NotImplemented
+        inputs = tuple(np.asarray(x) if isinstance(x, LayerOverlay) else x for x in inputs)
+        return getattr(ufunc, method)(*inputs, **kwargs)
+
+    def __getitem__(self, key):
+        if self._dense is None and isinstance(key, tuple) and 2 <= len(key) <= 3 \
+                and all(isinstance(k, (int, np.integer)) for k in key):
+            # out of bounds indices raise the IndexError of numpy, negative ones are looked up as positive ones
+            self.shared[key]
+            index = tuple(int(k) % size for k, size in zip(key, self.shape))
+            if len(index) == 3:
+                return self.shared.dtype.type(self.cells[index]) if index in self.cells else self.shared[index]
+            cell = self.shared[index].copy()
+            for (row, column, channel), value in self.cells.items():
+                if (row, column) == index:
+                    cell[channel] = value
+            return cell
+        return np.asarray(self)[key]
+
+    def __repr__(self):
+        return "LayerOverlay({!r})".format(np.asarray(self))
+
+
 class GlobalObsForRailEnv(ObservationBuilder):
     """
     Gives a global observation of the entire rail environment.
     The observation is composed of the following elements:
 
         - transition map array with dimensions (env.height, env.width, 16),\
-          assuming 16 bits encoding of transitions.
+          assuming 16 bits encoding of transitions. It is the read-only uint8 array of\
+          `GridTransitionMap.get_transition_bits`, shared by all agents and observation builders.
 
         - obs_agents_state: A 3D array (map_height, map_width, 5) with
             - first channel containing the agents position and direction
@@ -545,24 +911,135 @@ class GlobalObsForRailEnv(ObservationBuilder):
 
         - obs_targets: Two 2D arrays (map_height, map_width, 2) containing respectively the position of the given agent\
          target and the positions of the other agents targets (flag only, no counter!).
+
+    `get_many_overlays` gives `obs_agents_state` and `obs_targets` as read-only `LayerOverlay` of the layers shared
+    by all agents instead, without copying them per agent, and `get_batch` gives dense arrays of all the agents.
     """
 
     def __init__(self):
         super(GlobalObsForRailEnv, self).__init__()
+        # transition map and buffer it was last copied into by get_batch
+        self._batch_rail_obs = None
+        self._batch_observations = None
 
     def set_env(self, env: Environment):
         super().set_env(env)
 
     def reset(self):
-        self.rail_obs = np.zeros((self.env.height, self.env.width, 16))
-        for i in range(self.rail_obs.shape[0]):
-            for j in range(self.rail_obs.shape[1]):
-                bitlist = [int(digit) for digit in bin(self.env.rail.get_full_transitions(i, j))[2:]]
-                bitlist = [0] * (16 - len(bitlist)) + bitlist
-                self.rail_obs[i, j] = np.array(bitlist)
+        # read-only transition bits shared by all the observation builders of the rail
+        self.rail_obs = self.env.rail.get_transition_bits()
 
     def get(self, handle: int = 0) -> (np.ndarray, np.ndarray, np.ndarray):
+        return self.get_many([handle])[handle]
+
+    def get_many(self, handles: Optional[List[int]] = None):
+        """
+        Called whenever an observation has to be computed for the `env` environment, for each agent with handle
+        in the `handles` list.
+
+        The layers shared by all agents are built once with scatter operations, then copied for each agent with
+        the cells describing the observing agent itself overridden. `rail_obs` is the same array for every agent.
 
+        Parameters
+        ----------
+        handles : list of handles, optional
+            List with the handles of the agents for which to compute the observation vector.
+
+        Returns
+        -------
+        function
+            A dictionary of observations with handles from `handles` as keys.
+        """
+        if handles is None:
+            handles = []
+        shared_agents_state, shared_targets, position_directions = self._get_shared_layers()
+        observations = {}
+        for handle in handles:
+            self_cells = self._get_self_cells(handle, position_directions)
+            if self_cells is None:
+                observations[handle] = None
+                continue
+            layers = (shared_agents_state.copy(), shared_targets.copy())
+            for agent_layers, cells in zip(layers, self_cells):
+                for index, value in cells.items():
+                    agent_layers[index] = value
+            observations[handle] = (self.rail_obs,) + layers
+        return observations
+
+    def get_many_overlays(self, handles: Optional[List[int]] = None):
+        """
+        Same as `get_many`, but `obs_agents_state` and `obs_targets` are read-only `LayerOverlay` of the layers
+        shared by all agents, only holding the cells describing the observing agent itself, so that the layers are
+        not copied per agent.
+
+        Parameters
+        ----------
+        handles : list of handles, optional
+            List with the handles of the agents for which to compute the observation vector.
+
+        Returns
+        -------
+        function
+            A dictionary of observations with handles from `handles` as keys.
+        """
+        if handles is None:
+            handles = []
+        shared_agents_state, shared_targets, position_directions = self._get_shared_layers()
+        shared_agents_state.flags.writeable = False
+        shared_targets.flags.writeable = False
+        observations = {}
+        for handle in handles:
+            self_cells = self._get_self_cells(handle, position_directions)
+            if self_cells is None:
+                observations[handle] = None
+                continue
+            agents_state_cells, targets_cells = self_cells
+            observations[handle] = (self.rail_obs, LayerOverlay(shared_agents_state, agents_state_cells),
+                                    LayerOverlay(shared_targets, targets_cells))
+        return observations
+
+    def get_batch(self, handles: Optional[List[int]] = None) -> np.ndarray:
+        """
+        Observations of the agents with handle in `handles`, all the agents by default, as a single array of shape
+        (len(handles), env.height, env.width, 23) which concatenates the transition map, `obs_agents_state` and
+        `obs_targets` along the last axis, see `ObservationBuilder.get_batch`. The rows of agents which are not in
+        the environment any more only contain the layers shared by all agents.
+
+        The array is a buffer reused by the next calls, and the transition map is only copied into it when the
+        buffer or the rail changes.
+        """
+        if handles is None:
+            handles = list(range(self.env.get_num_agents()))
+        observations = self._get_batch_buffer("observations", (len(handles), self.env.height, self.env.width, 23))
+        if self._batch_rail_obs is not self.rail_obs or self._batch_observations is not observations:
+            observations[..., :16] = self.rail_obs
+            self._batch_rail_obs = self.rail_obs
+            self._batch_observations = observations
+        self._set_agent_layers(handles, observations[..., 16:21], observations[..., 21:])
+        return observations
+
+    def _set_agent_layers(self, handles: List[int], obs_agents_state: np.ndarray, obs_targets: np.ndarray):
+        """
+        Utility function writing the dense `obs_agents_state` and `obs_targets` of the agents with handle in
+        `handles` into the rows of the given arrays.
+        """
+        shared_agents_state, shared_targets, position_directions = self._get_shared_layers()
+        obs_agents_state[:] = shared_agents_state
+        obs_targets[:] = shared_targets
+        for i, handle in enumerate(handles):
+            self_cells = self._get_self_cells(handle, position_directions)
+            if self_cells is None:
+                continue
+            for layers, cells in zip((obs_agents_state[i], obs_targets[i]), self_cells):
+                for index, value in cells.items():
+                    layers[index] = value
+
+    def _get_self_cells(self, handle: int, position_directions: Dict) -> Optional[Tuple[Dict, Dict]]:
+        """
+        Utility function returning the cells of `obs_agents_state` and `obs_targets` which differ from the shared
+        layers for the agent with handle `handle`, as dicts from (row, column, channel) to values, or None if the
+        agent is not in the environment any more.
+        """
         agent = self.env.agents[handle]
         if agent.status == RailAgentStatus.READY_TO_DEPART:
             agent_virtual_position = agent.initial_position
@@ -573,38 +1050,59 @@ class GlobalObsForRailEnv(ObservationBuilder):
         else:
             return None
 
-        obs_targets = np.zeros((self.env.height, self.env.width, 2))
-        obs_agents_state = np.zeros((self.env.height, self.env.width, 5)) - 1
-
-        # TODO can we do this more elegantly?
-        # for r in range(self.env.height):
-        #     for c in range(self.env.width):
-        #         obs_agents_state[(r, c)][4] = 0
-        obs_agents_state[:, :, 4] = 0
+        agents_state_cells = {(*agent_virtual_position, 0): agent.direction}
+        targets_cells = {(*agent.target, 0): 1}
 
-        obs_agents_state[agent_virtual_position][0] = agent.direction
-        obs_targets[agent.target][0] = 1
+        # second channel only for other agents: restore what the other agents on this cell wrote
+        if agent.position is not None:
+            other_directions = [direction for other, direction in position_directions.get(tuple(agent.position), [])
+                                if other != handle]
+            agents_state_cells[(*agent.position, 1)] = other_directions[-1] if other_directions else -1
+        return agents_state_cells, targets_cells
 
-        for i in range(len(self.env.agents)):
-            other_agent: EnvAgent = self.env.agents[i]
+    def _get_shared_layers(self):
+        """
+        Utility function building the layers of `obs_agents_state` and `obs_targets` which are the same for every
+        agent, i.e. all agents' directions in the second channel. Also returns the agents found on each cell, in
+        handle order, as a dict from positions to lists of (handle, direction).
+        """
+        obs_agents_state = np.full((self.env.height, self.env.width, 5), -1.)
+        obs_agents_state[:, :, 4] = 0
+        obs_targets = np.zeros((self.env.height, self.env.width, 2))
 
+        targets = []
+        positions = []
+        directions = []
+        malfunctions = []
+        speeds = []
+        ready_to_depart = []
+        position_directions = collections.defaultdict(list)
+        for handle, agent in enumerate(self.env.agents):
             # ignore other agents not in the grid any more
-            if other_agent.status == RailAgentStatus.DONE_REMOVED:
+            if agent.status == RailAgentStatus.DONE_REMOVED:
                 continue
-
-            obs_targets[other_agent.target][1] = 1
-
-            # second to fourth channel only if in the grid
-            if other_agent.position is not None:
-                # second channel only for other agents
-                if i != handle:
-                    obs_agents_state[other_agent.position][1] = other_agent.direction
-                obs_agents_state[other_agent.position][2] = other_agent.malfunction_data['malfunction']
-                obs_agents_state[other_agent.position][3] = other_agent.speed_data['speed']
-            # fifth channel: all ready to depart on this position
-            if other_agent.status == RailAgentStatus.READY_TO_DEPART:
-                obs_agents_state[other_agent.initial_position][4] += 1
-        return self.rail_obs, obs_agents_state, obs_targets
+            targets.append(agent.target)
+            if agent.position is not None:
+                positions.append(agent.position)
+                directions.append(agent.direction)
+                malfunctions.append(agent.malfunction_data['malfunction'])
+                speeds.append(agent.speed_data['speed'])
+                position_directions[tuple(agent.position)].append((handle, agent.direction))
+            if agent.status == RailAgentStatus.READY_TO_DEPART:
+                ready_to_depart.append(agent.initial_position)
+
+        if targets:
+            rows, cols = np.array(targets, dtype=int).reshape(-1, 2).T
+            obs_targets[rows, cols, 1] = 1
+        if positions:
+            rows, cols = np.array(positions, dtype=int).reshape(-1, 2).T
+            obs_agents_state[rows, cols, 1] = directions
+            obs_agents_state[rows, cols, 2] = malfunctions
+            obs_agents_state[rows, cols, 3] = speeds
+        if ready_to_depart:
+            rows, cols = np.array(ready_to_depart, dtype=int).reshape(-1, 2).T
+            np.add.at(obs_agents_state[:, :, 4], (rows, cols), 1)
+        return obs_agents_state, obs_targets, position_directions
 
 
 class LocalObsForRailEnv(ObservationBuilder):
@@ -644,53 +1142,81 @@ class LocalObsForRailEnv(ObservationBuilder):
         # We build the transition map with a view_radius empty cells expansion on each side.
         # This helps to collect the local transition map view when the agent is close to a border.
         self.max_padding = max(self.view_width, self.view_height)
-        self.rail_obs = np.zeros((self.env.height,
-                                  self.env.width, 16))
-        for i in range(self.env.height):
-            for j in range(self.env.width):
-                bitlist = [int(digit) for digit in bin(self.env.rail.get_full_transitions(i, j))[2:]]
-                bitlist = [0] * (16 - len(bitlist)) + bitlist
-                self.rail_obs[i, j] = np.array(bitlist)
+        self.rail_obs = self.env.rail.get_transition_bits()
 
     def get(self, handle: int = 0) -> (np.ndarray, np.ndarray, np.ndarray, np.ndarray):
-        agents = self.env.agents
-        agent = agents[handle]
+        local_rail_obs = np.zeros((self.view_height, 2 * self.view_width + 1, 16))
+        obs_map_state = np.zeros((self.view_height, 2 * self.view_width + 1, 2))
+        obs_other_agents_state = np.zeros((self.view_height, 2 * self.view_width + 1, 4))
+        direction = np.zeros(4)
+        self._set_local_obs(handle, *self._get_agent_lookups(),
+                            local_rail_obs, obs_map_state, obs_other_agents_state, direction)
+        return local_rail_obs, obs_map_state, obs_other_agents_state, direction
 
-        # Correct agents position for padding
-        # agent_rel_pos[0] = agent.position[0] + self.max_padding
-        # agent_rel_pos[1] = agent.position[1] + self.max_padding
+    def get_batch(self, handles: Optional[List[int]] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        The observations of `get` of the agents with handle in `handles`, all the agents by default, written into
+        four buffers with one row per agent reused by the next calls, see `ObservationBuilder.get_batch`. The rows
+        of agents which are not on the grid are zeros.
+        """
+        if handles is None:
+            handles = list(range(self.env.get_num_agents()))
+        view_shape = (len(handles), self.view_height, 2 * self.view_width + 1)
+        local_rail_obs = self._get_batch_buffer("local_rail_obs", view_shape + (16,))
+        obs_map_state = self._get_batch_buffer("obs_map_state", view_shape + (2,))
+        obs_other_agents_state = self._get_batch_buffer("obs_other_agents_state", view_shape + (4,))
+        direction = self._get_batch_buffer("direction", (len(handles), 4))
+        for buffer in [local_rail_obs, obs_map_state, obs_other_agents_state, direction]:
+            buffer.fill(0)
+
+        targets, agent_directions = self._get_agent_lookups()
+        for i, handle in enumerate(handles):
+            if self.env.agents[handle].position is None:
+                continue
+            self._set_local_obs(handle, targets, agent_directions,
+                                local_rail_obs[i], obs_map_state[i], obs_other_agents_state[i], direction[i])
+        return local_rail_obs, obs_map_state, obs_other_agents_state, direction
+
+    def _get_agent_lookups(self):
+        """
+        Utility function returning the set of the agents' targets and the direction of the agents by position, the
+        agent with the highest handle on a cell being kept.
+        """
+        targets = {tuple(agent.target) for agent in self.env.agents if agent.target is not None}
+        agent_directions = {tuple(agent.position): agent.direction for agent in self.env.agents
+                            if agent.position is not None}
+        return targets, agent_directions
+
+    def _set_local_obs(self, handle, targets, agent_directions,
+                       local_rail_obs, obs_map_state, obs_other_agents_state, direction):
+        """
+        Utility function writing the observation of agent `handle` into the given arrays, which hold zeros.
+        """
+        agent = self.env.agents[handle]
 
         # Collect visible cells as set to be plotted
         visited, rel_coords = self.field_of_view(agent.position, agent.direction, )
-        local_rail_obs = None
 
         # Add the visible cells to the observed cells
         self.env.dev_obs_dict[handle] = set(visited)
 
+        if visited:
+            rows, columns = np.array(visited).T
+            rel_rows, rel_columns = np.array(rel_coords).T
+            local_rail_obs[rel_rows, rel_columns] = self.rail_obs[rows, columns]
+
         # Locate observed agents and their coresponding targets
-        local_rail_obs = np.zeros((self.view_height, 2 * self.view_width + 1, 16))
-        obs_map_state = np.zeros((self.view_height, 2 * self.view_width + 1, 2))
-        obs_other_agents_state = np.zeros((self.view_height, 2 * self.view_width + 1, 4))
-        _idx = 0
-        for pos in visited:
-            curr_rel_coord = rel_coords[_idx]
-            local_rail_obs[curr_rel_coord[0], curr_rel_coord[1], :] = self.rail_obs[pos[0], pos[1], :]
-            if pos == agent.target:
-                obs_map_state[curr_rel_coord[0], curr_rel_coord[1], 0] = 1
-            else:
-                for tmp_agent in agents:
-                    if pos == tmp_agent.target:
-                        obs_map_state[curr_rel_coord[0], curr_rel_coord[1], 1] = 1
-            if pos != agent.position:
-                for tmp_agent in agents:
-                    if pos == tmp_agent.position:
-                        obs_other_agents_state[curr_rel_coord[0], curr_rel_coord[1], :] = np.identity(4)[
-                            tmp_agent.direction]
-
-            _idx += 1
-
-        direction = np.identity(4)[agent.direction]
-        return local_rail_obs, obs_map_state, obs_other_agents_state, direction
+        agent_position = tuple(agent.position)
+        agent_target = tuple(agent.target)
+        for pos, (rel_row, rel_column) in zip(visited, rel_coords):
+            if pos == agent_target:
+                obs_map_state[rel_row, rel_column, 0] = 1
+            elif pos in targets:
+                obs_map_state[rel_row, rel_column, 1] = 1
+            if pos != agent_position and pos in agent_directions:
+                obs_other_agents_state[rel_row, rel_column, agent_directions[pos]] = 1
+
+        direction[agent.direction] = 1
 
     def get_many(self, handles: Optional[List[int]] = None) -> Dict[
         int, Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]]:
@@ -1,6 +1,11 @@
 
 
+import io
+import os
 import pickle
+import zipfile
+from collections import OrderedDict
+
 import msgpack
 import numpy as np
 
@@ -23,6 +28,65 @@ from flatland.envs import rail_generators as rail_gen
 from flatland.envs import schedule_generators as sched_gen
 
 
+# Agents in the binary (.npz) scenario format, one record per agent.
+# Unset positions and directions are stored as -1.
+AGENT_DTYPE = np.dtype([("initial_position", np.int32, (2,)),
+                        ("initial_direction", np.int8),
+                        ("direction", np.int8),
+                        ("target", np.int32, (2,)),
+                        ("moving", np.bool_),
+                        ("speed", np.float64),
+                        ("position_fraction", np.float64),
+                        ("transition_action_on_cellexit", np.int8),
+                        ("malfunction", np.int32),
+                        ("malfunction_rate", np.float64),
+                        ("next_malfunction", np.int32),
+                        ("nr_malfunctions", np.int32),
+                        ("moving_before_malfunction", np.bool_),
+                        ("handle", np.int32),
+                        ("status", np.int8),
+                        ("position", np.int32, (2,)),
+                        ("old_direction", np.int8),
+                        ("old_position", np.int32, (2,))])
+
+# Number of loaded scenario files kept in memory by `RailEnvPersister.load_env_dict`, so that the rail, schedule
+# and malfunction generators reading the same file share one load.
+SCENARIO_CACHE_SIZE = 8
+_scenario_cache = OrderedDict()
+
+
+def _optional(value, unset=-1):
+    return None if value == unset else value
+
+
+def _mmap_npz(filename):
+    """
+    Memory-maps the arrays of an uncompressed .npz file; compressed members are read into memory.
+    """
+    arrays = {}
+    with zipfile.ZipFile(filename) as archive, open(filename, "rb") as file_in:
+        for info in archive.infolist():
+            name = info.filename[:-len(".npy")] if info.filename.endswith(".npy") else info.filename
+            if info.compress_type != zipfile.ZIP_STORED:
+                arrays[name] = np.lib.format.read_array(archive.open(info))
+                continue
+            # skip the local file header: 30 bytes plus the file name and extra field
+            file_in.seek(info.header_offset + 26)
+            name_length, extra_length = np.frombuffer(file_in.read(4), dtype="<u2")
+            file_in.seek(info.header_offset + 30 + int(name_length) + int(extra_length))
+            version = np.lib.format.read_magic(file_in)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(file_in)
+            elif version == (2, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(file_in)
+            if version not in [(1, 0), (2, 0)] or dtype.hasobject or 0 in shape:
+                arrays[name] = np.lib.format.read_array(archive.open(info))
+            else:
+                arrays[name] = np.memmap(file_in, dtype=dtype, mode="r", shape=shape,
+                                         order="F" if fortran_order else "C", offset=file_in.tell())
+    return arrays
+
+
 class RailEnvPersister(object):
 
     @classmethod
@@ -56,6 +120,11 @@ class RailEnvPersister(object):
             else:
                 print("[WARNING] Unable to save the distance map for this environment, as none was found !")
 
+        if filename.endswith("npz"):
+            cls.save_npz(env_dict, filename)
+            return
+
+        _scenario_cache.pop(os.path.abspath(filename), None)
         with open(filename, "wb") as file_out:
 
             if filename.endswith("mpk"):
@@ -76,7 +145,69 @@ class RailEnvPersister(object):
             # print(f"msgpack check - {dIn.keys()}")
             # print(f"msgpack check - {dIn['agents'][0]}")
 
-                
+    @classmethod
+    def save_npz(cls, env_dict, filename):
+        """
+        Saves an env dict as returned by `get_full_state` or `load_env_dict` in the binary scenario format:
+        an uncompressed .npz file with the grid as uint16 array, the agents as `AGENT_DTYPE` records,
+        the malfunction parameters and the distance map as int32 array, -1 where the target is unreachable.
+
+        Parameters:
+        ---------
+        env_dict: dict
+        filename: string
+        """
+        agents = env_dict.get("agents", [])
+        agent_records = np.zeros(len(agents), dtype=AGENT_DTYPE)
+        for record, agent in zip(agent_records, agents):
+            record["initial_position"] = agent.initial_position
+            record["initial_direction"] = agent.initial_direction
+            record["direction"] = agent.direction if agent.direction is not None else -1
+            record["target"] = agent.target
+            record["moving"] = agent.moving
+            record["speed"] = agent.speed_data["speed"]
+            record["position_fraction"] = agent.speed_data["position_fraction"]
+            record["transition_action_on_cellexit"] = agent.speed_data["transition_action_on_cellexit"]
+            for key in ["malfunction", "malfunction_rate", "next_malfunction", "nr_malfunctions",
+                        "moving_before_malfunction"]:
+                record[key] = agent.malfunction_data.get(key, 0)
+            record["handle"] = agent.handle
+            record["status"] = agent.status
+            record["position"] = agent.position if agent.position is not None else (-1, -1)
+            record["old_direction"] = agent.old_direction if agent.old_direction is not None else -1
+            record["old_position"] = agent.old_position if agent.old_position is not None else (-1, -1)
+
+        arrays = {"grid": np.asarray(env_dict["grid"], dtype=np.uint16),
+                  "agents": agent_records}
+        if env_dict.get("malfunction") is not None:
+            arrays["malfunction"] = np.array(env_dict["malfunction"], dtype=np.float64)
+        if env_dict.get("max_episode_steps") is not None:
+            arrays["max_episode_steps"] = np.array(env_dict["max_episode_steps"], dtype=np.int64)
+        distance_map = env_dict.get("distance_map")
+        if distance_map is not None and len(distance_map) > 0:
+            arrays["distance_map"] = np.where(np.isinf(distance_map), -1, distance_map).astype(np.int32)
+
+        _scenario_cache.pop(os.path.abspath(filename), None)
+        with open(filename, "wb") as file_out:
+            np.savez(file_out, **arrays)
+
+    @classmethod
+    def convert(cls, filename_in, filename_out):
+        """
+        Converts a scenario file between the pkl, mpk and npz formats, e.g. to save test cases in the binary format.
+        """
+        env_dict = cls.load_env_dict(filename_in)
+        if filename_out.endswith("npz"):
+            cls.save_npz(env_dict, filename_out)
+            return
+        env_dict["agents"] = [agent.to_agent() for agent in env_dict["agents"]]
+        if isinstance(env_dict.get("grid"), np.ndarray):
+            env_dict["grid"] = env_dict["grid"].tolist()
+        with open(filename_out, "wb") as file_out:
+            if filename_out.endswith("mpk"):
+                file_out.write(msgpack.packb(env_dict))
+            elif filename_out.endswith("pkl"):
+                pickle.dump(env_dict, file_out)
 
     @classmethod
     def save_episode(cls, env, filename):
@@ -111,8 +242,7 @@ class RailEnvPersister(object):
 
         env_dict = cls.load_env_dict(filename, load_from_package=load_from_package)
 
-
-        # TODO: inefficient - each one of these generators loads the complete env file.
+        # these generators share the load above through the scenario cache of load_env_dict
         env = rail_env.RailEnv(width=1, height=1,
                 rail_generator=rail_gen.rail_from_file(filename, 
                     load_from_package=load_from_package),
@@ -130,6 +260,56 @@ class RailEnvPersister(object):
 
     @classmethod
     def load_env_dict(cls, filename, load_from_package=None):
+        """
+        Loads the env dict of a pkl, mpk or npz file. Loaded files are cached for the process, so only the first
+        of the rail, schedule and malfunction generators reading a file parses it. Each call returns new agents;
+        the grid and distance map arrays are shared and read-only.
+
+        Parameters:
+        -------
+        filename: string
+        load_from_package: string, optional
+            Package to read the file from as a resource.
+        """
+        if load_from_package is not None:
+            key = (load_from_package, filename)
+            version = None
+        else:
+            key = os.path.abspath(filename)
+            stat = os.stat(filename)
+            version = (stat.st_mtime_ns, stat.st_size)
+
+        cached = _scenario_cache.get(key)
+        if cached is not None and cached[0] == version:
+            _scenario_cache.move_to_end(key)
+            scenario = cached[1]
+        else:
+            scenario = cls._load_scenario(filename, load_from_package)
+            _scenario_cache[key] = (version, scenario)
+            while len(_scenario_cache) > SCENARIO_CACHE_SIZE:
+                _scenario_cache.popitem(last=False)
+
+        env_dict = dict(scenario)
+        if "agents" in env_dict:
+            env_dict["agents"] = [EnvAgent(*d[0:5], speed_data=dict(d[5]), malfunction_data=dict(d[6]), handle=d[7],
+                                           status=d[8], position=d[9], old_direction=d[10], old_position=d[11])
+                                  for d in env_dict["agents"]]
+        return env_dict
+
+    @classmethod
+    def _load_scenario(cls, filename, load_from_package=None):
+        """
+        Reads a file into the dict cached by `load_env_dict`, with the agents as `Agent` tuples and the grid as
+        read-only uint16 array.
+        """
+        if filename.endswith("npz"):
+            if load_from_package is not None:
+                from importlib_resources import read_binary
+                with np.load(io.BytesIO(read_binary(load_from_package, filename))) as npz:
+                    arrays = dict(npz)
+            else:
+                arrays = _mmap_npz(filename)
+            return cls._scenario_from_arrays(arrays)
 
         if load_from_package is not None:
             from importlib_resources import read_binary
@@ -143,17 +323,64 @@ class RailEnvPersister(object):
         elif filename.endswith("pkl"):
             env_dict = pickle.loads(load_data)
         else:
-            print(f"filename {filename} must end with either pkl or mpk")
+            print(f"filename {filename} must end with either pkl, mpk or npz")
             env_dict = {}
-        
-        # Replace the agents tuple with EnvAgent objects
+
+        # Replace the legacy static agents with Agent tuples
         if "agents_static" in env_dict:
-            env_dict["agents"] = EnvAgent.load_legacy_static_agent(env_dict["agents_static"])
+            env_dict["agents"] = [agent.to_agent() for agent in
+                                  EnvAgent.load_legacy_static_agent(env_dict["agents_static"])]
             # remove the legacy key
             del env_dict["agents_static"]
         elif "agents" in env_dict:
-            env_dict["agents"] = [EnvAgent(*d[0:12]) for d in env_dict["agents"]]
+            env_dict["agents"] = [Agent(*d[0:12]) for d in env_dict["agents"]]
 
+        for key, dtype in [("grid", np.uint16), ("distance_map", None)]:
+            if key in env_dict:
+                env_dict[key] = np.array(env_dict[key], dtype=dtype)
+                env_dict[key].flags.writeable = False
+        return env_dict
+
+    @classmethod
+    def _scenario_from_arrays(cls, arrays):
+        env_dict = {"grid": arrays["grid"]}
+        env_dict["grid"].flags.writeable = False
+
+        records = arrays["agents"]
+        columns = {name: records[name].tolist() for name in AGENT_DTYPE.names}
+        for name in ["initial_position", "target", "position", "old_position"]:
+            columns[name] = [_optional(tuple(position), (-1, -1)) for position in columns[name]]
+        for name in ["direction", "old_direction"]:
+            columns[name] = [_optional(direction) for direction in columns[name]]
+        agents = []
+        for i in range(len(records)):
+            agents.append(Agent(
+                initial_position=columns["initial_position"][i],
+                initial_direction=columns["initial_direction"][i],
+                direction=columns["direction"][i],
+                target=columns["target"][i],
+                moving=columns["moving"][i],
+                speed_data={key: columns[key][i] for key in ["position_fraction", "speed",
+                                                             "transition_action_on_cellexit"]},
+                malfunction_data={key: columns[key][i] for key in ["malfunction", "malfunction_rate",
+                                                                   "next_malfunction", "nr_malfunctions",
+                                                                   "moving_before_malfunction"]},
+                handle=columns["handle"][i],
+                status=RailAgentStatus(columns["status"][i]),
+                position=columns["position"][i],
+                old_direction=columns["old_direction"][i],
+                old_position=columns["old_position"][i]))
+        env_dict["agents"] = agents
+
+        if "malfunction" in arrays:
+            rate, min_duration, max_duration = arrays["malfunction"].tolist()
+            env_dict["malfunction"] = mal_gen.MalfunctionProcessData(rate, int(min_duration), int(max_duration))
+        if "max_episode_steps" in arrays:
+            env_dict["max_episode_steps"] = int(arrays["max_episode_steps"])
+        if "distance_map" in arrays:
+            distance_map = arrays["distance_map"]
+            env_dict["distance_map"] = np.where(distance_map < 0, np.inf, distance_map)
+            env_dict["distance_map"].flags.writeable = False
         return env_dict
 
     @classmethod
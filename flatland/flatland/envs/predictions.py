@@ -178,3 +178,127 @@ class ShortestPathPredictorForRailEnv(PredictionBuilder):
             prediction_dict[agent.handle] = prediction
 
         return prediction_dict
+
+
+class CachedShortestPathPredictorForRailEnv(PredictionBuilder):
+    """
+    CachedShortestPathPredictorForRailEnv object.
+
+    Gives the same predictions as `ShortestPathPredictorForRailEnv`, but keeps each agent's shortest path until the
+    agent leaves it. An agent which moved one cell along its path just advances in the cached path, so the
+    shortest path is only recomputed for the agents which deviated from it, and the prediction of an agent which
+    did not move is left as it is. All the predictions are kept in a single (n_agents, max_depth + 1, 5) array.
+
+    Does not populate `env.dev_pred_dict`, which is used to render the predictions.
+    """
+
+    def __init__(self, max_depth: int = 20):
+        super().__init__(max_depth)
+        self.predictions = None
+        self._paths = []
+        self._path_index = []
+        self._agent_states = []
+        self._distance_map = None
+
+    def reset(self):
+        self._distance_map = None
+
+    def get(self, handle: int = None):
+        """
+        Called whenever get_many in the observation build is called.
+        Requires distance_map to extract the shortest path.
+        Does not take into account future positions of other agents!
+
+        If there is no shortest path, the agent just stands still and stops moving.
+
+        Parameters
+        ----------
+        handle : int, optional
+            Handle of the agent for which to compute the observation vector.
+
+        Returns
+        -------
+        np.array
+            Returns a dictionary indexed by the agent handle and for each agent a vector of (max_depth + 1)x5 elements,
+            as `ShortestPathPredictorForRailEnv`. The vectors are views into `self.predictions` and are overwritten
+            by the next call.
+        """
+        self._update()
+        if handle:
+            return {handle: self.predictions[handle]}
+        return {agent.handle: self.predictions[agent.handle] for agent in self.env.agents}
+
+    def _update(self):
+        """
+        Utility function bringing the prediction array up to date with the agents' current positions.
+        """
+        distance_map = self.env.distance_map.get()
+        n_agents = len(self.env.agents)
+        if distance_map is not self._distance_map or self.predictions is None or len(self.predictions) != n_agents:
+            self._distance_map = distance_map
+            self.predictions = np.zeros((n_agents, self.max_depth + 1, 5))
+            self._paths = [None] * n_agents
+            self._path_index = [0] * n_agents
+            self._agent_states = [None] * n_agents
+
+        for agent in self.env.agents:
+            handle = agent.handle
+            if agent.status == RailAgentStatus.READY_TO_DEPART:
+                agent_virtual_position = agent.initial_position
+            elif agent.status == RailAgentStatus.ACTIVE:
+                agent_virtual_position = agent.position
+            elif agent.status == RailAgentStatus.DONE:
+                agent_virtual_position = agent.target
+            else:
+                if self._agent_states[handle] is not None or self._paths[handle] is None:
+                    self.predictions[handle] = 0
+                    self.predictions[handle, :self.max_depth, 0] = np.arange(self.max_depth)
+                    self.predictions[handle, :self.max_depth, 1:] = np.nan
+                    self._agent_states[handle] = None
+                    self._paths[handle] = ()
+                continue
+
+            times_per_cell = int(np.reciprocal(agent.speed_data["speed"]))
+            agent_state = (tuple(agent_virtual_position), agent.direction, times_per_cell)
+            if agent_state == self._agent_states[handle]:
+                continue
+
+            path = self._paths[handle]
+            path_index = self._path_index[handle]
+            if path and agent_state[:2] == path[path_index]:
+                # only the speed changed
+                pass
+            elif path and path_index + 1 < len(path) and agent_state[:2] == path[path_index + 1]:
+                path_index += 1
+            else:
+                path = self._shortest_path(agent, agent_state[0], agent_state[1])
+                path_index = 0
+            self._paths[handle] = path
+            self._path_index[handle] = path_index
+            self._agent_states[handle] = agent_state
+            self._predict(handle, path[path_index:path_index + self.max_depth], times_per_cell)
+
+    def _shortest_path(self, agent, position, direction):
+        """
+        Utility function returning the full shortest path of the agent as a tuple of (position, direction),
+        starting with the agent's current cell.
+        """
+        shortest_path = get_shortest_paths(self.env.distance_map, agent_handle=agent.handle)[agent.handle]
+        if not shortest_path:
+            return ((position, direction),)
+        return tuple((tuple(waypoint.position), waypoint.direction) for waypoint in shortest_path)
+
+    def _predict(self, handle, path, times_per_cell):
+        """
+        Utility function writing the prediction of an agent following `path`, which starts at its current cell, into
+        the prediction array.
+        """
+        path_array = np.array([(*position, direction) for position, direction in path], dtype=float)
+        cells_ahead = len(path) - 1
+        index = np.arange(self.max_depth + 1)
+        steps = np.minimum(index // times_per_cell, cells_ahead)
+        prediction = self.predictions[handle]
+        prediction[:, 0] = index
+        prediction[:, 1:4] = path_array[steps]
+        # stop moving once the target is reached or the path is exhausted
+        prediction[:, 4] = np.where((index - 1) // times_per_cell >= cells_ahead, RailEnvActions.STOP_MOVING, 0)
@@ -164,7 +164,8 @@ class RailEnv(Environment):
                  remove_agents_at_target=True,
                  random_seed=1,
                  record_steps=False,
-                 close_following=True
+                 close_following=True,
+                 compute_observations=True
                  ):
         """
         Environment init.
@@ -200,6 +201,10 @@ class RailEnv(Environment):
         random_seed : int or None
             if None, then its ignored, else the random generators are seeded with this number to ensure
             that stochastic operations are replicable across multiple operations
+        compute_observations : bool
+            If False, reset and step skip the observation builder and return an empty dict of observations, e.g. for
+            planners which do not use them; the observations can still be computed on demand with the builder's
+            `get_many` or `get_batch`.
         """
         super().__init__()
 
@@ -237,6 +242,8 @@ class RailEnv(Environment):
         self.obs_builder.set_env(self)
 
         self._max_episode_steps: Optional[int] = None
+        # malfunctions sampled at reset by malfunction generators which support it, see mal_gen.MalfunctionSchedule
+        self.malfunction_schedule: Optional[mal_gen.MalfunctionSchedule] = None
         self._elapsed_steps = 0
 
         self.dones = dict.fromkeys(list(range(number_of_agents)) + ["__all__"], False)
@@ -269,8 +276,11 @@ class RailEnv(Environment):
         # save timesteps in here: [[[row, col, dir, malfunction],...nAgents], ...nSteps]
         self.cur_episode = []
         self.list_actions = []  # save actions in here
+        # streams the timesteps into an episode log instead, see flatland.envs.episode_log.EpisodeRecorder
+        self.episode_recorder = None
 
         self.close_following = close_following  # use close following logic
+        self.compute_observations = compute_observations
         self.motionCheck = ac.MotionCheck()
 
     def _seed(self, seed=None):
@@ -391,6 +401,14 @@ class RailEnv(Environment):
 
         # Reset agents to initial
         self.reset_agents()
+        self._elapsed_steps = 0
+
+        # Sample all the malfunctions of the episode at once if the malfunction generator supports it
+        if "generate_schedule" in dir(self.malfunction_generator):
+            self.malfunction_schedule = self.malfunction_generator.generate_schedule(
+                self.get_num_agents(), self._max_episode_steps, self.np_random)
+        else:
+            self.malfunction_schedule = None
 
         for agent in self.agents:
             # Induce malfunctions
@@ -406,7 +424,6 @@ class RailEnv(Environment):
             self._fix_agent_after_malfunction(agent)
 
         self.num_resets += 1
-        self._elapsed_steps = 0
 
         # TODO perhaps dones should be part of each agent.
         self.dones = dict.fromkeys(list(range(self.get_num_agents())) + ["__all__"], False)
@@ -470,7 +487,10 @@ class RailEnv(Environment):
 
         """
 
-        if "generate" in dir(self.malfunction_generator):
+        if self.malfunction_schedule is not None:
+            malfunction = mal_gen.Malfunction(
+                self.malfunction_schedule.get(self._elapsed_steps, agent.handle) if self._is_agent_ok(agent) else 0)
+        elif "generate" in dir(self.malfunction_generator):
             malfunction: mal_gen.Malfunction = self.malfunction_generator.generate(agent, self.np_random)
         else:
             malfunction: mal_gen.Malfunction = self.malfunction_generator(agent, self.np_random)
@@ -589,9 +609,63 @@ class RailEnv(Environment):
                 self.dones[i_agent] = True
         if self.record_steps:
             self.record_timestep(action_dict_)
+        if self.episode_recorder is not None:
+            self.episode_recorder.record(self.agents, action_dict_)
 
         return self._get_observations(), self.rewards_dict, self.dones, info_dict
 
+    def step_until_decision(self, action_dict_: Dict[int, RailEnvActions], max_steps: Optional[int] = None):
+        """
+        Performs a step with `action_dict_`, then steps without actions as long as no decision is needed, see
+        `_decision_required`: no agent requires an action, no malfunction starts or ends, no agent changes status
+        and the episode is not over. The actions of these steps would be ignored anyway, so the result is the same as
+        calling `step` with any actions at each of these steps.
+
+        Parameters
+        ----------
+        action_dict_ : Dict[int,RailEnvActions]
+            Actions of the first step.
+        max_steps : int, optional
+            Maximal number of steps to perform.
+
+        Returns
+        -------
+        observations, rewards, dones, info
+            As returned by `step` after the last step, except that the rewards are summed over the steps performed,
+            whose number is in `info["steps"]`. The observations are only computed after the last step.
+        """
+        rewards = dict.fromkeys(range(self.get_num_agents()), 0)
+        compute_observations = self.compute_observations
+        self.compute_observations = False
+        try:
+            steps = 0
+            while True:
+                event_state = self._get_event_state()
+                _, step_rewards, dones, info = self.step(action_dict_ if steps == 0 else {})
+                steps += 1
+                for i_agent, reward in step_rewards.items():
+                    rewards[i_agent] += reward
+                if dones["__all__"] or steps == max_steps or self._decision_required(event_state):
+                    break
+        finally:
+            self.compute_observations = compute_observations
+        info["steps"] = steps
+        return self._get_observations(), rewards, dones, info
+
+    def _get_event_state(self):
+        """
+        The status of every agent and whether it is malfunctioning, compared by `_decision_required`.
+        """
+        return [(agent.status, agent.malfunction_data['malfunction'] > 0) for agent in self.agents]
+
+    def _decision_required(self, event_state_before) -> bool:
+        """
+        Whether the controller needs to decide after the last step: an agent requires an action, or an agent started
+        or ended a malfunction or changed status since `event_state_before`, from `_get_event_state`.
+        """
+        return any(self.action_required(agent) for agent in self.agents) or \
+            self._get_event_state() != event_state_before
+
     def _step_agent(self, i_agent, action: Optional[RailEnvActions] = None):
         """
         Performs a step and step, start and stop penalty on a single agent in the following sub steps:
@@ -1073,6 +1147,9 @@ class RailEnv(Environment):
         Dict object
         """
         # print(f"_get_obs - num agents: {self.get_num_agents()} {list(range(self.get_num_agents()))}")
+        if not self.compute_observations:
+            self.obs_dict = {}
+            return self.obs_dict
         self.obs_dict = self.obs_builder.get_many(list(range(self.get_num_agents())))
         return self.obs_dict
 
@@ -10,6 +10,7 @@ from flatland.core.transition_map import GridTransitionMap
 from flatland.envs.agent_utils import RailAgentStatus
 from flatland.envs.distance_map import DistanceMap
 from flatland.envs.rail_env import RailEnvNextAction, RailEnvActions, RailEnv
+from flatland.envs.rail_graph import RailGraph, build_rail_graph
 from flatland.envs.rail_trainrun_data_structures import Waypoint
 from flatland.utils.ordered_set import OrderedSet
 
@@ -374,6 +375,59 @@ def get_k_shortest_paths(env: RailEnv,
     return shortest_paths
 
 
+def get_k_shortest_paths_yen(env: RailEnv,
+                             source_position: Tuple[int, int],
+                             source_direction: int,
+                             target_position: Tuple[int, int],
+                             k: int = 1,
+                             rail_graph: Optional[RailGraph] = None,
+                             agent_handle: Optional[int] = None) -> List[np.ndarray]:
+    """
+    Computes the k shortest loopless paths using Yen's algorithm on the compressed rail graph,
+    see `RailGraph.k_shortest_paths`. The distance map towards the target is used as A* heuristic.
+    As in `get_k_shortest_paths`, a path ends as soon as it reaches the target cell and no waypoint is visited twice.
+
+    Parameters
+    ----------
+    env :             RailEnv
+    source_position:  Tuple[int,int]
+    source_direction: int
+    target_position:  Tuple[int,int]
+    k :               int
+        max number of shortest paths
+    rail_graph:       RailGraph, optional
+        compressed graph of `env.rail`, built if not given. Pass it when computing paths for several agents.
+    agent_handle:     int, optional
+        agent whose distance map is used as heuristic, it must have `target_position` as target.
+        By default the first agent with this target is used, or the Manhattan distance if there is none.
+
+    Returns
+    -------
+    List[np.ndarray]
+        The paths in order of length, each one an int array of shape (path length, 3) with the row, column and
+        direction of each waypoint, starting with the source and ending on the target cell.
+    """
+    target_position = tuple(target_position)
+    if rail_graph is None:
+        rail_graph = build_rail_graph(env)
+
+    if agent_handle is None:
+        for agent in env.agents:
+            if tuple(agent.target) == target_position:
+                agent_handle = agent.handle
+                break
+    heuristic = None
+    if agent_handle is not None:
+        distances = env.distance_map.get()[agent_handle]
+
+        def _distance_heuristic(position, direction):
+            return distances[position[0], position[1], direction]
+
+        heuristic = _distance_heuristic
+
+    return rail_graph.k_shortest_paths(source_position, source_direction, target_position, k, heuristic=heuristic)
+
+
 def visualize_distance_map(distance_map: DistanceMap, agent_handle: int = 0):
     if agent_handle >= distance_map.get().shape[0]:
         print("Error: agent_handle cannot be larger than actual number of agents")
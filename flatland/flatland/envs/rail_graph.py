@@ -0,0 +1,630 @@
+"""
+Compressed rail graph: collapses a `GridTransitionMap` into a directed graph of decision points.
+
+Every `Waypoint` (row, column, direction) of the grid is a state of the rail. Most states lie on plain track
+(straight or curved rails) and have exactly one predecessor and one successor, so a planner walking the grid
+cell by cell spends most of its time on states where nothing can be decided. The `RailGraph` keeps only the
+states where something happens as nodes:
+
+- switches (more than one possible transition),
+- merges (more than one state leading into the state),
+- dead-ends,
+- key cells such as targets and stations given at construction time,
+
+and replaces the chains of plain-track states in between by edges carrying their length and the list of
+waypoints traversed. Every state of the grid can be mapped back to its node or to its position on an edge.
+
+The searches (`dijkstra`, `a_star`, `k_shortest_paths` and `sipp`) can start from and end in any state or cell, not only
+in nodes.
+"""
+import bisect
+import heapq
+from typing import Dict, List, NamedTuple, Optional, Tuple, Iterable, Container
+
+import numpy as np
+
+from flatland.core.grid.grid4_utils import get_new_position
+from flatland.core.transition_map import GridTransitionMap
+from flatland.envs.rail_trainrun_data_structures import Waypoint
+
+# A directed segment of rail between two nodes of the graph.
+# - `source` and `target` are node indices
+# - `length` is the number of cells entered when going from source to target
+# - `cells` are the waypoints entered, the last one being the target node
+RailGraphEdge = NamedTuple('RailGraphEdge', [('source', int),
+                                             ('target', int),
+                                             ('length', int),
+                                             ('cells', Tuple[Waypoint, ...])])
+
+# Location of a state on the graph: either a node (edge is None, offset is 0) or
+# the `offset`-th cell entered along `edge`.
+RailGraphLocation = NamedTuple('RailGraphLocation', [('node', Optional[int]),
+                                                     ('edge', Optional[int]),
+                                                     ('offset', int)])
+
+# A segment of rail leaving a state: used internally to treat states on edges like nodes.
+_Segment = NamedTuple('_Segment', [('target', int), ('cells', Tuple[Waypoint, ...])])
+
+
+class RailGraph:
+    """
+    Directed graph of decision points built from a `GridTransitionMap`.
+
+    Nodes are waypoints (position and direction), stored in `nodes` and indexed by `node_index`.
+    Edges are `RailGraphEdge` stored in `edges`, the outgoing edges of node `i` are `out_edges[i]`.
+    """
+
+    def __init__(self, rail: GridTransitionMap, key_cells: Optional[Iterable[Tuple[int, int]]] = None):
+        """
+        Build the compressed graph.
+
+        Parameters
+        ----------
+        rail : GridTransitionMap
+            The rail to compress.
+        key_cells : Iterable[Tuple[int, int]], optional
+            Cells that must be kept as nodes in every direction, e.g. agent targets and stations.
+        """
+        self.rail = rail
+        self.key_cells = set(tuple(cell) for cell in key_cells) if key_cells is not None else set()
+
+        self.nodes: List[Waypoint] = []
+        self.node_index: Dict[Tuple[int, int, int], int] = {}
+        self.edges: List[RailGraphEdge] = []
+        self.out_edges: List[List[int]] = []
+        self.in_edges: List[List[int]] = []
+        # (row, column, direction) -> (edge, offset) for states strictly inside an edge
+        self.edge_states: Dict[Tuple[int, int, int], Tuple[int, int]] = {}
+        # (row, column) -> nodes and (edge, offset) pairs touching that cell
+        self.cell_nodes: Dict[Tuple[int, int], List[int]] = {}
+        self.cell_edges: Dict[Tuple[int, int], List[Tuple[int, int]]] = {}
+        # number of graph states expanded by the last search
+        self.last_expanded = 0
+
+        self._build()
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.nodes)
+
+    @property
+    def num_edges(self) -> int:
+        return len(self.edges)
+
+    @property
+    def num_states(self) -> int:
+        """Number of waypoints of the uncompressed grid graph."""
+        return len(self.node_index) + len(self.edge_states)
+
+    def _successors(self, state: Tuple[int, int, int]) -> List[Tuple[int, int, int]]:
+        transitions = self.rail.get_transitions(*state)
+        successors = []
+        for direction in range(4):
+            if transitions[direction]:
+                position = get_new_position((state[0], state[1]), direction)
+                successors.append((position[0], position[1], direction))
+        return successors
+
+    def _build(self):
+        grid = self.rail.grid
+        height, width = grid.shape
+
+        successors: Dict[Tuple[int, int, int], List[Tuple[int, int, int]]] = {}
+        in_degree: Dict[Tuple[int, int, int], int] = {}
+        for row in range(height):
+            for column in range(width):
+                if grid[row, column] == 0:
+                    continue
+                for direction in range(4):
+                    state = (row, column, direction)
+                    next_states = self._successors(state)
+                    if not next_states:
+                        continue
+                    successors[state] = next_states
+                    for next_state in next_states:
+                        in_degree[next_state] = in_degree.get(next_state, 0) + 1
+
+        # states entered but without any exit (broken rails) are sinks
+        for state in in_degree:
+            if state not in successors:
+                successors[state] = []
+        for state in successors:
+            in_degree.setdefault(state, 0)
+
+        for state, next_states in successors.items():
+            cell = (state[0], state[1])
+            if len(next_states) != 1 or in_degree[state] != 1 or cell in self.key_cells or \
+                    self.rail.is_dead_end(cell):
+                self._add_node(state)
+
+        pending = list(range(len(self.nodes)))
+        while True:
+            for node in pending:
+                self._walk_edges_from(node, successors)
+
+            # states not reached from any node form isolated loops: promote one state per loop to a node
+            pending = []
+            for state in successors:
+                if state not in self.node_index and state not in self.edge_states:
+                    pending.append(self._add_node(state))
+                    break
+            if not pending:
+                break
+
+    def _add_node(self, state: Tuple[int, int, int]) -> int:
+        node = len(self.nodes)
+        self.nodes.append(Waypoint((state[0], state[1]), state[2]))
+        self.node_index[state] = node
+        self.out_edges.append([])
+        self.in_edges.append([])
+        self.cell_nodes.setdefault((state[0], state[1]), []).append(node)
+        return node
+
+    def _walk_edges_from(self, node: int, successors: Dict[Tuple[int, int, int], List[Tuple[int, int, int]]]):
+        source = self.nodes[node]
+        for state in successors[(*source.position, source.direction)]:
+            cells = [Waypoint((state[0], state[1]), state[2])]
+            while state not in self.node_index:
+                state = successors[state][0]
+                cells.append(Waypoint((state[0], state[1]), state[2]))
+            edge = len(self.edges)
+            self.edges.append(RailGraphEdge(source=node, target=self.node_index[state], length=len(cells),
+                                            cells=tuple(cells)))
+            self.out_edges[node].append(edge)
+            self.in_edges[self.node_index[state]].append(edge)
+            for offset, waypoint in enumerate(cells[:-1], start=1):
+                self.edge_states[(*waypoint.position, waypoint.direction)] = (edge, offset)
+                self.cell_edges.setdefault(waypoint.position, []).append((edge, offset))
+
+    def locate(self, position: Tuple[int, int], direction: int) -> Optional[RailGraphLocation]:
+        """
+        Map a grid state back to the graph.
+
+        Returns
+        -------
+        RailGraphLocation or None
+            The node at this state, or the edge and offset of the state along the edge.
+            None if the state is not on the rail.
+        """
+        state = (position[0], position[1], direction)
+        if state in self.node_index:
+            return RailGraphLocation(node=self.node_index[state], edge=None, offset=0)
+        if state in self.edge_states:
+            edge, offset = self.edge_states[state]
+            return RailGraphLocation(node=None, edge=edge, offset=offset)
+        return None
+
+    def expand(self, nodes: List[int], start: Optional[Waypoint] = None) -> List[Waypoint]:
+        """
+        Expand a sequence of consecutive nodes into the list of waypoints traversed on the grid.
+        If several parallel edges connect two nodes, the shortest one is used.
+        """
+        path = [start] if start is not None else [self.nodes[nodes[0]]]
+        for source, target in zip(nodes[:-1], nodes[1:]):
+            edge = min((e for e in self.out_edges[source] if self.edges[e].target == target),
+                       key=lambda e: self.edges[e].length)
+            path.extend(self.edges[edge].cells)
+        return path
+
+    def _segments_from(self, waypoint: Waypoint) -> List[_Segment]:
+        """
+        Outgoing segments of a state: the edges of a node, or the remainder of the edge for a state on an edge.
+        """
+        location = self.locate(*waypoint)
+        if location is None:
+            return []
+        if location.node is not None:
+            return [_Segment(self.edges[e].target, self.edges[e].cells) for e in self.out_edges[location.node]]
+        edge = self.edges[location.edge]
+        return [_Segment(edge.target, edge.cells[location.offset:])]
+
+    def _goal_offsets(self, segment: _Segment, target: Tuple[int, int]) -> Optional[int]:
+        """Number of cells entered along `segment` until `target` is reached, None if it is not on the segment."""
+        for offset, waypoint in enumerate(segment.cells, start=1):
+            if waypoint.position == target:
+                return offset
+        return None
+
+    def dijkstra(self, source_position: Tuple[int, int], source_direction: int,
+                 target_position: Tuple[int, int]) -> Optional[List[Waypoint]]:
+        """
+        Shortest path on the compressed graph.
+
+        Returns
+        -------
+        Optional[List[Waypoint]]
+            The waypoints from the source to the first waypoint on the target cell (both included),
+            None if the target cannot be reached.
+        """
+        return self.a_star(source_position, source_direction, target_position, heuristic=lambda position: 0)
+
+    def a_star(self, source_position: Tuple[int, int], source_direction: int, target_position: Tuple[int, int],
+               heuristic=None) -> Optional[List[Waypoint]]:
+        """
+        A* on the compressed graph. The default heuristic is the Manhattan distance to the target,
+        which is admissible since every step enters a neighbouring cell.
+
+        Parameters
+        ----------
+        source_position : Tuple[int, int]
+        source_direction : int
+        target_position : Tuple[int, int]
+        heuristic : Callable[[Tuple[int, int]], float], optional
+            Lower bound on the number of steps from a cell to the target.
+
+        Returns
+        -------
+        Optional[List[Waypoint]]
+            The waypoints from the source to the first waypoint on the target cell (both included),
+            None if the target cannot be reached.
+        """
+        source_position = tuple(source_position)
+        target_position = tuple(target_position)
+        if heuristic is None:
+            def heuristic(position):
+                return abs(position[0] - target_position[0]) + abs(position[1] - target_position[1])
+
+        source = Waypoint(source_position, source_direction)
+        if source_position == target_position:
+            return [source]
+
+        self.last_expanded = 0
+        # entries are (f, g, tie, state, goal): state is -1 for the source, goal entries close the search
+        tie = 0
+        open_list = [(heuristic(source_position), 0, tie, -1, False)]
+        parents: Dict[int, Tuple[int, Tuple[Waypoint, ...]]] = {}
+        goal_parent = None
+        best_g: Dict[int, int] = {-1: 0}
+        closed = set()
+        while open_list:
+            _, g, _, state, is_goal = heapq.heappop(open_list)
+            if is_goal:
+                return self._reconstruct(source, parents, goal_parent[state])
+            if state in closed:
+                continue
+            closed.add(state)
+            self.last_expanded += 1
+
+            waypoint = source if state == -1 else self.nodes[state]
+            for segment in self._segments_from(waypoint):
+                goal_offset = self._goal_offsets(segment, target_position)
+                tie += 1
+                if goal_offset is not None:
+                    if goal_parent is None:
+                        goal_parent = {}
+                    goal_parent[tie] = (state, segment.cells[:goal_offset])
+                    heapq.heappush(open_list, (g + goal_offset, g + goal_offset, tie, tie, True))
+                    continue
+                new_g = g + len(segment.cells)
+                if segment.target in closed or new_g >= best_g.get(segment.target, float('inf')):
+                    continue
+                best_g[segment.target] = new_g
+                parents[segment.target] = (state, segment.cells)
+                heapq.heappush(open_list,
+                               (new_g + heuristic(self.nodes[segment.target].position), new_g, tie, segment.target,
+                                False))
+        return None
+
+    @staticmethod
+    def _reconstruct(source: Waypoint, parents: Dict[int, Tuple[int, Tuple[Waypoint, ...]]],
+                     goal: Tuple[int, Tuple[Waypoint, ...]]) -> List[Waypoint]:
+        segments = [goal[1]]
+        state = goal[0]
+        while state != -1:
+            state, cells = parents[state]
+            segments.append(cells)
+        path = [source]
+        for cells in reversed(segments):
+            path.extend(cells)
+        return path
+
+    def k_shortest_paths(self, source_position: Tuple[int, int], source_direction: int,
+                         target_position: Tuple[int, int], k: int = 1, heuristic=None) -> List[np.ndarray]:
+        """
+        K shortest loopless paths with Yen's algorithm on the compressed graph.
+
+        The spur paths are found by A* and the candidate paths are kept in a heap. Only the states with several
+        outgoing segments can be spur states, and a path is only deviated from at or after the state where it
+        deviated itself from its parent path (Lawler's improvement). No waypoint is visited twice and every path
+        ends on the first waypoint on the target cell.
+
+        Parameters
+        ----------
+        source_position : Tuple[int, int]
+        source_direction : int
+        target_position : Tuple[int, int]
+        k : int
+            Maximum number of paths.
+        heuristic : Callable[[Tuple[int, int], int], float], optional
+            Lower bound on the number of steps from a position and direction to the target, np.inf if the target
+            cannot be reached. Defaults to the Manhattan distance.
+
+        Returns
+        -------
+        List[np.ndarray]
+            The paths in order of length, each one an int array of shape (path length, 3) with the row, column
+            and direction of each waypoint.
+        """
+        source_position = tuple(source_position)
+        target_position = tuple(target_position)
+        if heuristic is None:
+            def heuristic(position, direction):
+                return abs(position[0] - target_position[0]) + abs(position[1] - target_position[1])
+
+        source = Waypoint(source_position, source_direction)
+        if k < 1:
+            return []
+        if source_position == target_position:
+            return [np.array([(*source_position, source_direction)], dtype=int)]
+        location = self.locate(*source)
+        if location is None:
+            return []
+
+        # segments leaving a state as (target node, cells, goal offset), -1 being the source;
+        # the node or the edge holding the source must not be entered again
+        segment_lists: Dict[int, List[Optional[Tuple[int, Tuple[Waypoint, ...], Optional[int]]]]] = {}
+
+        def segments(state):
+            if state not in segment_lists:
+                if state == -1:
+                    state_segments = self._segments_from(source)
+                else:
+                    state_segments = [None if edge == location.edge else
+                                      _Segment(self.edges[edge].target, self.edges[edge].cells)
+                                      for edge in self.out_edges[state]]
+                segment_lists[state] = [None if segment is None else
+                                        (segment.target, segment.cells, self._goal_offsets(segment, target_position))
+                                        for segment in state_segments]
+            return segment_lists[state]
+
+        def spur_path(spur, forbidden, forbidden_first, max_length=float('inf')):
+            # A* from `spur` to the target avoiding the nodes in `forbidden` and, from `spur`, the segment indices
+            # in `forbidden_first`, not longer than `max_length`; returns the path as a list of (state, segment index)
+            # hops
+            tie = 0
+            open_list = [(0, 0, tie, spur, None)]
+            best_g = {spur: 0}
+            parents = {}
+            closed = set()
+            while open_list:
+                _, g, _, state, goal = heapq.heappop(open_list)
+                if goal is not None:
+                    hops = [goal]
+                    while hops[-1][0] != spur:
+                        hops.append(parents[hops[-1][0]])
+                    return hops[::-1]
+                if state in closed:
+                    continue
+                closed.add(state)
+                self.last_expanded += 1
+                for index, segment in enumerate(segments(state)):
+                    if segment is None or (state == spur and index in forbidden_first):
+                        continue
+                    target, cells, goal_offset = segment
+                    tie += 1
+                    if goal_offset is not None:
+                        if g + goal_offset <= max_length:
+                            heapq.heappush(open_list, (g + goal_offset, g + goal_offset, tie, None, (state, index)))
+                        continue
+                    if target in forbidden or target == location.node or target in closed:
+                        continue
+                    h = heuristic(*self.nodes[target])
+                    new_g = g + len(cells)
+                    if new_g + h > max_length or new_g >= best_g.get(target, float('inf')):
+                        continue
+                    best_g[target] = new_g
+                    parents[target] = (state, index)
+                    heapq.heappush(open_list, (new_g + h, new_g, tie, target, None))
+            return None
+
+        def root_length(hops):
+            return sum(len(segments(state)[index][1]) for state, index in hops)
+
+        def path_length(hops):
+            state, index = hops[-1]
+            return root_length(hops[:-1]) + segments(state)[index][2]
+
+        self.last_expanded = 0
+        first = spur_path(-1, set(), set())
+        if first is None:
+            return []
+        # A: shortest paths found, with the hop where they deviate from the path they were derived from
+        paths = [tuple(first)]
+        deviations = [0]
+        # B: heap of candidate paths
+        candidates = []
+        candidate_set = set()
+        tie = 0
+        while len(paths) < k:
+            previous = paths[-1]
+            for i in range(deviations[-1], len(previous)):
+                spur = previous[i][0]
+                if sum(segment is not None for segment in segments(spur)) < 2:
+                    continue
+                root = previous[:i]
+                forbidden_first = {path[i][1] for path in paths if len(path) > i and path[:i] == root}
+                # paths longer than the candidate which would be returned last can be skipped
+                max_length = float('inf')
+                missing = k - len(paths)
+                if len(candidates) >= missing:
+                    max_length = heapq.nsmallest(missing, candidates)[-1][0] - root_length(root)
+                spur_hops = spur_path(spur, {state for state, _ in root}, forbidden_first, max_length)
+                if spur_hops is None:
+                    continue
+                hops = root + tuple(spur_hops)
+                if hops not in candidate_set:
+                    candidate_set.add(hops)
+                    tie += 1
+                    heapq.heappush(candidates, (path_length(hops), tie, hops, i))
+            if not candidates:
+                break
+            _, _, hops, deviation = heapq.heappop(candidates)
+            paths.append(hops)
+            deviations.append(deviation)
+
+        result = []
+        for hops in paths:
+            waypoints = [source]
+            for state, index in hops[:-1]:
+                waypoints.extend(segments(state)[index][1])
+            state, index = hops[-1]
+            _, cells, goal_offset = segments(state)[index]
+            waypoints.extend(cells[:goal_offset])
+            result.append(np.array([(*waypoint.position, waypoint.direction) for waypoint in waypoints], dtype=int))
+        return result
+
+    def sipp(self, source_position: Tuple[int, int], source_direction: int, target_position: Tuple[int, int],
+             reserved_cells: Iterable, reserved_edges: Optional[Container] = None, start_time: int = 0,
+             max_time: int = 1000) -> Optional[List[Tuple[int, int]]]:
+        """
+        Safe interval path planning on the compressed graph.
+
+        Agents may only wait at the source and at nodes (decision points); along an edge they keep moving.
+        A cell is safe at time t if (row, column, t) is not in `reserved_cells`. Moving from cell a to cell b
+        at time t is forbidden if (b, a, t) is in `reserved_edges` (swap conflict).
+
+        Parameters
+        ----------
+        source_position : Tuple[int, int]
+        source_direction : int
+        target_position : Tuple[int, int]
+        reserved_cells : Iterable of (row, column, time)
+            e.g. a set, or a dict with these keys.
+        reserved_edges : Container of (from_position, to_position, time), optional
+        start_time : int
+            Time at which the agent is at the source.
+        max_time : int
+            No move may end later than this time.
+
+        Returns
+        -------
+        Optional[List[Tuple[int, int]]]
+            The position of the agent at each time step from `start_time` until it reaches the target,
+            None if no such path exists.
+        """
+        source_position = tuple(source_position)
+        target_position = tuple(target_position)
+
+        reserved_times: Dict[Tuple[int, int], List[int]] = {}
+        for row, column, time in reserved_cells:
+            reserved_times.setdefault((row, column), []).append(time)
+        for times in reserved_times.values():
+            times.sort()
+
+        def next_reserved(position, time):
+            # first reserved time of the cell at or after `time`, None if there is none
+            times = reserved_times.get(position)
+            if times is None:
+                return None
+            index = bisect.bisect_left(times, time)
+            return times[index] if index < len(times) else None
+
+        def blocked_until(position, time):
+            # last time of the block of consecutive reservations containing `time`
+            times = reserved_times[position]
+            index = bisect.bisect_left(times, time)
+            while index + 1 < len(times) and times[index + 1] == times[index] + 1:
+                index += 1
+            return times[index]
+
+        def is_free(position, time):
+            return next_reserved(position, time) != time
+
+        def interval_end(position, time):
+            # last time of the safe interval containing `time`
+            reserved = next_reserved(position, time + 1)
+            return max_time if reserved is None else min(reserved - 1, max_time)
+
+        def heuristic(position):
+            return abs(position[0] - target_position[0]) + abs(position[1] - target_position[1])
+
+        if not is_free(source_position, start_time):
+            return None
+        source = Waypoint(source_position, source_direction)
+        if source_position == target_position:
+            return [source_position]
+
+        self.last_expanded = 0
+        # search states are (node, end of safe interval), -1 stands for the source
+        source_key = (-1, interval_end(source_position, start_time))
+        tie = 0
+        open_list = [(start_time + heuristic(source_position), start_time, tie, source_key, None)]
+        best_arrival = {source_key: start_time}
+        parents = {}
+        closed = set()
+        while open_list:
+            _, arrival, _, key, goal = heapq.heappop(open_list)
+            if goal is not None:
+                return self._reconstruct_timed(source_position, parents, goal)
+            if key in closed:
+                continue
+            closed.add(key)
+            self.last_expanded += 1
+
+            node, end = key
+            waypoint = source if node == -1 else self.nodes[node]
+            for segment in self._segments_from(waypoint):
+                goal_offset = self._goal_offsets(segment, target_position)
+                cells = segment.cells if goal_offset is None else segment.cells[:goal_offset]
+                length = len(cells)
+                departure = arrival
+                while departure <= end and departure + length <= max_time:
+                    # find the first cell of the segment which is not safe for this departure time
+                    previous = waypoint.position
+                    next_departure = None
+                    for step, cell in enumerate(cells, start=1):
+                        if not is_free(cell.position, departure + step):
+                            next_departure = blocked_until(cell.position, departure + step) - step + 1
+                            break
+                        if reserved_edges is not None and \
+                                (cell.position, previous, departure + step) in reserved_edges:
+                            next_departure = departure + 1
+                            break
+                        previous = cell.position
+                    if next_departure is not None:
+                        departure = next_departure
+                        continue
+
+                    next_arrival = departure + length
+                    tie += 1
+                    if goal_offset is not None:
+                        heapq.heappush(open_list, (next_arrival, next_arrival, tie, None,
+                                                   (key, arrival, departure, cells)))
+                        break
+                    next_end = interval_end(cells[-1].position, next_arrival)
+                    next_key = (segment.target, next_end)
+                    if next_key not in closed and next_arrival < best_arrival.get(next_key, float('inf')):
+                        best_arrival[next_key] = next_arrival
+                        parents[next_key] = (key, arrival, departure, cells)
+                        heapq.heappush(open_list, (next_arrival + heuristic(cells[-1].position), next_arrival, tie,
+                                                   next_key, None))
+                    # later departures only matter if they reach a later safe interval of the next node
+                    departure = max(departure + 1, next_end + 2 - length)
+        return None
+
+    @staticmethod
+    def _reconstruct_timed(source_position: Tuple[int, int], parents, goal) -> List[Tuple[int, int]]:
+        moves = [goal]
+        key = goal[0]
+        while key[0] != -1:
+            moves.append(parents[key])
+            key = parents[key][0]
+        path = [source_position]
+        for key, arrival, departure, cells in reversed(moves):
+            position = path[-1]
+            path.extend([position] * (departure - arrival))
+            path.extend(cell.position for cell in cells)
+        return path
+
+
+def build_rail_graph(env) -> RailGraph:
+    """
+    Build the compressed graph of the rail of a `RailEnv`, keeping the agents' targets and initial positions
+    as nodes.
+    """
+    key_cells = set()
+    for agent in env.agents:
+        key_cells.add(tuple(agent.target))
+        if agent.initial_position is not None:
+            key_cells.add(tuple(agent.initial_position))
+    return RailGraph(env.rail, key_cells)
@@ -0,0 +1,165 @@
+"""
+Reachability index of a rail: answers `GridTransitionMap.check_path_exists` queries between key cells in O(1).
+
+The states of the rail are the (row, column, direction) triples, linked by the transitions of the grid. The strongly
+connected components of the state graph are computed once, and the set of key cells reachable from each component is
+propagated through the condensation (a DAG), sinks first. The result is kept as a reachability matrix from every
+state of a key cell to every key cell, e.g. from station to station for the schedule generators.
+"""
+from typing import Dict, Iterable, Tuple
+
+import numpy as np
+
+from flatland.core.transition_map import GridTransitionMap
+
+# row and column offsets of the moves to the north, east, south and west
+_MOVE_OFFSETS = np.array([[-1, 0], [0, 1], [1, 0], [0, -1]])
+
+
+class ReachabilityIndex:
+    """
+    Reachability between the key cells of a rail.
+
+    `path_exists(start, direction, end)` gives the same answer as `rail.check_path_exists(start, direction, end)`.
+    It is a lookup in `matrix` when `start` and `end` are key cells and falls back to the search otherwise.
+
+    Parameters
+    ----------
+    rail : GridTransitionMap
+        The rail, which must not change while the index is used.
+    key_cells : Iterable[Tuple[int, int]]
+        Cells between which reachability is indexed, e.g. the train stations.
+    """
+
+    def __init__(self, rail: GridTransitionMap, key_cells: Iterable[Tuple[int, int]]):
+        self.rail = rail
+        self.key_cells = list(dict.fromkeys(tuple(cell) for cell in key_cells))
+        self.key_index: Dict[Tuple[int, int], int] = {cell: i for i, cell in enumerate(self.key_cells)}
+        # matrix[i, direction, j]: a path exists from key cell i facing direction to key cell j
+        self.matrix = np.zeros((len(self.key_cells), 4, len(self.key_cells)), dtype=bool)
+        if self.key_cells:
+            self._build()
+
+    def _build(self):
+        grid = self.rail.grid
+        height, width = grid.shape
+
+        # states of the rail cells and of the key cells, numbered by (row * width + column) * 4 + direction
+        cells = np.flatnonzero(grid.ravel())
+        key_cells = np.array([row * width + column for row, column in self.key_cells])
+        cells = np.union1d(cells, key_cells)
+        rows, columns = np.divmod(cells, width)
+        nibbles = np.stack([(grid[rows, columns] >> ((3 - direction) * 4)) & 0xF for direction in range(4)], axis=1)
+
+        # transitions: from (cell, direction) moving to `move` enters the next cell facing `move`
+        sources, targets = [], []
+        for move in range(4):
+            allowed = (nibbles >> (3 - move)) & 1
+            cell_indices, directions = np.nonzero(allowed)
+            next_rows = rows[cell_indices] + _MOVE_OFFSETS[move, 0]
+            next_columns = columns[cell_indices] + _MOVE_OFFSETS[move, 1]
+            inside = (next_rows >= 0) & (next_rows < height) & (next_columns >= 0) & (next_columns < width)
+            sources.append(cells[cell_indices[inside]] * 4 + directions[inside])
+            targets.append((next_rows[inside] * width + next_columns[inside]) * 4 + move)
+        sources = np.concatenate(sources)
+        targets = np.concatenate(targets)
+
+        # compact numbering of all the states involved, with the edges in CSR form
+        states = np.union1d(np.repeat(cells * 4, 4) + np.tile(np.arange(4), len(cells)), targets)
+        sources = np.searchsorted(states, sources)
+        targets = np.searchsorted(states, targets)
+        order = np.argsort(sources, kind="stable")
+        successors = targets[order].tolist()
+        offsets = np.searchsorted(sources[order], np.arange(len(states) + 1)).tolist()
+
+        components, n_components = _strongly_connected_components(len(states), offsets, successors)
+
+        # key cells reached by each component as a bit set, components being numbered sinks first
+        reached = [0] * n_components
+        for j, cell in enumerate(key_cells.tolist()):
+            first = np.searchsorted(states, cell * 4)
+            for state in range(first, first + 4):
+                reached[components[state]] |= 1 << j
+        members = [[] for _ in range(n_components)]
+        for state, component in enumerate(components):
+            members[component].append(state)
+        for component in range(n_components):
+            bits = reached[component]
+            for state in members[component]:
+                for successor in successors[offsets[state]:offsets[state + 1]]:
+                    successor_component = components[successor]
+                    if successor_component != component:
+                        bits |= reached[successor_component]
+            reached[component] = bits
+
+        n_keys = len(self.key_cells)
+        for i, cell in enumerate(key_cells.tolist()):
+            first = np.searchsorted(states, cell * 4)
+            for direction in range(4):
+                bits = reached[components[first + direction]]
+                self.matrix[i, direction] = _bits_to_bools(bits, n_keys)
+
+    def path_exists(self, start: Tuple[int, int], direction: int, end: Tuple[int, int]) -> bool:
+        """
+        Whether a path exists from `start` facing `direction` to `end`, see `GridTransitionMap.check_path_exists`.
+        """
+        i = self.key_index.get(tuple(start))
+        j = self.key_index.get(tuple(end))
+        if i is None or j is None:
+            return self.rail.check_path_exists(start, direction, end)
+        return bool(self.matrix[i, direction, j])
+
+
+def _bits_to_bools(bits: int, n: int) -> np.ndarray:
+    as_bytes = np.frombuffer(bits.to_bytes((n + 7) // 8, "little"), dtype=np.uint8)
+    return np.unpackbits(as_bytes, bitorder="little")[:n].astype(bool)
+
+
+def _strongly_connected_components(n_states, offsets, successors):
+    """
+    Iterative Tarjan's algorithm. Returns the component of every state and the number of components; components
+    are numbered in reverse topological order, so the successors of a component have lower numbers.
+    """
+    index = [-1] * n_states
+    low = [0] * n_states
+    on_stack = [False] * n_states
+    components = [-1] * n_states
+    stack = []
+    counter = 0
+    n_components = 0
+    for root in range(n_states):
+        if index[root] >= 0:
+            continue
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = True
+        work = [(root, offsets[root])]
+        while work:
+            state, next_edge = work[-1]
+            if next_edge < offsets[state + 1]:
+                work[-1] = (state, next_edge + 1)
+                successor = successors[next_edge]
+                if index[successor] < 0:
+                    index[successor] = low[successor] = counter
+                    counter += 1
+                    stack.append(successor)
+                    on_stack[successor] = True
+                    work.append((successor, offsets[successor]))
+                elif on_stack[successor] and index[successor] < low[state]:
+                    low[state] = index[successor]
+                continue
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                if low[state] < low[parent]:
+                    low[parent] = low[state]
+            if low[state] == index[state]:
+                while True:
+                    member = stack.pop()
+                    on_stack[member] = False
+                    components[member] = n_components
+                    if member == state:
+                        break
+                n_components += 1
+    return components, n_components
@@ -8,6 +8,7 @@ from numpy.random.mtrand import RandomState
 from flatland.core.grid.grid4_utils import get_new_position
 from flatland.core.transition_map import GridTransitionMap
 from flatland.envs.agent_utils import EnvAgent
+from flatland.envs.reachability import ReachabilityIndex
 from flatland.envs.schedule_utils import Schedule
 from flatland.envs import persistence
 
@@ -137,6 +138,8 @@ class SparseSchedGen(BaseSchedGen):
         if num_agents > max_num_agents:
             num_agents = max_num_agents
             warnings.warn("Too many agents! Changes number of agents.")
+        # Reachability between all the train stations, computed once for all the tries
+        reachability = ReachabilityIndex(rail, [station[0] for stations in train_stations for station in stations])
         # Place agents and targets within available train stations
         agents_position = []
         agents_target = []
@@ -167,9 +170,9 @@ class SparseSchedGen(BaseSchedGen):
                 possible_orientations = [city_orientation[start_city],
                                          (city_orientation[start_city] + 2) % 4]
                 agent_orientation = np_random.choice(possible_orientations)
-                if not rail.check_path_exists(start[0], agent_orientation, target[0]):
+                if not reachability.path_exists(start[0], agent_orientation, target[0]):
                     agent_orientation = (agent_orientation + 2) % 4
-                if not (rail.check_path_exists(start[0], agent_orientation, target[0])):
+                if not (reachability.path_exists(start[0], agent_orientation, target[0])):
                     infeasible_agent = True
                 if tries >= 100:
                     warnings.warn("Did not find any possible path, check your parameters!!!")
@@ -0,0 +1,345 @@
+"""
+Vectorized environment stepping several `RailEnv` copies in lockstep, each in its own worker process.
+
+The actions, observations, rewards, dones and step infos are exchanged through shared memory arrays with one row per
+env, so only short commands and acknowledgements go through the pipes to the workers. The observations are the
+batches of the observation builder's `get_batch`: the builder must produce fixed size observations, and all the envs
+must have the same number of agents and the same observation shapes.
+
+Episode `i` of env `k` is reset with the seed `seed + k + num_envs * i`, so the episodes only depend on `seed` and
+`num_envs`, not on the scheduling of the workers.
+"""
+import multiprocessing
+import multiprocessing.connection
+import traceback
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from flatland.envs.agent_utils import RailAgentStatus
+from flatland.envs.rail_env import RailEnv
+
+# shared arrays of the step infos: name, dtype
+_INFO_ARRAYS = [("action_required", np.bool_), ("malfunction", np.int64), ("speed", np.float64),
+                ("status", np.int64)]
+
+
+class _ArraySpec(NamedTuple):
+    name: str
+    shape: Tuple[int, ...]
+    dtype: str
+
+
+def _get_batch_observations(env: RailEnv) -> Optional[Tuple[np.ndarray, ...]]:
+    """ The observations of `get_batch` as a tuple of arrays, or None if the builder does not implement it. """
+    try:
+        observations = env.obs_builder.get_batch()
+    except NotImplementedError:
+        return None
+    return observations if isinstance(observations, tuple) else (observations,)
+
+
+def _probe_specs(env: RailEnv, num_envs: int) -> List[_ArraySpec]:
+    """ The shared arrays of `num_envs` envs like `env`, which has been reset. """
+    n_agents = env.get_num_agents()
+    specs = [_ArraySpec("actions", (num_envs, n_agents), "int64"),
+             _ArraySpec("rewards", (num_envs, n_agents), "float64"),
+             _ArraySpec("dones", (num_envs, n_agents), "bool"),
+             _ArraySpec("all_done", (num_envs,), "bool")]
+    specs += [_ArraySpec(name, (num_envs, n_agents), np.dtype(dtype).name) for name, dtype in _INFO_ARRAYS]
+    observations = _get_batch_observations(env)
+    if observations is not None:
+        specs += [_ArraySpec("observation_{}".format(i), (num_envs,) + observation.shape, observation.dtype.name)
+                  for i, observation in enumerate(observations)]
+    return specs
+
+
+def _as_arrays(raw_arrays: Dict[str, object], specs: List[_ArraySpec]) -> Dict[str, np.ndarray]:
+    return {spec.name: np.frombuffer(raw_arrays[spec.name], dtype=spec.dtype).reshape(spec.shape) for spec in specs}
+
+
+class _VecWorker:
+    """
+    Runs env `index` of a `VecRailEnv` in a worker process and writes its results into row `index` of the shared
+    arrays.
+    """
+
+    def __init__(self, env_fn: Callable[[], RailEnv], index: int, num_envs: int, arrays: Dict[str, np.ndarray],
+                 auto_reset: bool):
+        self.env = env_fn()
+        self.env.compute_observations = False
+        self.index = index
+        self.num_envs = num_envs
+        self.arrays = arrays
+        self.observations = [array for name, array in arrays.items() if name.startswith("observation_")]
+        self.auto_reset = auto_reset
+        self.seed = None
+        self.episode = 0
+        self.episode_reward = 0.
+        self.episode_over = False
+
+    def reset(self, seed: Optional[int] = None):
+        if seed is not None:
+            self.seed = seed
+            self.episode = 0
+        _, info = self.env.reset(random_seed=self.seed + self.index + self.num_envs * self.episode)
+        self.episode += 1
+        self.episode_reward = 0.
+        self.episode_over = False
+        n_agents = self.arrays["actions"].shape[1]
+        if self.env.get_num_agents() != n_agents:
+            raise ValueError("Env {} has {} agents instead of {}".format(self.index, self.env.get_num_agents(),
+                                                                         n_agents))
+        self._write_observations()
+        self._write_infos(info)
+
+    def step(self) -> Optional[dict]:
+        """
+        Steps the env with the actions of its row. Returns the statistics of the episode if it got over in this
+        step, once per episode.
+        """
+        if self.seed is None:
+            raise Exception("Env {} is stepped before being reset, call reset() first".format(self.index))
+        actions = self.arrays["actions"][self.index].tolist()
+        _, rewards, dones, info = self.env.step(dict(enumerate(actions)))
+        n_agents = len(actions)
+        self.arrays["rewards"][self.index] = [rewards[handle] for handle in range(n_agents)]
+        self.arrays["dones"][self.index] = [dones[handle] for handle in range(n_agents)]
+        self.arrays["all_done"][self.index] = dones["__all__"]
+        self.episode_reward += sum(rewards.values())
+        if not dones["__all__"] or self.episode_over:
+            self._write_observations()
+            self._write_infos(info)
+            return None
+
+        episode = {"seed": self.seed + self.index + self.num_envs * (self.episode - 1),
+                   "steps": self.env._elapsed_steps,
+                   "reward": self.episode_reward,
+                   "done_agents": sum(agent.status in [RailAgentStatus.DONE, RailAgentStatus.DONE_REMOVED]
+                                      for agent in self.env.agents) / max(n_agents, 1)}
+        self.episode_over = True
+        if self.auto_reset:
+            # the rewards and dones stay those of the last step of the episode
+            self.reset()
+        else:
+            self._write_observations()
+            self._write_infos(info)
+        return episode
+
+    def _write_observations(self):
+        if not self.observations:
+            return
+        for buffer, observation in zip(self.observations, _get_batch_observations(self.env)):
+            buffer[self.index] = observation
+
+    def _write_infos(self, info: dict):
+        for name, _ in _INFO_ARRAYS:
+            values = info[name]
+            self.arrays[name][self.index] = [values.get(handle, 0) for handle in range(len(self.env.agents))]
+
+
+def _run_vec_worker(connection, env_fn, index, num_envs, raw_arrays, specs, auto_reset):
+    """
+    Main loop of a worker process: runs the commands of the `VecRailEnv` until it receives None.
+
+    Commands are (kind, argument) tuples with kind "reset" (argument: the seed or None) or "step", answered by
+    ("ok", value) tuples, value being the statistics of the finished episode after a "step", or ("error", traceback).
+    """
+    try:
+        worker = _VecWorker(env_fn, index, num_envs, _as_arrays(raw_arrays, specs), auto_reset)
+    except Exception:
+        connection.send(("error", traceback.format_exc()))
+        return
+    connection.send(("ok", None))
+    while True:
+        command = connection.recv()
+        if command is None:
+            break
+        kind, argument = command
+        try:
+            if kind == "reset":
+                worker.reset(argument)
+                connection.send(("ok", None))
+            elif kind == "step":
+                connection.send(("ok", worker.step()))
+        except Exception:
+            connection.send(("error", traceback.format_exc()))
+
+
+class _Worker(NamedTuple):
+    process: multiprocessing.Process
+    connection: multiprocessing.connection.Connection
+
+
+class VecRailEnv:
+    """
+    Runs `len(env_fns)` envs in lockstep, each in a worker process.
+
+    `reset` and `step` return arrays with a first axis over the envs and a second one over the agents, which are
+    views of the shared memory arrays: they are overwritten by the next call, copy them to keep them.
+
+    With `auto_reset`, an env is reset as soon as its episode is over: the observations and infos returned by `step`
+    are then those of the new episode, while the rewards and dones are those of the last step of the finished
+    episode, whose statistics are returned in the `episodes` info.
+
+    The first env is created and reset once in this process to size the shared arrays.
+
+    Parameters
+    ----------
+    env_fns : sequence of callables
+        Functions creating the envs, called in the worker processes; they must be picklable with the start method
+        `spawn`. Their observation builders must implement `get_batch` for observations to be returned.
+    seed : int
+        Seed of the first episode of the first env, positive since `RailEnv` does not seed itself with 0.
+    auto_reset : bool
+        Reset the envs whose episode is over. Without it, an env whose episode is over stays done until `reset`,
+        and its episode is only reported in the step it got over.
+    start_method : str, optional
+        Start method of the worker processes, the default one of the platform if not given.
+    """
+
+    def __init__(self, env_fns: Sequence[Callable[[], RailEnv]], seed: int = 1, auto_reset: bool = True,
+                 start_method: Optional[str] = None):
+        if seed <= 0:
+            raise ValueError("The seed must be positive, RailEnv does not seed itself with 0")
+        self.num_envs = len(env_fns)
+        self.seed = seed
+        self.auto_reset = auto_reset
+
+        probe_env = env_fns[0]()
+        probe_env.compute_observations = False
+        probe_env.reset(random_seed=seed)
+        self.specs = _probe_specs(probe_env, self.num_envs)
+        self.num_agents = probe_env.get_num_agents()
+        del probe_env
+
+        context = multiprocessing.get_context(start_method)
+        raw_arrays = {spec.name: context.RawArray("b", int(np.prod(spec.shape)) * np.dtype(spec.dtype).itemsize)
+                      for spec in self.specs}
+        self.arrays = _as_arrays(raw_arrays, self.specs)
+        self.workers: List[_Worker] = []
+        for index, env_fn in enumerate(env_fns):
+            connection, worker_connection = context.Pipe()
+            process = context.Process(target=_run_vec_worker,
+                                      args=(worker_connection, env_fn, index, self.num_envs, raw_arrays, self.specs,
+                                            auto_reset),
+                                      daemon=True)
+            process.start()
+            self.workers.append(_Worker(process, connection))
+        self.closed = False
+        try:
+            self._receive_all()
+        except Exception:
+            self.close()
+            raise
+        self.waiting = False
+
+    @property
+    def observations(self) -> Union[None, np.ndarray, Tuple[np.ndarray, ...]]:
+        """
+        The observations of the envs, of shape (num_envs,) + the shape of the builder's `get_batch`, one array per
+        array of `get_batch`; None if the builder does not implement `get_batch`.
+        """
+        observations = tuple(self.arrays[spec.name] for spec in self.specs if spec.name.startswith("observation_"))
+        if not observations:
+            return None
+        return observations[0] if len(observations) == 1 else observations
+
+    def _infos(self, episodes: Optional[List[Optional[dict]]] = None) -> dict:
+        infos = {name: self.arrays[name] for name, _ in _INFO_ARRAYS}
+        infos["all_done"] = self.arrays["all_done"]
+        infos["episodes"] = episodes if episodes is not None else [None] * self.num_envs
+        return infos
+
+    def _receive_all(self) -> list:
+        values = []
+        errors = []
+        for index, worker in enumerate(self.workers):
+            try:
+                status, value = worker.connection.recv()
+            except EOFError:
+                status, value = "error", "the worker process died"
+            if status == "error":
+                errors.append("Env {}: {}".format(index, value))
+            values.append(value)
+        if errors:
+            raise Exception("\n".join(errors))
+        return values
+
+    def reset(self, seed: Optional[int] = None):
+        """
+        Resets all the envs, restarting their seeds from `seed` if given.
+
+        Returns
+        -------
+        observations, infos
+            The observations, see `observations`, and the infos: arrays (num_envs, num_agents) "action_required",
+            "malfunction", "speed" and "status", as in the info dict of `RailEnv.reset`.
+        """
+        if seed is not None and seed <= 0:
+            raise ValueError("The seed must be positive, RailEnv does not seed itself with 0")
+        self.arrays["all_done"][:] = False
+        for worker in self.workers:
+            worker.connection.send(("reset", self.seed if seed is None else seed))
+        self.seed = self.seed if seed is None else seed
+        self._receive_all()
+        return self.observations, self._infos()
+
+    def step_async(self, actions: Union[np.ndarray, Sequence[Dict[int, int]]]):
+        """
+        Starts a step of all the envs with `actions`, an array (num_envs, num_agents) of actions or a dict of actions
+        per env, the agents without action doing nothing. The results are returned by `step_wait`.
+        """
+        if isinstance(actions, np.ndarray) or not isinstance(actions[0], dict):
+            self.arrays["actions"][:] = actions
+        else:
+            self.arrays["actions"][:] = 0
+            for index, action_dict in enumerate(actions):
+                for handle, action in action_dict.items():
+                    self.arrays["actions"][index, handle] = action
+        for worker in self.workers:
+            worker.connection.send(("step", None))
+        self.waiting = True
+
+    def step_wait(self):
+        """
+        Waits for the step started by `step_async`.
+
+        Returns
+        -------
+        observations, rewards, dones, infos
+            The observations, see `observations`, the rewards and dones of the agents, arrays (num_envs, num_agents),
+            and the infos: the arrays of `reset`, "all_done" the `__all__` done of each env and "episodes" a list
+            with the statistics of the episode of each env which got done in this step, None for the others.
+        """
+        self.waiting = False
+        episodes = self._receive_all()
+        return self.observations, self.arrays["rewards"], self.arrays["dones"], self._infos(episodes)
+
+    def step(self, actions: Union[np.ndarray, Sequence[Dict[int, int]]]):
+        """
+        Steps all the envs, see `step_async` and `step_wait`.
+        """
+        self.step_async(actions)
+        return self.step_wait()
+
+    def close(self):
+        if self.closed:
+            return
+        for worker in self.workers:
+            try:
+                worker.connection.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        for worker in self.workers:
+            worker.process.join(timeout=5)
+            if worker.process.is_alive():
+                worker.process.terminate()
+        self.workers = []
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -29,6 +29,11 @@ class TimeoutException(StopAsyncIteration):
     pass
 
 
+def _plain_actions(action_dict):
+    """ Actions as plain ints, which are much cheaper to pack than numpy integers or enum members. """
+    return {handle: None if action is None else int(action) for handle, action in action_dict.items()}
+
+
 class FlatlandRemoteClient(object):
     """
         Redis client to interface with flatland-rl remote-evaluation-service
@@ -91,6 +96,8 @@ class FlatlandRemoteClient(object):
         self.verbose = verbose
 
         self.env = None
+        # id of the current episode, given by services evaluating several episodes concurrently
+        self.episode_id = None
         self.ping_pong()
 
         self.env_step_times = []
@@ -136,6 +143,29 @@ class FlatlandRemoteClient(object):
                                                          random_hash)
         return response_channel
 
+    def _pack(self, message):
+        # Note: The patched msgpack supports numpy arrays
+        if self.use_pickle:
+            return pickle.dumps(message)
+        return msgpack.packb(message, default=m.encode, use_bin_type=True)
+
+    def _unpack(self, message_bytes):
+        if self.use_pickle:
+            return pickle.loads(message_bytes)
+        return msgpack.unpackb(
+            message_bytes,
+            object_hook=m.decode,
+            strict_map_key=False,  # new for msgpack 1.0?
+            encoding="utf8"  # remove for msgpack 1.0
+        )
+
+    def _check_error(self, error_bytes):
+        # errors are essentially just timeouts, for now.
+        if error_bytes is not None:
+            error_dict = self._unpack(error_bytes)
+            print("Error received: ", error_dict)
+            raise TimeoutException(error_dict["type"])
+
     def _remote_request(self, _request, blocking=True):
         """
             request:
@@ -147,9 +177,15 @@ class FlatlandRemoteClient(object):
             * Send the payload on command_channel (self.namespace+"::command")
                 ** redis-left-push (LPUSH)
             * Keep listening on response_channel (BLPOP)
+
+            Non-blocking requests get no response, so they have no response channel,
+            and the error check and the push are sent in one pipeline (a single round-trip).
+            A request pushed alongside a pending timeout error is ignored by the service,
+            as it ignores all steps after a timeout.
         """
         assert isinstance(_request, dict)
-        _request['response_channel'] = self._generate_response_channel()
+        if blocking:
+            _request['response_channel'] = self._generate_response_channel()
         _request['timestamp'] = time.time()
 
         _redis = self.get_redis_connection()
@@ -160,47 +196,34 @@ class FlatlandRemoteClient(object):
         if self.verbose:
             print("Request : ", _request)
 
-        # check for errors (essentially just timeouts, for now.)
-        error_bytes = _redis.rpop(self.error_channel)
-        if error_bytes is not None:
-            if self.use_pickle:
-                error_dict = pickle.loads(error_bytes)
-            else:
-                error_dict = msgpack.unpackb(
-                    error_bytes,
-                    object_hook=m.decode,
-                    strict_map_key=False,  # new for msgpack 1.0?
-                    encoding="utf8"  # remove for msgpack 1.0
-                )
-            print("Error received: ", error_dict)
-            raise TimeoutException(error_dict["type"])
+        payload = self._pack(_request)
 
-        # Push request in command_channels
-        # Note: The patched msgpack supports numpy arrays
-        if self.use_pickle:
-            payload = pickle.dumps(_request)
-        else:
-            payload = msgpack.packb(_request, default=m.encode, use_bin_type=True)
+        # the errors of an episode evaluated concurrently with others come on its own channel
+        error_channel = self.error_channel
+        if self.episode_id is not None:
+            error_channel = "{}::{}".format(self.error_channel, self.episode_id)
+
+        if not blocking:
+            pipeline = _redis.pipeline(transaction=False)
+            pipeline.rpop(error_channel)
+            pipeline.lpush(self.command_channel, payload)
+            error_bytes, _ = pipeline.execute()
+            self._check_error(error_bytes)
+            return
+
+        # check for errors before pushing the request in command_channels
+        self._check_error(_redis.rpop(error_channel))
         _redis.lpush(self.command_channel, payload)
 
-        if blocking:
-            # Wait with a blocking pop for the response
-            _response = _redis.blpop(_request['response_channel'])[1]
-            if self.verbose:
-                print("Response : ", _response)
-            if self.use_pickle:
-                _response = pickle.loads(_response)
-            else:
-                _response = msgpack.unpackb(
-                    _response,
-                    object_hook=m.decode,
-                    strict_map_key=False,  # new for msgpack 1.0?
-                    encoding="utf8"  # remove for msgpack 1.0
-                )
-            if _response['type'] == messages.FLATLAND_RL.ERROR:
-                raise Exception(str(_response["payload"]))
-            else:
-                return _response
+        # Wait with a blocking pop for the response
+        _response = _redis.blpop(_request['response_channel'])[1]
+        if self.verbose:
+            print("Response : ", _response)
+        _response = self._unpack(_response)
+        if _response['type'] == messages.FLATLAND_RL.ERROR:
+            raise Exception(str(_response["payload"]))
+        else:
+            return _response
 
     def ping_pong(self):
         """
@@ -238,6 +261,7 @@ class FlatlandRemoteClient(object):
         info = _response['payload']['info']
         random_seed = _response['payload']['random_seed']
         test_env_file_path = _response['payload']['env_file_path']
+        self.episode_id = _response['payload'].get('episode_id')
         time_diff = time.time() - time_start
         self.update_running_stats("env_creation_wait_time", time_diff)
 
@@ -286,9 +310,14 @@ class FlatlandRemoteClient(object):
         self.last_env_step_time = time.time()
         return local_observation, info
 
-    def env_step(self, action, render=False):
+    def env_step(self, action, render=False, until_decision=False):
         """
             Respond with [observation, reward, done, info]
+
+            With until_decision, the service and the local env continue
+            with steps without actions until a decision is required, see
+            RailEnv.step_until_decision: the rewards are summed over the
+            steps, whose number is in info["steps"].
         """
         # We use the last_env_step_time as an approximate measure of the inference time
         approximate_inference_time = time.time() - self.last_env_step_time
@@ -297,8 +326,12 @@ class FlatlandRemoteClient(object):
         _request = {}
         _request['type'] = messages.FLATLAND_RL.ENV_STEP
         _request['payload'] = {}
-        _request['payload']['action'] = action
+        _request['payload']['action'] = _plain_actions(action)
         _request['payload']['inference_time'] = approximate_inference_time
+        if until_decision:
+            _request['payload']['until_decision'] = True
+        if self.episode_id is not None:
+            _request['payload']['episode_id'] = self.episode_id
 
         # Relay the action in a non-blocking way to the server
         # so that it can start doing an env.step on it in ~ parallel
@@ -307,8 +340,12 @@ class FlatlandRemoteClient(object):
 
         # Apply the action in the local env
         time_start = time.time()
-        local_observation, local_reward, local_done, local_info = \
-            self.env.step(action)
+        if until_decision:
+            local_observation, local_reward, local_done, local_info = \
+                self.env.step_until_decision(action)
+        else:
+            local_observation, local_reward, local_done, local_info = \
+                self.env.step(action)
         time_diff = time.time() - time_start
         # Compute a running mean of env step times
         self.update_running_stats("internal_env_step_time", time_diff)
@@ -318,6 +355,42 @@ class FlatlandRemoteClient(object):
 
         return [local_observation, local_reward, local_done, local_info]
 
+    def env_step_batch(self, actions):
+        """
+            Sends the actions of several consecutive steps in one message,
+            e.g. to play an open-loop plan, and applies them to the local env.
+            Stops at the end of the episode; the service ignores the remaining actions too.
+
+            Respond with [observation, reward, done, info] of every step performed
+        """
+        approximate_inference_time = time.time() - self.last_env_step_time
+        self.update_running_stats("inference_time(approx)", approximate_inference_time)
+
+        _request = {}
+        _request['type'] = messages.FLATLAND_RL.ENV_STEP_BATCH
+        _request['payload'] = {}
+        _request['payload']['actions'] = [_plain_actions(action_dict) for action_dict in actions]
+        _request['payload']['inference_time'] = approximate_inference_time
+        if self.episode_id is not None:
+            _request['payload']['episode_id'] = self.episode_id
+
+        # Note - this can throw a Timeout
+        self._remote_request(_request, blocking=False)
+
+        results = []
+        for action in actions:
+            time_start = time.time()
+            local_observation, local_reward, local_done, local_info = \
+                self.env.step(action)
+            time_diff = time.time() - time_start
+            self.update_running_stats("internal_env_step_time", time_diff)
+            results.append([local_observation, local_reward, local_done, local_info])
+            if local_done['__all__']:
+                break
+
+        self.last_env_step_time = time.time()
+        return results
+
     def submit(self):
         _request = {}
         _request['type'] = messages.FLATLAND_RL.ENV_SUBMIT
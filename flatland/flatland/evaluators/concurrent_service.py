@@ -0,0 +1,621 @@
+#!/usr/bin/env python
+"""
+Evaluation service running several episodes at the same time.
+
+`ConcurrentEvaluationService` accepts the commands of `FlatlandRemoteClient` like `FlatlandRemoteEvaluationService`,
+but hands every ENV_CREATE to a free worker process of a pool. The worker owns the env of that episode until it is
+done, and the steps of the episode are routed to it by the episode id sent with the ENV_CREATE response. Several
+clients (e.g. one per core) can then be evaluated against the same service.
+
+The workers only report the results of finished episodes; these are merged into the evaluation metadata by the
+service process, which is the only one writing it.
+"""
+import json
+import multiprocessing
+import os
+import time
+import traceback
+from collections import deque
+from multiprocessing.connection import wait
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+from flatland.core.env_observation_builder import DummyObservationBuilder
+from flatland.envs.agent_utils import RailAgentStatus
+from flatland.envs.episode_log import EpisodeRecorder
+from flatland.envs.malfunction_generators import malfunction_from_file
+from flatland.envs.persistence import RailEnvPersister
+from flatland.envs.rail_env import RailEnv
+from flatland.envs.rail_generators import rail_from_file
+from flatland.envs.schedule_generators import schedule_from_file
+from flatland.evaluators import messages
+from flatland.evaluators import service as evaluation_service
+from flatland.evaluators.service import FlatlandRemoteEvaluationService
+
+
+class EpisodeWorker:
+    """
+    Runs the episodes handed to a worker, one at a time, and computes their results as
+    `FlatlandRemoteEvaluationService` does for its env.
+    """
+
+    # same running statistics as the service
+    update_running_stats = FlatlandRemoteEvaluationService.update_running_stats
+
+    def __init__(self, test_env_folder, action_dir=None, episode_dir=None, merge_dir=None, stream_episodes=False):
+        self.test_env_folder = test_env_folder
+        self.action_dir = action_dir
+        self.episode_dir = episode_dir
+        self.merge_dir = merge_dir
+        self.stream_episodes = stream_episodes
+        self.env = None
+        self.env_file_path = None
+
+    def create(self, env_file_path):
+        """
+        Creates and resets the env of a new episode.
+        Returns the observation and info of the ENV_CREATE response.
+        """
+        self.env_file_path = env_file_path
+        test_env_file_path = os.path.join(self.test_env_folder, env_file_path)
+        self.env = RailEnv(width=1, height=1,
+                           rail_generator=rail_from_file(test_env_file_path),
+                           schedule_generator=schedule_from_file(test_env_file_path),
+                           malfunction_generator_and_process_data=malfunction_from_file(test_env_file_path),
+                           obs_builder_object=DummyObservationBuilder(),
+                           record_steps=not self.stream_episodes or self.merge_dir is not None)
+        if self.stream_episodes and self.episode_dir is not None:
+            sfEpisodeLog = self.episode_dir + "/" + env_file_path + ".episode"
+            if not os.path.exists(os.path.dirname(sfEpisodeLog)):
+                os.makedirs(os.path.dirname(sfEpisodeLog))
+            self.env.episode_recorder = EpisodeRecorder(sfEpisodeLog)
+
+        self.begin_simulation = time.time()
+        self.reward = 0
+        self.normalized_reward = 0.0
+        self.steps = 0
+        self.nb_malfunctioning_trains = 0
+        self.stats = {}
+        self.episode_actions = []
+
+        observation, info = self.env.reset(
+            regenerate_rail=True,
+            regenerate_schedule=True,
+            activate_agents=False,
+            random_seed=evaluation_service.RANDOM_SEED
+        )
+        # the client computes its own observations, it only needs to know that the env exists
+        return True, info
+
+    def step(self, actions, inference_time, until_decision=False):
+        """
+        Performs the steps of an ENV_STEP or ENV_STEP_BATCH command, ignoring the actions after the end of the episode.
+        With `until_decision`, each step is followed by steps without actions as in `RailEnv.step_until_decision`.
+        Returns the results of the episode if it is over, None otherwise.
+        """
+        if self.env.dones['__all__']:
+            raise Exception(
+                "Client attempted to perform an action on an Env which \
+                has done['__all__']==True")
+
+        for action in actions:
+            while True:
+                event_state = self.env._get_event_state()
+                done = self._step(action, inference_time)
+                if done['__all__']:
+                    return self._finish()
+                if not until_decision or self.env._decision_required(event_state):
+                    break
+                # no inference for the steps without actions
+                action, inference_time = {}, None
+        return None
+
+    def _step(self, action, inference_time):
+        """
+        Performs one step and updates the episode statistics. Returns the dones of the step.
+        """
+        if inference_time is not None:
+            self.update_running_stats("controller_inference_time", inference_time)
+
+        time_start = time.time()
+        _observation, all_rewards, done, info = self.env.step(action)
+        self.update_running_stats("internal_env_step_time", time.time() - time_start)
+
+        self.steps += 1
+        cumulative_reward = sum(all_rewards.values())
+        self.reward += cumulative_reward
+        self.normalized_reward += \
+            cumulative_reward / (self.env._max_episode_steps * self.env.get_num_agents())
+        self.nb_malfunctioning_trains += sum(
+            agent.malfunction_data['malfunction'] == 1 for agent in self.env.agents)
+
+        if self.action_dir is not None:
+            self.episode_actions.append(action)
+        return done
+
+    def _finish(self):
+        complete = sum(agent.status == RailAgentStatus.DONE_REMOVED for agent in self.env.agents)
+        # adds 1.0 so we can add them up
+        self.normalized_reward += 1.0
+
+        if self.action_dir is not None:
+            self.save_actions()
+        if self.episode_dir is not None:
+            self.save_episode()
+        if self.merge_dir is not None:
+            self.save_merged_env()
+
+        return self._result(percentage_complete=complete * 1.0 / self.env.get_num_agents(),
+                            simulation_time=time.time() - self.begin_simulation)
+
+    def time_out(self):
+        """
+        Ends the episode after a timeout: it does not get any reward.
+        """
+        self.steps += 1
+        self.reward = self.env._max_episode_steps * self.env.get_num_agents()
+        self.normalized_reward = 0.0
+        if self.env.episode_recorder is not None:
+            self.env.episode_recorder.close()
+        return self._result(percentage_complete=0.0, simulation_time=0, timed_out=True)
+
+    def _result(self, percentage_complete, simulation_time, timed_out=False):
+        return {
+            "env_file_path": self.env_file_path,
+            "reward": self.reward,
+            "normalized_reward": self.normalized_reward,
+            "percentage_complete": percentage_complete,
+            "steps": self.steps,
+            "simulation_time": simulation_time,
+            "nb_malfunctioning_trains": self.nb_malfunctioning_trains,
+            "timed_out": timed_out,
+            "stats": self.stats,
+        }
+
+    def save_actions(self):
+        sfActions = self.action_dir + "/" + self.env_file_path.replace(".pkl", ".json")
+        if not os.path.exists(os.path.dirname(sfActions)):
+            os.makedirs(os.path.dirname(sfActions))
+        with open(sfActions, "w") as fOut:
+            json.dump(self.episode_actions, fOut)
+        self.episode_actions = []
+
+    def save_episode(self):
+        sfEpisode = self.episode_dir + "/" + self.env_file_path
+        if self.env.episode_recorder is not None:
+            # the steps are already in the episode log next to it
+            self.env.episode_recorder.close()
+            RailEnvPersister.save(self.env, sfEpisode)
+            return
+        RailEnvPersister.save_episode(self.env, sfEpisode)
+
+    def save_merged_env(self):
+        sfMergeEnv = self.merge_dir + "/" + self.env_file_path
+        if not os.path.exists(os.path.dirname(sfMergeEnv)):
+            os.makedirs(os.path.dirname(sfMergeEnv))
+        RailEnvPersister.save_episode(self.env, sfMergeEnv)
+
+
+def _run_episode_worker(connection, worker_args):
+    """
+    Main loop of a worker process: runs the requests of the service until it receives None.
+
+    Requests are (episode id, kind, arguments) tuples, answers (episode id, kind, value) tuples, with kind
+    "created" after a "create", "done" when the episode is over (after a "step" or a "timeout") and "error".
+    """
+    worker = EpisodeWorker(*worker_args)
+    while True:
+        request = connection.recv()
+        if request is None:
+            break
+        episode_id, kind, args = request
+        try:
+            if kind == "create":
+                connection.send((episode_id, "created", worker.create(*args)))
+            elif kind == "step":
+                result = worker.step(*args)
+                if result is not None:
+                    connection.send((episode_id, "done", result))
+            elif kind == "timeout":
+                connection.send((episode_id, "done", worker.time_out()))
+        except Exception as e:
+            print(traceback.format_exc())
+            connection.send((episode_id, "error", str(e)))
+
+
+class _Worker(NamedTuple):
+    process: multiprocessing.Process
+    connection: multiprocessing.connection.Connection
+
+
+class _Episode:
+    def __init__(self, worker: _Worker, env_test: int, command: dict):
+        self.worker = worker
+        self.env_test = env_test
+        # ENV_CREATE command, answered when the env is created
+        self.command = command
+        self.deadline: Optional[float] = None
+        self.stepped = False
+        self.timed_out = False
+
+
+class ConcurrentEvaluationService(FlatlandRemoteEvaluationService):
+    """
+    A `FlatlandRemoteEvaluationService` evaluating up to `n_workers` episodes at the same time,
+    each in its own worker process.
+
+    The ENV_CREATE response carries the `episode_id`, which the client sends back with its steps, and
+    its timeouts are sent on the error channel of the episode (`<error channel>::<episode id>`).
+    An ENV_CREATE waits for a free worker, and the first episode of a test waits until all the episodes of the
+    previous test are done, to check that enough of their agents got done.
+    ENV_SUBMIT is answered once all the envs have been evaluated. Rendering is not supported.
+    The evaluation stops when `MAX_SUCCESSIVE_TIMEOUTS` episodes in a row timed out, whatever the commands of the
+    other clients.
+
+    Parameters
+    ----------
+    n_workers : int, optional
+        Number of worker processes, the number of cores by default.
+    poll_interval : float
+        Seconds to wait for a command before checking the workers and the timeouts again.
+    **kwargs
+        Arguments of `FlatlandRemoteEvaluationService`.
+    """
+
+    def __init__(self, n_workers=None, poll_interval=0.01, **kwargs):
+        kwargs["visualize"] = False
+        super().__init__(**kwargs)
+        self.n_workers = n_workers or multiprocessing.cpu_count()
+        self.poll_interval = poll_interval
+        self.workers = []
+        self.free_workers = []
+        self.episodes = {}
+        self.pending_creates = deque()
+        self.pending_submits = []
+
+    def episode_error_channel(self, episode_id):
+        return "{}::{}".format(self.error_channel, episode_id)
+
+    def start_workers(self):
+        worker_args = (self.test_env_folder, self.action_dir, self.episode_dir, self.merge_dir, self.stream_episodes)
+        for _ in range(self.n_workers):
+            connection, worker_connection = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_run_episode_worker, args=(worker_connection, worker_args),
+                                              daemon=True)
+            process.start()
+            self.workers.append(_Worker(process, connection))
+        self.free_workers = list(self.workers)
+
+    def stop_workers(self):
+        for worker in self.workers:
+            try:
+                worker.connection.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        for worker in self.workers:
+            worker.process.join(timeout=5)
+            if worker.process.is_alive():
+                worker.process.terminate()
+        self.workers = []
+        self.free_workers = []
+
+    def get_next_command(self):
+        """
+        The next command, or None if none came within `poll_interval`.
+        Timeouts are checked per episode by the main loop.
+        """
+        command = self.get_redis_connection().brpop(self.command_channel, timeout=self.poll_interval)
+        if command is None:
+            return None
+        return self._decode_command(command[1])
+
+    def handle_env_create(self, command):
+        self.pending_creates.append(command)
+        self.assign_episodes()
+
+    def assign_episodes(self):
+        """
+        Hands the pending ENV_CREATE commands to free workers.
+        """
+        while self.pending_creates:
+            command = self.pending_creates[0]
+            if self.simulation_count + 1 >= len(self.env_file_paths) or self.evaluation_done:
+                self.pending_creates.popleft()
+                self._respond_no_more_envs(command)
+                continue
+
+            test_env_file_path = self.env_file_paths[self.simulation_count + 1]
+            env_test, env_level = self.get_env_test_and_level(test_env_file_path)
+            if self.current_test != env_test:
+                if any(episode.env_test == self.current_test for episode in self.episodes.values()):
+                    # wait for the results of the previous test
+                    break
+                if env_test != 0 and not self._check_test_complete_percentage():
+                    continue
+            if not self.free_workers:
+                break
+
+            self.pending_creates.popleft()
+            self.simulation_count += 1
+            if self.simulation_count == 0:
+                # Very first episode: start the overall timer
+                print("Starting overall timer...")
+                self.overall_start_time = time.time()
+            print("Evaluating {} ({}/{})".format(test_env_file_path, self.simulation_count, len(self.env_file_paths)))
+            self.current_test = env_test
+            self.current_level = env_level
+
+            # Start adding placeholders for the new episode
+            self.simulation_env_file_paths.append(test_env_file_path)
+            self.simulation_rewards.append(0)
+            self.simulation_rewards_normalized.append(0)
+            self.simulation_percentage_complete.append(0)
+            self.simulation_times.append(0)
+            self.simulation_steps.append(0)
+            self.nb_malfunctioning_trains.append(0)
+
+            worker = self.free_workers.pop()
+            self.episodes[self.simulation_count] = _Episode(worker, env_test, command)
+            worker.connection.send((self.simulation_count, "create", (test_env_file_path,)))
+
+    def _check_test_complete_percentage(self):
+        """
+        Stops the evaluation if the mean percentage of done agents of the previous test was too low.
+        """
+        if self.current_test not in self.simulation_percentage_complete_per_test:
+            print("No environment was finished at all during test {}!".format(self.current_test))
+            mean_test_complete_percentage = 0.0
+        else:
+            mean_test_complete_percentage = np.mean(self.simulation_percentage_complete_per_test[self.current_test])
+
+        if mean_test_complete_percentage < evaluation_service.TEST_MIN_PERCENTAGE_COMPLETE_MEAN:
+            print("=" * 15)
+            msg = "The mean percentage of done agents during the last 10 environments was too low: {:.3f} < {}".format(
+                mean_test_complete_percentage,
+                evaluation_service.TEST_MIN_PERCENTAGE_COMPLETE_MEAN
+            )
+            print(msg, "Evaluation will stop.")
+            self.termination_cause = msg
+            self.evaluation_done = True
+            return False
+        return True
+
+    def _respond_no_more_envs(self, command):
+        _command_response = {}
+        _command_response['type'] = messages.FLATLAND_RL.ENV_CREATE_RESPONSE
+        _command_response['payload'] = {}
+        _command_response['payload']['observation'] = False
+        _command_response['payload']['env_file_path'] = False
+        _command_response['payload']['info'] = False
+        _command_response['payload']['random_seed'] = False
+        self.send_response(_command_response, command)
+
+    def handle_env_step(self, command):
+        _payload = command['payload']
+        self._route_steps(_payload, [_payload['action']], _payload['inference_time'],
+                          _payload.get('until_decision', False))
+
+    def handle_env_step_batch(self, command):
+        _payload = command['payload']
+        actions = _payload['actions']
+        self._route_steps(_payload, actions, _payload['inference_time'] / max(len(actions), 1))
+
+    def _route_steps(self, _payload, actions, inference_time, until_decision=False):
+        episode = self.episodes.get(_payload.get('episode_id'))
+        if episode is None or episode.timed_out or self.evaluation_done:
+            print("Ignoring step command of episode {}, which is not running.".format(_payload.get('episode_id')))
+            return
+
+        overall_elapsed = (time.time() - self.overall_start_time)
+        if overall_elapsed > evaluation_service.OVERALL_TIMEOUT:
+            msg = "Reached overall time limit: took {:.2f}s, limit is {:.2f}s.".format(
+                overall_elapsed, evaluation_service.OVERALL_TIMEOUT
+            )
+            self.termination_cause = msg
+            self.evaluation_done = True
+            print("=" * 15)
+            print(msg, "Evaluation will stop.")
+            return
+
+        episode.stepped = True
+        if not self.disable_timeouts:
+            episode.deadline = time.time() + evaluation_service.PER_STEP_TIMEOUT * max(len(actions), 1)
+        episode.worker.connection.send((_payload['episode_id'], "step", (actions, inference_time, until_decision)))
+
+    def handle_worker_answers(self):
+        """
+        Answers the ENV_CREATE commands of the created envs and merges the results of the finished episodes.
+        """
+        connections = [episode.worker.connection for episode in self.episodes.values()]
+        for connection in wait(connections, timeout=0):
+            episode_id, kind, value = connection.recv()
+            episode = self.episodes.get(episode_id)
+            if episode is None:
+                # e.g. the "done" of a timeout sent when the episode was already done
+                print("Ignoring {} answer of episode {}, which is not running.".format(kind, episode_id))
+                continue
+            if kind == "created":
+                observation, info = value
+                if not self.disable_timeouts:
+                    episode.deadline = time.time() + evaluation_service.INTIAL_PLANNING_TIMEOUT
+                _command_response = {}
+                _command_response['type'] = messages.FLATLAND_RL.ENV_CREATE_RESPONSE
+                _command_response['payload'] = {}
+                _command_response['payload']['observation'] = observation
+                _command_response['payload']['env_file_path'] = self.env_file_paths[episode_id]
+                _command_response['payload']['info'] = info
+                _command_response['payload']['random_seed'] = evaluation_service.RANDOM_SEED
+                _command_response['payload']['episode_id'] = episode_id
+                self.send_response(_command_response, episode.command)
+                self.update_evaluation_state()
+            elif kind == "done":
+                del self.episodes[episode_id]
+                self.free_workers.append(episode.worker)
+                self.merge_episode_result(episode_id, value)
+            else:
+                raise Exception(value)
+
+    def check_episode_timeouts(self):
+        """
+        Ends the episodes whose client did not send a command in time.
+        """
+        now = time.time()
+        for episode_id, episode in self.episodes.items():
+            if episode.timed_out or episode.deadline is None or now < episode.deadline:
+                continue
+            if episode.stepped:
+                self.send_error({"type": messages.FLATLAND_RL.ENV_STEP_TIMEOUT},
+                                error_channel=self.episode_error_channel(episode_id))
+                timeout_details = "step time limit of {}s".format(evaluation_service.PER_STEP_TIMEOUT)
+            else:
+                self.send_error({"type": messages.FLATLAND_RL.ENV_RESET_TIMEOUT},
+                                error_channel=self.episode_error_channel(episode_id))
+                timeout_details = "pre-planning time limit of {}s".format(evaluation_service.INTIAL_PLANNING_TIMEOUT)
+            print("Evaluation of episode {} TIMED OUT (exceeded {}), won't get any reward.".format(
+                episode_id, timeout_details))
+            episode.timed_out = True
+            episode.worker.connection.send((episode_id, "timeout", ()))
+
+            self.timeout_counter += 1
+            if self.timeout_counter >= evaluation_service.MAX_SUCCESSIVE_TIMEOUTS:
+                print("=" * 15)
+                msg = "Submissions had {} consecutive timeouts.".format(self.timeout_counter)
+                print(msg, "Evaluation will stop.")
+                self.termination_cause = msg
+                self.evaluation_done = True
+
+    def merge_episode_result(self, episode_id, result):
+        """
+        Writes the results of a finished episode into the statistics and the evaluation metadata.
+        """
+        self.simulation_rewards[episode_id] = result["reward"]
+        self.simulation_rewards_normalized[episode_id] = result["normalized_reward"]
+        self.simulation_percentage_complete[episode_id] = result["percentage_complete"]
+        self.simulation_steps[episode_id] = result["steps"]
+        self.simulation_times[episode_id] = result["simulation_time"]
+        self.nb_malfunctioning_trains[episode_id] = result["nb_malfunctioning_trains"]
+
+        env_test, env_level = self.get_env_test_and_level(result["env_file_path"])
+        if not result["timed_out"]:
+            # only episodes timing out in a row count as successive timeouts
+            self.timeout_counter = 0
+            self.simulation_percentage_complete_per_test.setdefault(env_test, []).append(
+                result["percentage_complete"])
+            print(
+                "Evaluation of {} finished in {} timesteps, {:.3f} seconds. Percentage agents done: {:.3f}. "
+                "Normalized reward: {:.3f}. Number of malfunctions: {}.".format(
+                    result["env_file_path"],
+                    result["steps"],
+                    result["simulation_time"],
+                    result["percentage_complete"],
+                    result["normalized_reward"],
+                    result["nb_malfunctioning_trains"]
+                ))
+
+        stats = result["stats"]
+        self.merge_running_stats(stats)
+
+        if self.evaluation_metadata_df is not None:
+            columns = ["reward", "normalized_reward", "percentage_complete", "steps", "simulation_time",
+                       "nb_malfunctioning_trains", "controller_inference_time_min",
+                       "controller_inference_time_mean", "controller_inference_time_max"]
+            values = [result[column] for column in columns[:6]] + [
+                stats.get("controller_inference_time_" + key, 0.0) for key in ["min", "mean", "max"]]
+            self.evaluation_metadata_df.loc[result["env_file_path"], columns] = values
+
+            # Write intermediate results
+            if self.result_output_path:
+                self.evaluation_metadata_df.to_csv(self.result_output_path)
+
+    def merge_running_stats(self, stats):
+        """
+        Merges the running statistics of a worker into those of the service.
+        """
+        for counter_key, counter in stats.items():
+            if not counter_key.endswith("_counter"):
+                continue
+            key = counter_key[:-len("_counter")]
+            mean_key = "{}_mean".format(key)
+            min_key = "{}_min".format(key)
+            max_key = "{}_max".format(key)
+            if counter_key not in self.stats:
+                for _key in [mean_key, min_key, max_key, counter_key]:
+                    self.stats[_key] = stats[_key]
+                continue
+            total = self.stats[counter_key] + counter
+            self.stats[mean_key] = (self.stats[mean_key] * self.stats[counter_key] + stats[mean_key] * counter) / total
+            self.stats[min_key] = min(self.stats[min_key], stats[min_key])
+            self.stats[max_key] = max(self.stats[max_key], stats[max_key])
+            self.stats[counter_key] = total
+
+    def update_evaluation_state(self):
+        elapsed = time.time() - self.overall_start_time
+        progress = np.clip(elapsed / evaluation_service.OVERALL_TIMEOUT, 0, 1)
+
+        mean_reward, mean_normalized_reward, sum_normalized_reward, mean_percentage_complete = \
+            self.compute_mean_scores()
+
+        self.evaluation_state["state"] = "IN_PROGRESS"
+        self.evaluation_state["progress"] = progress
+        self.evaluation_state["simulation_count"] = self.simulation_count
+        self.evaluation_state["score"]["score"] = sum_normalized_reward
+        self.evaluation_state["score"]["score_secondary"] = mean_percentage_complete
+        self.evaluation_state["meta"]["normalized_reward"] = mean_normalized_reward
+        self.evaluation_state["meta"]["termination_cause"] = self.termination_cause
+        self.handle_aicrowd_info_event(self.evaluation_state)
+
+    def finish_last_episode(self):
+        # the results of every episode are merged when it is done
+        pass
+
+    def run(self):
+        """
+        Main runner function which routes the commands of the clients to the workers,
+        until all the episodes are done and the evaluation is submitted.
+        """
+        print("Listening at : ", self.command_channel)
+        self.start_workers()
+        try:
+            while True:
+                command = self.get_next_command()
+                if command is not None:
+                    try:
+                        if command['type'] == messages.FLATLAND_RL.PING:
+                            self.handle_ping(command)
+                        elif command['type'] == messages.FLATLAND_RL.ENV_CREATE:
+                            self.handle_env_create(command)
+                        elif command['type'] == messages.FLATLAND_RL.ENV_STEP:
+                            self.handle_env_step(command)
+                        elif command['type'] == messages.FLATLAND_RL.ENV_STEP_BATCH:
+                            self.handle_env_step_batch(command)
+                        elif command['type'] == messages.FLATLAND_RL.ENV_SUBMIT:
+                            self.pending_submits.append(command)
+                        else:
+                            _error = self._error_template("UNKNOWN_REQUEST:{}".format(str(command)))
+                            if "response_channel" in command:
+                                self.report_error(_error, command['response_channel'])
+                            return _error
+                    except Exception as e:
+                        print("Error : ", str(e))
+                        print(traceback.format_exc())
+                        if "response_channel" in command:
+                            self.report_error(self._error_template(str(e)), command['response_channel'])
+                        return self._error_template(str(e))
+
+                try:
+                    self.handle_worker_answers()
+                except Exception as e:
+                    print("Error : ", str(e))
+                    return self._error_template(str(e))
+                self.check_episode_timeouts()
+                self.assign_episodes()
+
+                all_assigned = self.simulation_count + 1 >= len(self.env_file_paths) or self.evaluation_done
+                if self.pending_submits and all_assigned and not self.episodes and not self.pending_creates:
+                    _command_response = self.handle_env_submit(self.pending_submits[0])
+                    for command in self.pending_submits[1:]:
+                        self.send_response(_command_response, command)
+                    return _command_response
+        finally:
+            self.stop_workers()
@@ -13,6 +13,8 @@ class FLATLAND_RL:
     ENV_STEP_RESPONSE = "FLATLAND_RL.ENV_STEP_RESPONSE"
     ENV_STEP_TIMEOUT = "FLATLAND_RL.ENV_STEP_TIMEOUT"
 
+    ENV_STEP_BATCH = "FLATLAND_RL.ENV_STEP_BATCH"
+
     ENV_SUBMIT = "FLATLAND_RL.ENV_SUBMIT"
     ENV_SUBMIT_RESPONSE = "FLATLAND_RL.ENV_SUBMIT_RESPONSE"
 
@@ -23,13 +23,14 @@ import timeout_decorator
 import flatland
 from flatland.core.env_observation_builder import DummyObservationBuilder
 from flatland.envs.agent_utils import RailAgentStatus
+from flatland.envs.episode_log import EpisodeRecorder
 from flatland.envs.malfunction_generators import malfunction_from_file
 from flatland.envs.rail_env import RailEnv
 from flatland.envs.rail_generators import rail_from_file
 from flatland.envs.schedule_generators import schedule_from_file
 from flatland.evaluators import aicrowd_helpers
 from flatland.evaluators import messages
-from flatland.utils.rendertools import RenderTool
+from flatland.utils.video_export import export_episode_frames
 from flatland.envs.rail_env_utils import load_flatland_environment_from_file
 from flatland.envs.persistence import RailEnvPersister
 
@@ -131,7 +132,8 @@ class FlatlandRemoteEvaluationService:
         shuffle=False,
         missing_only=False,
         result_output_path=None,
-        disable_timeouts=False
+        disable_timeouts=False,
+        stream_episodes=False
     ):
 
         # Episode recording properties
@@ -144,6 +146,8 @@ class FlatlandRemoteEvaluationService:
         self.merge_dir = merge_dir
         if merge_dir and not os.path.exists(self.merge_dir):
             os.makedirs(self.merge_dir)
+        # stream the episodes into episode logs in episode_dir instead of keeping them in memory
+        self.stream_episodes = stream_episodes
         self.use_pickle = use_pickle
         self.missing_only = missing_only
         self.episode_actions = []
@@ -227,7 +231,8 @@ class FlatlandRemoteEvaluationService:
 
         # RailEnv specific variables
         self.env = False
-        self.env_renderer = False
+        # episodes recorded for the video, rendered offline when the submission is evaluated
+        self.video_episode_files = []
         self.reward = 0
         self.simulation_done = True
         self.simulation_count = -1
@@ -518,6 +523,11 @@ class FlatlandRemoteEvaluationService:
                 amount of time (>5s in this case)
             """
             COMMAND_TIMEOUT = PER_STEP_TIMEOUT
+        elif self.previous_command['type'] == messages.FLATLAND_RL.ENV_STEP_BATCH:
+            """
+            The client performs all the steps of a batch locally before sending the next one
+            """
+            COMMAND_TIMEOUT = PER_STEP_TIMEOUT * max(len(self.previous_command['payload']['actions']), 1)
         elif self.previous_command['type'] == messages.FLATLAND_RL.ENV_SUBMIT:
             """
             If the user has already done an env_submit call, then the timeout 
@@ -546,6 +556,12 @@ class FlatlandRemoteEvaluationService:
             if self.verbose or self.report:
                 print("Command Service: ", command)
 
+        return self._decode_command(command)
+
+    def _decode_command(self, command):
+        """
+        Unpacks a command received on the command channel.
+        """
         if self.use_pickle:
             command = pickle.loads(command)
         else:
@@ -578,9 +594,10 @@ class FlatlandRemoteEvaluationService:
                 use_bin_type=True)
         _redis.rpush(command_response_channel, sResponse)
 
-    def send_error(self, error_dict, suppress_logs=False):
+    def send_error(self, error_dict, suppress_logs=False, error_channel=None):
         """ For out-of-band errors like timeouts,
             where we do not have a command, so we have no response channel!
+            They go to the error channel of the service, unless another `error_channel` is given.
         """
         _redis = self.get_redis_connection()
         print("Sending error : ", error_dict)
@@ -593,7 +610,7 @@ class FlatlandRemoteEvaluationService:
                 default=m.encode,
                 use_bin_type=True)
 
-        _redis.rpush(self.error_channel, sResponse)
+        _redis.rpush(error_channel or self.error_channel, sResponse)
 
     def handle_ping(self, command):
         """
@@ -678,13 +695,20 @@ class FlatlandRemoteEvaluationService:
             self.current_test = env_test
             self.current_level = env_level
 
+            # the previous episode may have timed out before it was saved
+            self.close_episode_recorder()
             del self.env
             self.env = RailEnv(width=1, height=1,
                                rail_generator=rail_from_file(test_env_file_path),
                                schedule_generator=schedule_from_file(test_env_file_path),
                                malfunction_generator_and_process_data=malfunction_from_file(test_env_file_path),
                                obs_builder_object=DummyObservationBuilder(),
-                               record_steps=True)
+                               record_steps=not self.stream_episodes or self.merge_dir is not None)
+            if self.stream_episodes and self.episode_dir is not None:
+                sfEpisodeLog = self.episode_dir + "/" + self.env_file_paths[self.simulation_count] + ".episode"
+                if not os.path.exists(os.path.dirname(sfEpisodeLog)):
+                    os.makedirs(os.path.dirname(sfEpisodeLog))
+                self.env.episode_recorder = EpisodeRecorder(sfEpisodeLog)
 
             self.begin_simulation = time.time()
 
@@ -717,13 +741,15 @@ class FlatlandRemoteEvaluationService:
             if self.visualize:
                 current_env_path = self.env_file_paths[self.simulation_count]
                 if current_env_path in self.video_generation_envs:
-                    self.env_renderer = RenderTool(self.env, gl="PILSVG", )
-                elif self.env_renderer:
-                    self.env_renderer = False
+                    # the frames are rendered from the recorded steps, see handle_env_submit
+                    self.env.record_steps = True
 
             _command_response = {}
             _command_response['type'] = messages.FLATLAND_RL.ENV_CREATE_RESPONSE
             _command_response['payload'] = {}
+            if isinstance(self.env.obs_builder, DummyObservationBuilder):
+                # the client computes its own observations, it only needs to know that the env exists
+                _observation = True
             _command_response['payload']['observation'] = _observation
             _command_response['payload']['env_file_path'] = self.env_file_paths[self.simulation_count]
             _command_response['payload']['info'] = _info
@@ -768,11 +794,51 @@ class FlatlandRemoteEvaluationService:
         TODO: Add a high level summary of everything thats happening here.
         """
 
-        if self.state_env_timed_out or self.evaluation_done:
-            print("Ignoring step command after timeout.")
-            return
+        _payload = command['payload']
+        if _payload.get('until_decision', False):
+            self._step_env_until_decision(_payload['action'], _payload['inference_time'])
+        else:
+            self._step_env(_payload['action'], _payload['inference_time'])
 
+    def handle_env_step_batch(self, command):
+        """
+        Handles a ENV_STEP_BATCH command from the client: the actions of
+        several consecutive steps, performed as if each came in an ENV_STEP.
+        The inference time of the message is spread evenly over its steps,
+        and the actions after the end of the episode are ignored.
+        """
         _payload = command['payload']
+        actions = _payload['actions']
+        inference_time = _payload['inference_time'] / max(len(actions), 1)
+        for i_step, action in enumerate(actions):
+            if i_step > 0 and self.simulation_done:
+                break
+            if not self._step_env(action, inference_time):
+                break
+
+    def _step_env_until_decision(self, action, inference_time):
+        """
+        Performs the steps of `RailEnv.step_until_decision` one by one with `_step_env`: a step with the actions of
+        the client, then steps without actions until a decision is required, as the client does on its env.
+        """
+        while True:
+            event_state = self.env._get_event_state()
+            if not self._step_env(action, inference_time):
+                return
+            if self.simulation_done or self.env._decision_required(event_state):
+                return
+            # no inference for the steps without actions
+            action, inference_time = {}, None
+
+    def _step_env(self, action, inference_time):
+        """
+        Performs a step of the env with the actions of the client and updates the episode statistics.
+        Returns False if the step was ignored because the episode timed out or the evaluation is over.
+        The inference time is None for the steps without actions of `_step_env_until_decision`.
+        """
+        if self.state_env_timed_out or self.evaluation_done:
+            print("Ignoring step command after timeout.")
+            return False
 
         if not self.env:
             raise Exception("env_client.step called before env_client.env_create() call")
@@ -791,18 +857,17 @@ class FlatlandRemoteEvaluationService:
 
             print("=" * 15)
             print(msg, "Evaluation will stop.")
-            return
+            return False
         # else:
         #     print("="*15)
         #     print("{}s left!".format(OVERALL_TIMEOUT - overall_elapsed))
 
-        action = _payload['action']
-        inference_time = _payload['inference_time']
         # We record this metric in two keys:
         #   - One for the current episode
         #   - One global
-        self.update_running_stats("current_episode_controller_inference_time", inference_time)
-        self.update_running_stats("controller_inference_time", inference_time)
+        if inference_time is not None:
+            self.update_running_stats("current_episode_controller_inference_time", inference_time)
+            self.update_running_stats("controller_inference_time", inference_time)
 
         # Perform the step
         time_start = time.time()
@@ -891,27 +956,31 @@ class FlatlandRemoteEvaluationService:
             if self.merge_dir is not None:
                 self.save_merged_env()
 
-        # Record Frame
-        if self.visualize:
+        # Record the episode for the video
+        if self.visualize and done["__all__"]:
             """
-            Only generate and save the frames for environments which are separately provided
+            Only record the episodes of the environments which are separately provided
             in video_generation_indices param
             """
             current_env_path = self.env_file_paths[self.simulation_count]
             if current_env_path in self.video_generation_envs:
-                self.env_renderer.render_env(
-                    show=False,
-                    show_observations=False,
-                    show_predictions=False,
-                    show_rowcols=False
-                )
-
-                self.env_renderer.gl.save_image(
-                    os.path.join(
-                        self.vizualization_folder_name,
-                        "flatland_frame_{:04d}.png".format(self.record_frame_step)
-                    ))
-                self.record_frame_step += 1
+                sfEpisode = os.path.join(self.vizualization_folder_name, "episodes",
+                                         "episode_{:04d}.pkl".format(self.simulation_count))
+                if not os.path.exists(os.path.dirname(sfEpisode)):
+                    os.makedirs(os.path.dirname(sfEpisode))
+                RailEnvPersister.save_episode(self.env, sfEpisode)
+                self.video_episode_files.append(sfEpisode)
+        return True
+
+    def render_video_frames(self):
+        """
+        Renders the frames of the recorded episodes in the visualization folder, in parallel processes.
+        """
+        for sfEpisode in self.video_episode_files:
+            frame_files = export_episode_frames(sfEpisode, self.vizualization_folder_name,
+                                                first_frame=self.record_frame_step)
+            self.record_frame_step += len(frame_files)
+        self.video_episode_files = []
 
     def save_actions(self):
         sfEnv = self.env_file_paths[self.simulation_count]
@@ -932,9 +1001,21 @@ class FlatlandRemoteEvaluationService:
         sfEnv = self.env_file_paths[self.simulation_count]
         sfEpisode = self.episode_dir + "/" + sfEnv
         print("env path: ", sfEnv, " sfEpisode:", sfEpisode)
+        if self.env.episode_recorder is not None:
+            # the steps are already in the episode log next to it
+            self.close_episode_recorder()
+            RailEnvPersister.save(self.env, sfEpisode)
+            return
         RailEnvPersister.save_episode(self.env, sfEpisode)
         # self.env.save_episode(sfEpisode)
 
+    def close_episode_recorder(self):
+        """
+        Writes the steps still buffered by the episode recorder of the current env, if any, and closes it.
+        """
+        if self.env and self.env.episode_recorder is not None:
+            self.env.episode_recorder.close()
+
     def save_merged_env(self):
         sfEnv = self.env_file_paths[self.simulation_count]
         sfMergeEnv = self.merge_dir + "/" + sfEnv
@@ -973,10 +1054,7 @@ class FlatlandRemoteEvaluationService:
                     self.stats[max_key]))
         print("=" * 100)
 
-        # Register simulation time of the last episode
-        self.simulation_times.append(time.time() - self.begin_simulation)
-        # Compute the evaluation metadata for the last episode
-        self.update_evaluation_metadata()
+        self.finish_last_episode()
 
         if len(self.simulation_rewards) != len(self.env_file_paths) and not self.evaluation_done:
             raise Exception(
@@ -987,7 +1065,9 @@ class FlatlandRemoteEvaluationService:
 
         mean_reward, mean_normalized_reward, sum_normalized_reward, mean_percentage_complete = self.compute_mean_scores()
 
-        if self.visualize and len(os.listdir(self.vizualization_folder_name)) > 0:
+        if self.visualize:
+            self.render_video_frames()
+        if self.visualize and self.record_frame_step > 0:
             # Generate the video
             #
             # Note, if you had depdency issues due to ffmpeg, you can
@@ -1070,6 +1150,15 @@ class FlatlandRemoteEvaluationService:
 
         return _command_response
 
+    def finish_last_episode(self):
+        """
+        Completes the statistics of the last episode, before the results are computed on submit.
+        """
+        # Register simulation time of the last episode
+        self.simulation_times.append(time.time() - self.begin_simulation)
+        # Compute the evaluation metadata for the last episode
+        self.update_evaluation_metadata()
+
     def compute_mean_scores(self):
         #################################################################################
         #################################################################################
@@ -1144,7 +1233,8 @@ class FlatlandRemoteEvaluationService:
                 command = self.get_next_command()
             except timeout_decorator.timeout_decorator.TimeoutError:
                 # a timeout occurred: send an error, and give -1.0 normalized score for this episode
-                if self.previous_command['type'] == messages.FLATLAND_RL.ENV_STEP:
+                if self.previous_command['type'] in [messages.FLATLAND_RL.ENV_STEP,
+                                                     messages.FLATLAND_RL.ENV_STEP_BATCH]:
                     self.send_error({"type": messages.FLATLAND_RL.ENV_STEP_TIMEOUT})
                     timeout_details = "step time limit of {}s".format(PER_STEP_TIMEOUT)
 
@@ -1170,6 +1260,7 @@ class FlatlandRemoteEvaluationService:
                 self.timeout_counter += 1
                 self.state_env_timed_out = True
                 self.simulation_done = True
+                self.close_episode_recorder()
 
                 if self.timeout_counter >= MAX_SUCCESSIVE_TIMEOUTS:
                     print("=" * 15)
@@ -1215,6 +1306,14 @@ class FlatlandRemoteEvaluationService:
                         Respond with updated [observation,reward,done,info] after step
                     """
                     self.handle_env_step(command)
+                elif command['type'] == messages.FLATLAND_RL.ENV_STEP_BATCH:
+                    """
+                        ENV_STEP_BATCH
+
+                        Request : Action dicts of several consecutive steps
+                        No response, as for ENV_STEP
+                    """
+                    self.handle_env_step_batch(command)
                 elif command['type'] == messages.FLATLAND_RL.ENV_SUBMIT:
                     """
                         ENV_SUBMIT
@@ -1322,11 +1421,30 @@ if __name__ == "__main__":
                         action="store_true",
                         help="verbose debug messages",
                         required=False)
+
+    parser.add_argument('--streamEpisodes',
+                        default=False,
+                        action="store_true",
+                        help="stream the episodes into binary episode logs in the episode dir",
+                        required=False)
+    parser.add_argument('--workers',
+                        type=int,
+                        default=None,
+                        help="evaluate this many episodes concurrently, in worker processes",
+                        required=False)
     args = parser.parse_args()
 
     test_folder = args.test_folder
 
-    grader = FlatlandRemoteEvaluationService(
+    service_class = FlatlandRemoteEvaluationService
+    service_kwargs = {}
+    if args.workers is not None:
+        from flatland.evaluators.concurrent_service import ConcurrentEvaluationService
+
+        service_class = ConcurrentEvaluationService
+        service_kwargs["n_workers"] = args.workers
+
+    grader = service_class(
         test_env_folder=test_folder,
         flatland_rl_service_id=args.service_id,
         verbose=args.verbose,
@@ -1339,7 +1457,9 @@ if __name__ == "__main__":
         use_pickle=args.pickle,
         shuffle=args.shuffle,
         missing_only=args.missingOnly,
-        disable_timeouts=args.disableTimeouts
+        disable_timeouts=args.disableTimeouts,
+        stream_episodes=args.streamEpisodes,
+        **service_kwargs
     )
     result = grader.run()
     if result['type'] == messages.FLATLAND_RL.ENV_SUBMIT_RESPONSE:
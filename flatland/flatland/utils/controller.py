@@ -6,10 +6,17 @@ from flatland.envs.rail_env import RailEnv
 from flatland.envs.rail_generators import complex_rail_generator, rail_from_file
 from flatland.envs.schedule_generators import complex_schedule_generator, schedule_from_file
 from flatland.envs.malfunction_generators import ParamMalfunctionGen,MalfunctionParameters,malfunction_from_file
+from flatland.envs.distance_map import DistanceMapCache, set_distance_map_cache
+from flatland.envs.agent_utils import RailAgentStatus
 
 from flatland.envs.rail_env import RailEnv
 from enum import IntEnum
+from types import MappingProxyType
+from typing import Mapping, NamedTuple, Optional, Tuple
 import time, os, sys, json, argparse, glob
+import multiprocessing
+import random
+import signal
 import numpy as np
 
 parser = argparse.ArgumentParser(description='Args for remote evaluation')
@@ -21,6 +28,14 @@ parser.add_argument('-q', type=int, default = 1,
                     help='Question type')      
 parser.add_argument('-o', type=str, default = None,
                     help='Output file')                
+parser.add_argument('-j', '--processes', type=int, default=1,
+                    help='Number of test cases evaluated in parallel, 0 for one per CPU')
+parser.add_argument('--timeout', type=float, default=None,
+                    help='Time limit in seconds for each planner call')
+parser.add_argument('--zero-copy', default=False, action="store_true",
+                    help='Give read-only views of the rail and agents to the planners instead of copies')
+parser.add_argument('--distance-map-cache', type=str, default=None,
+                    help='Directory caching the distance maps of the test cases across runs')
 
 class HiddenPrints:
     def __enter__(self):
@@ -47,10 +62,11 @@ def wprint(*args, **kwargs):
     print("[WARN] ",*args, file=sys.stderr, **kwargs)
 
 
-output_template = "{0:18} | {1:12} | {2:12} | {3:12} | {4:10} | {5:12} | {6:12} | {7:12} | {8:12} | {9:12}"
-csv_template = "{0},{1},{2},{3},{4},{5},{6},{7},{8},{9}\n"
+output_template = "{0:18} | {1:12} | {2:12} | {3:12} | {4:10} | {5:10} | {6:12} | {7:12} | {8:12} | {9:12} | {10:12}"
+csv_template = "{0},{1},{2},{3},{4},{5},{6},{7},{8},{9},{10}\n"
 
-output_header = output_template.format("Test case", "Total agents","Agents done", "DDLs met","Plan Time", "SIC", "Makespan","Penalty","Final SIC","P Score")
+output_header = output_template.format("Test case", "Total agents", "Agents done", "DDLs met", "Plan Time", "Copy Time",
+                                       "SIC", "Makespan", "Penalty", "Final SIC", "P Score")
 
 
 class Train_Actions(IntEnum):
@@ -144,219 +160,498 @@ def check_conflict(time_step,path_all,local_env: RailEnv, debug=False):
             conflict = True
     return conflict, failed_agents
 
-def evaluator(get_path, test_cases: list, debug: bool, visualizer: bool, question_type: int, 
-              ddl: list=None, ddl_scale: int=0.2, baseline_pscore = {}, save_pscore = None,  
-              penalty_scale=2, mute = False, write = None, replan = None):
-    statistics = []
-    runtimes = []
-    pscores = {}
+
+# Read-only snapshot of an agent handed to the planners in zero-copy mode, with the attributes of `EnvAgent`.
+# Positions are tuples, None when not set, and speed_data and malfunction_data are read-only mappings.
+AgentRecord = NamedTuple("AgentRecord", [("handle", int),
+                                         ("initial_position", Tuple[int, int]),
+                                         ("initial_direction", int),
+                                         ("position", Optional[Tuple[int, int]]),
+                                         ("direction", int),
+                                         ("target", Tuple[int, int]),
+                                         ("status", RailAgentStatus),
+                                         ("speed_data", Mapping),
+                                         ("malfunction_data", Mapping),
+                                         ("deadline", Optional[int])])
+
+
+def freeze_rail(rail):
+    """
+    Shallow copy of `rail` whose grid is a read-only view of the original grid.
+    """
+    frozen = copy.copy(rail)
+    frozen.grid = rail.grid.view()
+    frozen.grid.flags.writeable = False
+    return frozen
+
+
+def freeze_agents(agents) -> Tuple[AgentRecord, ...]:
+    """
+    Tuple of one read-only `AgentRecord` per agent, e.g. `agents[0].target`.
+    """
+    def frozen_position(position):
+        return tuple(int(x) for x in position) if position is not None else None
+
+    return tuple(AgentRecord(handle=agent.handle,
+                             initial_position=frozen_position(agent.initial_position),
+                             initial_direction=agent.initial_direction,
+                             position=frozen_position(agent.position),
+                             direction=agent.direction,
+                             target=frozen_position(agent.target),
+                             status=RailAgentStatus(agent.status),
+                             speed_data=MappingProxyType(dict(agent.speed_data)),
+                             malfunction_data=MappingProxyType(dict(agent.malfunction_data)),
+                             deadline=agent.deadline) for agent in agents)
+
+
+class PlannerTimeout(Exception):
+    pass
+
+
+def _raise_planner_timeout(signum, frame):
+    raise PlannerTimeout()
+
+
+def call_planner(timeout, planner, *args):
+    """
+    Call `planner` with `args`, raising `PlannerTimeout` if it runs longer than `timeout` seconds.
+    Without timeout the planner is called directly. The timer is signal based, so a timeout can only be set from
+    the main thread of a process.
+    """
+    if not timeout:
+        return planner(*args)
+    previous_handler = signal.signal(signal.SIGALRM, _raise_planner_timeout)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return planner(*args)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous_handler)
+
+
+def agent_columns(agents):
+    """
+    Status, position (-1, -1 when not on the grid), direction and remaining malfunction steps of all agents,
+    as arrays.
+    """
+    status = np.fromiter((agent.status for agent in agents), dtype=np.int8, count=len(agents))
+    positions = np.array([agent.position if agent.position is not None else (-1, -1) for agent in agents],
+                         dtype=np.int32).reshape(-1, 2)
+    directions = np.fromiter((agent.direction for agent in agents), dtype=np.int8, count=len(agents))
+    malfunction = np.fromiter((agent.malfunction_data["malfunction"] for agent in agents), dtype=np.int32,
+                              count=len(agents))
+    return status, positions, directions, malfunction
+
+
+def compile_paths(path_all, n_agents):
+    """
+    Planned positions of all agents as an (n_agents, longest path, 2) array padded with -1, and the path lengths.
+    """
+    path_lengths = np.zeros(n_agents, dtype=np.int32)
+    for agent_id, path in enumerate(path_all[:n_agents]):
+        path_lengths[agent_id] = len(path)
+    planned_positions = np.full((n_agents, max(1, path_lengths.max(initial=0)), 2), -1, dtype=np.int32)
+    for agent_id, path in enumerate(path_all[:n_agents]):
+        if len(path) > 0:
+            planned_positions[agent_id, :len(path)] = path
+    return planned_positions, path_lengths
+
+
+def recompile_paths(planned_positions, path_lengths, old_paths, new_paths):
+    """
+    Updates the output of `compile_paths` in place after a replan, rewriting only the rows of the agents whose path
+    changed. The position table is reallocated when a new path is longer than all previous ones.
+    """
+    n_agents = len(path_lengths)
+    changed = [agent_id for agent_id in range(n_agents)
+               if new_paths[agent_id] is not old_paths[agent_id] and new_paths[agent_id] != old_paths[agent_id]]
+    if not changed:
+        return planned_positions, path_lengths
+    for agent_id in changed:
+        path_lengths[agent_id] = len(new_paths[agent_id])
+    if path_lengths.max() > planned_positions.shape[1]:
+        widened = np.full((n_agents, path_lengths.max(), 2), -1, dtype=np.int32)
+        widened[:, :planned_positions.shape[1]] = planned_positions
+        planned_positions = widened
+    for agent_id in changed:
+        planned_positions[agent_id] = -1
+        if path_lengths[agent_id] > 0:
+            planned_positions[agent_id, :path_lengths[agent_id]] = new_paths[agent_id]
+    return planned_positions, path_lengths
+
+
+# move direction for a (row, column) step, indexed by the step + 1, -1 when the step is not a move
+_MOVE_DIRECTIONS = np.full((3, 3), -1, dtype=np.int8)
+_MOVE_DIRECTIONS[2, :] = Directions.SOUTH
+_MOVE_DIRECTIONS[0, :] = Directions.NORTH
+_MOVE_DIRECTIONS[1, 0] = Directions.WEST
+_MOVE_DIRECTIONS[1, 2] = Directions.EAST
+# action for a move direction relative to the current direction, as in get_action
+_TURN_ACTIONS = np.array([Train_Actions.FORWARD, Train_Actions.RIGHT, Train_Actions.FORWARD, Train_Actions.LEFT],
+                         dtype=np.int8)
+_TRAIN_ACTIONS = list(Train_Actions)
+
+
+def compiled_path_controller(time_step, planned_positions, path_lengths, status, positions, directions, debug=False):
+    """
+    Columnar version of `path_controller` on the output of `compile_paths` and `agent_columns`:
+    the actions of all agents are derived from one column of the planned positions.
+    """
+    n_agents = len(path_lengths)
+    if time_step == 0:
+        actions = np.where(path_lengths > 0, Train_Actions.FORWARD, Train_Actions.NOTHING).astype(np.int8)
+        return dict(enumerate(_TRAIN_ACTIONS[action] for action in actions.tolist())), n_agents == 0, False
+
+    actions = np.full(n_agents, Train_Actions.NOTHING, dtype=np.int8)
+    following = np.flatnonzero((time_step < path_lengths) & (status != 3))
+    inconsistent = False
+    if len(following) > 0:
+        next_positions = planned_positions[following, time_step]
+        delta = next_positions - positions[following]
+        rows, columns = delta[:, 0], delta[:, 1]
+        # the first check of get_action that holds decides the move, so rows are taken before columns
+        is_move = (np.abs(rows) == 1) | (np.abs(columns) == 1)
+        move_direction = np.where(np.abs(rows) == 1, _MOVE_DIRECTIONS[np.clip(rows + 1, 0, 2), 0],
+                                  _MOVE_DIRECTIONS[1, np.clip(columns + 1, 0, 2)])
+        following_actions = _TURN_ACTIONS[(move_direction - directions[following]) % 4]
+        stopped = (rows == 0) & (columns == 0)
+        following_actions[stopped] = Train_Actions.STOP
+        failed = ~is_move & ~stopped
+        following_actions[failed] = Train_Actions.STOP
+        # agents which have not departed yet, e.g. because of a malfunction, keep trying to enter the grid
+        departing = positions[following, 0] < 0
+        following_actions[departing] = Train_Actions.FORWARD
+        failed &= ~departing
+        actions[following] = following_actions
+        if failed.any():
+            inconsistent = True
+            if debug:
+                for agent_id in following[failed].tolist():
+                    eprint("Agent {} cannot reach location {} from location {}. Path is inconsistent."
+                           .format(agent_id, tuple(planned_positions[agent_id, time_step].tolist()),
+                                   tuple(positions[agent_id].tolist())))
+    return dict(enumerate(_TRAIN_ACTIONS[action] for action in actions.tolist())), len(following) == 0, inconsistent
+
+
+def find_conflicts(time_step, planned_positions, path_lengths, positions, debug=False):
+    """
+    Columnar version of `check_conflict`: the agents on the grid which are not at their planned position.
+    In debug mode, the agent occupying the planned cell is looked up in a cell occupancy index.
+    """
+    if time_step < planned_positions.shape[1]:
+        failed = (positions[:, 0] >= 0) & (path_lengths > time_step) & \
+                 np.any(positions != planned_positions[:, time_step], axis=1)
+    else:
+        failed = np.zeros(len(positions), dtype=bool)
+    failed_agents = np.flatnonzero(failed).tolist()
+
+    if debug and failed_agents:
+        # last agent on each cell, as in check_conflict
+        occupancy = {tuple(position): agent_id for agent_id, position in enumerate(positions.tolist())
+                     if position[0] >= 0}
+        for agent_id in failed_agents:
+            planned = tuple(planned_positions[agent_id, time_step].tolist())
+            conflict_id = occupancy.get(planned, -1)
+            if conflict_id == -1:
+                wprint("Agent {} failed to move to {} at timestep {}. Will call replan function if in question 3."
+                       .format(agent_id, planned, time_step))
+            else:
+                wprint("Agent {} have conflict when trying to reach {} at timestep {} with Agent {}. Will call replan "
+                       "function if in question 3.".format(agent_id, planned, time_step, conflict_id))
+    return len(failed_agents) > 0, failed_agents
+
+
+def generate_test_case_deadlines(local_env: RailEnv, ddl_scale: float = 0.2) -> list:
+    """
+    Deadlines of the agents of a test case, scaled by the expected delay of the malfunctions.
+    They are drawn with the `random` module, seed it for reproducible deadlines.
+    """
+    malfunction = local_env.malfunction_process_data
+    size = local_env.width + local_env.height
+    expected_delay = malfunction.malfunction_rate * size * ((malfunction.min_duration + malfunction.max_duration) / 2)
+    return local_env.generate_deadlines(ddl_scale,
+                                        group_size=max(1, len(local_env.agents) // 5),
+                                        malfunction_scale=(1 + expected_delay / size / 2))
+
+
+def evaluate_test_case(get_path, test_case: str, debug: bool, visualizer: bool, question_type: int,
+                       ddl_file: str = None, ddl_scale: int = 0.2, baseline_pscore={}, mute=False,
+                       replan=None, interactive=True, timeout=None, zero_copy=False):
+    """
+    Plan and run one test case, returns its statistics dict and the planning time in seconds.
+
+    With `interactive` set to False, there is no wait for the user nor pause between test cases.
+    A planner or replanner call which runs longer than `timeout` seconds is interrupted: its agents get empty
+    paths, a replan keeps the previous paths. The number of interrupted calls is kept in "planner_timeouts".
+
+    By default the planners get deep copies of the rail, the agents and the paths. With `zero_copy`, they get
+    the rail with a read-only grid (see `freeze_rail`) and the agents as read-only `AgentRecord` (see
+    `freeze_agents`) without copying them. The paths are not zero-copy: replanners get a shallow copy of each path,
+    as a list sharing the position tuples, since replanners extend slices of the existing paths with lists. The
+    planners must not modify the positions.
+    The time spent copying is not part of the planning time, it is kept in "copy_time" and reported in the
+    "Copy Time" column.
+    """
     if visualizer:
         from flatland.utils.rendertools import RenderTool, AgentRenderVariant
-    print(output_header, flush=True)
-    if write is not None:
-        out = open(write, "w+",1)
-    
-    for i, test_case in enumerate(test_cases):
-        test_name =  os.path.basename(os.path.dirname(test_case))+"/"+os.path.basename(test_case).replace(".pkl","")
+    test_name = os.path.basename(os.path.dirname(test_case)) + "/" + os.path.basename(test_case).replace(".pkl", "")
+    if debug:
+        print("Loading evaluation: {}".format(test_case))
+    local_env = RailEnv(width=1,
+                        height=1,
+                        rail_generator=rail_from_file(test_case),
+                        schedule_generator=schedule_from_file(test_case),
+                        # schedule_generator=schedule_from_file(test_case, ddl_test_case),
+                        remove_agents_at_target=True,
+                        malfunction_generator_and_process_data=malfunction_from_file(test_case)
+                        if question_type == 3 else None
+                        # Removes agents at the end of their journey to make space for others
+                        )
+
+    local_env.reset()
+
+    num_of_agents = local_env.get_num_agents()
+    statistic_dict = {"test_case": test_name, "No. of agents": local_env.get_num_agents(), "time_step": 0,
+                      "num_done": 0, "deadlines_met": 0, "sum_of_cost": 0, "done_percentage": 0, "all_done": False,
+                      "cost": [0] * num_of_agents, "penalty": [0] * num_of_agents, "sic_final": [0] * num_of_agents,
+                      "p": 0, "f": 0,
+                      "planner_timeouts": 0, "copy_time": 0}
+
+    if zero_copy:
+        frozen_rail = freeze_rail(local_env.rail)
+
+    def planner_input(value):
+        # copy of an input of the planners, the time spent is added to "copy_time"
+        copy_start = time.time()
+        if not zero_copy:
+            value = copy.deepcopy(value)
+        elif value is local_env.rail:
+            value = frozen_rail
+        elif value is local_env.agents:
+            value = freeze_agents(value)
+        else:
+            # paths are shallow copies: replanners extend slices of the existing paths with lists
+            value = [list(path) for path in value]
+        statistic_dict["copy_time"] += time.time() - copy_start
+        return value
+
+    # Initiate the renderer
+    if visualizer:
+        env_renderer = RenderTool(local_env,
+                                  show_debug=True,
+                                  screen_height=900,  # Adjust these parameters to fit your resolution
+                                  screen_width=900)  # Adjust these parameters to fit your resolution
+        env_renderer.render_env(show=True, show_observations=False, show_predictions=False)
+    path_all = []
+    start_t = time.time()
+    copy_time_before = statistic_dict["copy_time"]
+    if mute:
+        mute_print()
+    if question_type == 1:
+        agent_id = 0
+        agent = local_env.agents[agent_id]
+        try:
+            path = call_planner(timeout, get_path, agent.initial_position, agent.initial_direction, agent.target,
+                                planner_input(local_env.rail), local_env._max_episode_steps)
+        except PlannerTimeout:
+            path = []
+            statistic_dict["planner_timeouts"] += 1
+        path_all.append(tuple(path) if zero_copy else path[:])
         if debug:
-            print("Loading evaluation: {}".format(test_case))
-        local_env = RailEnv(width=1,
-                            height=1,
-                            rail_generator=rail_from_file(test_case),
-                            schedule_generator=schedule_from_file(test_case),
-                            # schedule_generator=schedule_from_file(test_case, ddl_test_case),
-                            remove_agents_at_target=True,
-                            malfunction_generator_and_process_data= malfunction_from_file(test_case) if question_type == 3 else None
-                            # Removes agents at the end of their journey to make space for others
-                            )
-
-        local_env.reset()
-
-        num_of_agents = local_env.get_num_agents()
-        statistic_dict = {"test_case": test_name,"No. of agents":local_env.get_num_agents(), "time_step": 0, "num_done": 0, "deadlines_met": 0, "sum_of_cost": 0, "done_percentage": 0,
-                          "all_done": False, "cost":[0] * num_of_agents,"penalty":[0]*num_of_agents,"sic_final":[0]*num_of_agents,"p":0,"f":0}
-
-        # Initiate the renderer
-        if visualizer:
-            env_renderer = RenderTool(local_env,
-                                      show_debug=True,
-                                      screen_height=900,  # Adjust these parameters to fit your resolution
-                                      screen_width=900)  # Adjust these parameters to fit your resolution
-            env_renderer.render_env(show=True, show_observations=False, show_predictions=False)
-        path_all = []
-        start_t = time.time()
-        if mute:
-            mute_print()
-        if question_type == 1:
-            agent_id = 0
+            print("Agent: {}, Path: {}".format(agent_id, path))
+    elif question_type == 2:
+        for agent_id in range(0, len(local_env.agents)):
             agent = local_env.agents[agent_id]
-            path = get_path(agent.initial_position, agent.initial_direction, agent.target, copy.deepcopy(local_env.rail), local_env._max_episode_steps)
-            path_all.append(path[:])
+            try:
+                path = call_planner(timeout, get_path, agent.initial_position, agent.initial_direction, agent.target,
+                                    planner_input(local_env.rail), agent_id, path_all[:], local_env._max_episode_steps)
+            except PlannerTimeout:
+                path = []
+                statistic_dict["planner_timeouts"] += 1
+            path_all.append(tuple(path) if zero_copy else path[:])
             if debug:
                 print("Agent: {}, Path: {}".format(agent_id, path))
-        elif question_type == 2:
+    elif question_type == 3:
+        if ddl_file:
+            deadlines = local_env.read_deadlines(ddl_file)
+        else:
+            deadlines = generate_test_case_deadlines(local_env, ddl_scale)
+            local_env.save_deadlines(test_case[:-4], deadlines)
+        local_env.set_deadlines(deadlines)
+
+        try:
+            path_all = call_planner(timeout, get_path, planner_input(local_env.agents), planner_input(local_env.rail),
+                                    local_env._max_episode_steps)
+            if zero_copy:
+                path_all = [tuple(path) for path in path_all]
+        except PlannerTimeout:
+            path_all = [[] for _ in local_env.agents]
+            statistic_dict["planner_timeouts"] += 1
+        if debug:
             for agent_id in range(0, len(local_env.agents)):
-                agent = local_env.agents[agent_id]
-                path = get_path(agent.initial_position, agent.initial_direction, agent.target, copy.deepcopy(local_env.rail), agent_id,
-                                path_all[:], local_env._max_episode_steps)
-                path_all.append(path[:])
-                if debug:
-                    print("Agent: {}, Path: {}".format(agent_id, path))
-        elif question_type == 3:
-            if ddl:
-                deadlines = local_env.read_deadlines(ddl[i])
-            else:
-                expected_delay = local_env.malfunction_process_data.malfunction_rate*(local_env.width+local_env.height)*((local_env.malfunction_process_data.min_duration+local_env.malfunction_process_data.max_duration)/2)
-                deadlines = local_env.generate_deadlines(ddl_scale, 
-                                                         group_size= max(1,len(local_env.agents)//5), 
-                                                         malfunction_scale=(1 + expected_delay/(local_env.width+local_env.height)/2 ))
-                local_env.save_deadlines(test_case[:-4], deadlines)
-            local_env.set_deadlines(deadlines)
-
-            path_all = get_path(copy.deepcopy(local_env.agents), copy.deepcopy(local_env.rail), local_env._max_episode_steps)
-            if debug:
-                for agent_id in range(0, len(local_env.agents)):
-                    print("Agent: {}, Path: {}".format(agent_id, path_all[agent_id]))
+                print("Agent: {}, Path: {}".format(agent_id, path_all[agent_id]))
 
-        else:
-            eprint("No such question type option.")
-            exit(1)
-        if mute:
-            unmute_print()
-        runtimes.append(round(time.time()-start_t,2))
-
-        replan_runtime = 0
-        time_step = 0
-        out_of_path = False
-        inconsistent = False
-        done = None
-        while time_step < local_env._max_episode_steps:
-            if out_of_path:
-                if debug:
-                    eprint("Reach last location in all paths. Current timestep: {}".format(time_step))
-                    eprint("Can't finish test {}.".format(test_case))
+    else:
+        eprint("No such question type option.")
+        exit(1)
+    if mute:
+        unmute_print()
+    runtime = round(time.time() - start_t - (statistic_dict["copy_time"] - copy_time_before), 2)
+    if statistic_dict["planner_timeouts"]:
+        wprint("Planner timed out on test {}.".format(test_case))
+
+    replan_runtime = 0
+    time_step = 0
+    out_of_path = False
+    inconsistent = False
+    done = None
+    # per agent bookkeeping as arrays
+    cost = np.zeros(num_of_agents, dtype=np.int64)
+    penalty = np.zeros(num_of_agents, dtype=np.int64)
+    if question_type == 3:
+        deadlines = np.array([agent.deadline if agent.deadline is not None else np.inf for agent in local_env.agents])
+        has_deadline = (deadlines != 0) & (deadlines != np.inf)
+    planned_positions, path_lengths = compile_paths(path_all, num_of_agents)
+    status, positions, directions, malfunction = agent_columns(local_env.agents)
+    while time_step < local_env._max_episode_steps:
+        if out_of_path:
+            if debug:
+                eprint("Reach last location in all paths. Current timestep: {}".format(time_step))
+                eprint("Can't finish test {}.".format(test_case))
+                if interactive:
                     eprint("Press Enter to move to next test:")
                     input()
-                break
+            break
 
-            if inconsistent:
-                if debug:
-                    wprint("Press Enter to continue:")
-                    input()
+        if inconsistent:
+            if debug and interactive:
+                wprint("Press Enter to continue:")
+                input()
 
-            action_dict, out_of_path, inconsistent = path_controller(time_step, local_env, path_all, debug)
-            statistic_dict["time_step"] = time_step
-
-
-            malfunction_before = [agent.malfunction_data["malfunction"]>0 and agent.status < 2 for agent in local_env.agents]
-            # execuate action
-            next_obs, all_rewards, done, _ = local_env.step(action_dict)
-
-            if visualizer:
-                env_renderer.render_env(show=True, show_observations=False, show_predictions=False)
-
-            # Find malfunction and failed execuation agents. Then call replan function.
-            if question_type == 3:
-                conflict = False
-                failed_agents = []
-                new_malfunctions = []
-                if time_step!=0:
-                    conflict, failed_agents = check_conflict(time_step, path_all, local_env, debug)
-                    if conflict:
-                        if debug:
-                            wprint("Press Enter to continue:")
-                            input()
-                for agent in local_env.agents:
-                    if agent.status !=3 and time_step >= len(path_all[agent.handle]):
-                        failed_agents.append(agent.handle)
-                    if agent.malfunction_data["malfunction"]>0 and agent.status < 2 and not malfunction_before[agent.handle]:
-                        new_malfunctions.append(agent.handle)
-                if len(new_malfunctions) != 0 or conflict:
-                    if debug:
-                        print("Find new malfunctions: ", new_malfunctions, " Find failed execuation agents: ", failed_agents)
-                        print("Call replan function... ...")
-                    replan_start = time.time()
-                    if mute:
-                        mute_print()
-                    new_paths = replan(copy.deepcopy(local_env.agents), copy.deepcopy(local_env.rail), time_step, copy.deepcopy(path_all), local_env._max_episode_steps, new_malfunctions, failed_agents)
-                    if mute:
-                        unmute_print()
-                    replan_runtime += round(time.time()-replan_start,2)
-                    path_all = new_paths
-
-
-            num_done = 0
-            new_cost = 0
-            num_deadlines_met = 0
-            for agent_id in range(0, len(local_env.agents)):
-                if local_env.agents[agent_id].status in [2,3] :
-                    num_done += 1
-                    if question_type == 3 and local_env.agents[agent_id].deadline:
-                        if statistic_dict["cost"][agent_id] <= local_env.agents[agent_id].deadline:
-                            num_deadlines_met += 1
-                    else:
-                        num_deadlines_met += 1
-                else:
-                    if question_type == 3 and time_step > local_env.agents[agent_id].deadline:
-                        statistic_dict["penalty"][agent_id]+=1
-                    statistic_dict["cost"][agent_id]+= 1
+        action_dict, out_of_path, inconsistent = compiled_path_controller(time_step, planned_positions, path_lengths,
+                                                                          status, positions, directions, debug)
+        statistic_dict["time_step"] = time_step
 
-            statistic_dict["num_done"] = num_done
-            statistic_dict["done_percentage"] = round(num_done / len(local_env.agents), 2)
-            statistic_dict["deadlines_met"] = num_deadlines_met
-
-            if debug:
-                time.sleep(0.2)
+        malfunction_before = (malfunction > 0) & (status < 2)
+        # execuate action
+        next_obs, all_rewards, done, _ = local_env.step(action_dict)
+        status, positions, directions, malfunction = agent_columns(local_env.agents)
 
+        if visualizer:
+            env_renderer.render_env(show=True, show_observations=False, show_predictions=False)
 
-            if (done["__all__"]):
-                statistic_dict["all_done"] = True
+        # Find malfunction and failed execuation agents. Then call replan function.
+        if question_type == 3:
+            conflict = False
+            failed_agents = []
+            new_malfunctions = []
+            if time_step != 0:
+                conflict, failed_agents = find_conflicts(time_step, planned_positions, path_lengths, positions, debug)
+                if conflict:
+                    if debug and interactive:
+                        wprint("Press Enter to continue:")
+                        input()
+            failed_agents += np.flatnonzero((status != 3) & (time_step >= path_lengths)).tolist()
+            new_malfunctions = np.flatnonzero((malfunction > 0) & (status < 2) & ~malfunction_before).tolist()
+            if len(new_malfunctions) != 0 or conflict:
                 if debug:
-                    print("All agents reach destination at timestep: {}.  Move to next test in 1 seconds ...".format(time_step))
+                    print("Find new malfunctions: ", new_malfunctions,
+                          " Find failed execuation agents: ", failed_agents)
+                    print("Call replan function... ...")
+                replan_start = time.time()
+                copy_time_before = statistic_dict["copy_time"]
+                if mute:
+                    mute_print()
+                try:
+                    new_paths = call_planner(timeout, replan, planner_input(local_env.agents),
+                                             planner_input(local_env.rail), time_step, planner_input(path_all),
+                                             local_env._max_episode_steps, new_malfunctions, failed_agents)
+                    if zero_copy:
+                        new_paths = [tuple(path) for path in new_paths]
+                except PlannerTimeout:
+                    new_paths = path_all
+                    statistic_dict["planner_timeouts"] += 1
+                if mute:
+                    unmute_print()
+                replan_runtime += round(time.time() - replan_start - (statistic_dict["copy_time"] - copy_time_before),
+                                        2)
+                planned_positions, path_lengths = recompile_paths(planned_positions, path_lengths, path_all, new_paths)
+                path_all = new_paths
+
+        is_done = (status == 2) | (status == 3)
+        num_done = int(np.count_nonzero(is_done))
+        if question_type == 3:
+            num_deadlines_met = int(np.count_nonzero(is_done & (~has_deadline | (cost <= deadlines))))
+            penalty[~is_done & (time_step > deadlines)] += 1
+        else:
+            num_deadlines_met = num_done
+        cost[~is_done] += 1
+
+        statistic_dict["num_done"] = num_done
+        statistic_dict["done_percentage"] = round(num_done / len(local_env.agents), 2)
+        statistic_dict["deadlines_met"] = num_deadlines_met
+
+        if debug and interactive:
+            time.sleep(0.2)
+
+        if (done["__all__"]):
+            statistic_dict["all_done"] = True
+            if debug:
+                print("All agents reach destination at timestep: {}.  Move to next test in 1 seconds ..."
+                      .format(time_step))
+            if interactive:
                 time.sleep(1)
-                break
-            time_step += 1
-        
-        runtimes[-1] += replan_runtime
-        # End of one episode. 
-        for agent_id in range(0, len(local_env.agents)):
-            if done[agent_id]:
-                statistic_dict["sum_of_cost"] += statistic_dict["cost"][agent_id]
-            else:
-                statistic_dict["sum_of_cost"] += local_env._max_episode_steps
-        statistic_dict["sic_final"] = statistic_dict["sum_of_cost"] + sum(statistic_dict["penalty"])
-        if question_type == 1:
-            statistic_dict["p"] = None
+            break
+        time_step += 1
+    
+    runtime += replan_runtime
+    statistic_dict["copy_time"] = round(statistic_dict["copy_time"], 2)
+    # End of one episode. 
+    statistic_dict["cost"] = cost.tolist()
+    statistic_dict["penalty"] = penalty.tolist()
+    for agent_id in range(0, len(local_env.agents)):
+        if done[agent_id]:
+            statistic_dict["sum_of_cost"] += statistic_dict["cost"][agent_id]
         else:
-            statistic_dict["p"] = int(statistic_dict["sic_final"]/num_of_agents)
-            if baseline_pscore:
-                statistic_dict["f"] =min(round(baseline_pscore[test_case]/statistic_dict["p"],2),1.0)
-        pscores[test_case] = statistic_dict["p"]
-        print(output_template.format(test_name, str(statistic_dict["No. of agents"]), str(statistic_dict["num_done"]),
-                                     str(statistic_dict["deadlines_met"]), str(runtimes[-1]),
-                                     str(statistic_dict["sum_of_cost"]), str(statistic_dict["time_step"]),
-                                     str(sum(statistic_dict["penalty"])),str(statistic_dict["sic_final"]),str(statistic_dict["p"])+("({})".format(statistic_dict["f"]) if baseline_pscore else "")
-                                     ),flush=True)
-        if write is not None:
-            out.write(csv_template.format(test_name, str(statistic_dict["No. of agents"]), str(statistic_dict["num_done"]),
-                                     str(statistic_dict["deadlines_met"]), str(runtimes[-1]),
-                                     str(statistic_dict["sum_of_cost"]), str(statistic_dict["time_step"]),
-                                     str(sum(statistic_dict["penalty"])),str(statistic_dict["sic_final"]),str(statistic_dict["p"])+("({})".format(statistic_dict["f"]) if baseline_pscore else "")
-                                     ))
-        statistics.append(statistic_dict)
+            statistic_dict["sum_of_cost"] += local_env._max_episode_steps
+    statistic_dict["sic_final"] = statistic_dict["sum_of_cost"] + sum(statistic_dict["penalty"])
+    if question_type == 1:
+        statistic_dict["p"] = None
+    else:
+        statistic_dict["p"] = int(statistic_dict["sic_final"]/num_of_agents)
+        if baseline_pscore:
+            statistic_dict["f"] = min(round(baseline_pscore[test_case] / statistic_dict["p"], 2), 1.0)
+    return statistic_dict, runtime
+
+
+def _test_case_fields(statistic_dict, runtime, baseline_pscore):
+    return (statistic_dict["test_case"], str(statistic_dict["No. of agents"]), str(statistic_dict["num_done"]),
+            str(statistic_dict["deadlines_met"]), str(runtime), str(statistic_dict["copy_time"]),
+            str(statistic_dict["sum_of_cost"]), str(statistic_dict["time_step"]),
+            str(sum(statistic_dict["penalty"])), str(statistic_dict["sic_final"]),
+            str(statistic_dict["p"]) + ("({})".format(statistic_dict["f"]) if baseline_pscore else ""))
 
 
+def _report_test_case(statistic_dict, runtime, baseline_pscore, out):
+    fields = _test_case_fields(statistic_dict, runtime, baseline_pscore)
+    print(output_template.format(*fields), flush=True)
+    if out is not None:
+        out.write(csv_template.format(*fields))
+
+
+def _report_summary(statistics, runtimes, pscores, question_type, baseline_pscore, save_pscore, out):
     count = 0
     sum_done_percent = 0
     sum_cost = 0
     num_done = 0
-    sum_make=0
+    sum_make = 0
     sum_agents = 0
     sum_penalty = 0
     sum_sic_final = 0
     sum_p = None
     sum_f = 0
-    sum_runtime = round(sum(runtimes),2)
+    sum_runtime = round(sum(runtimes), 2)
+    sum_copy_time = 0
     sum_ddl_met = 0
     for data in statistics:
         sum_done_percent += data["done_percentage"]
@@ -368,27 +663,96 @@ def evaluator(get_path, test_cases: list, debug: bool, visualizer: bool, questio
         sum_sic_final += data["sic_final"]
         sum_ddl_met += data["deadlines_met"]
         sum_f += data["f"]
-        count+=1
+        sum_copy_time += data["copy_time"]
+        count += 1
     if question_type == 1:
         sum_p = int(sum_cost/sum_agents)
         pscores["q1"] = sum_p
         if baseline_pscore:
-            sum_f = max(round(baseline_pscore["q1"]/sum_p,2),1.0)
+            sum_f = max(round(baseline_pscore["q1"] / sum_p, 2), 1.0)
     if save_pscore:
-        with open(save_pscore,"w+") as f:
+        with open(save_pscore, "w+") as f:
             f.write(json.dumps(pscores))
-    print(output_template.format("Summary", str(sum_agents)+" (sum)", str(num_done)+" (sum)", str(sum_ddl_met)+"(sum)",str(sum_runtime)+"(sum)",
-                                 str(sum_cost)+" (sum)", str(sum_make)+" (sum)", 
-                                 str(sum_penalty)+" (sum)",str(sum_sic_final)+" (sum)",str(sum_p)+" (final)"+(str(sum_f) if baseline_pscore else "")
-                                 ),flush=True)
-    if write is not None:
-        out.write(csv_template.format("Summary", str(sum_agents)+" (sum)", str(num_done)+" (sum)", str(sum_ddl_met)+"(sum)",str(sum_runtime)+"(sum)",
-                                 str(sum_cost)+" (sum)", str(sum_make)+" (sum)", 
-                                 str(sum_penalty)+" (sum)",str(sum_sic_final)+" (sum)",str(sum_p)+" (final)"+(str(sum_f) if baseline_pscore else "")
-                                 ))
+    fields = ("Summary", str(sum_agents) + " (sum)", str(num_done) + " (sum)", str(sum_ddl_met) + "(sum)",
+              str(sum_runtime) + "(sum)", str(round(sum_copy_time, 2)) + "(sum)", str(sum_cost) + " (sum)",
+              str(sum_make) + " (sum)",
+              str(sum_penalty) + " (sum)", str(sum_sic_final) + " (sum)",
+              str(sum_p) + " (final)" + (str(sum_f) if baseline_pscore else ""))
+    print(output_template.format(*fields), flush=True)
+    if out is not None:
+        out.write(csv_template.format(*fields))
         out.close()
+
+
+def evaluator(get_path, test_cases: list, debug: bool, visualizer: bool, question_type: int,
+              ddl: list = None, ddl_scale: int = 0.2, baseline_pscore={}, save_pscore=None,
+              penalty_scale=2, mute=False, write=None, replan=None, timeout=None, zero_copy=False):
+    statistics = []
+    runtimes = []
+    pscores = {}
+    print(output_header, flush=True)
+    out = None
+    if write is not None:
+        out = open(write, "w+", 1)
+
+    for i, test_case in enumerate(test_cases):
+        statistic_dict, runtime = evaluate_test_case(get_path, test_case, debug, visualizer, question_type,
+                                                     ddl[i] if ddl else None, ddl_scale, baseline_pscore, mute,
+                                                     replan, timeout=timeout, zero_copy=zero_copy)
+        runtimes.append(runtime)
+        pscores[test_case] = statistic_dict["p"]
+        _report_test_case(statistic_dict, runtime, baseline_pscore, out)
+        statistics.append(statistic_dict)
+
+    _report_summary(statistics, runtimes, pscores, question_type, baseline_pscore, save_pscore, out)
     if not mute:
         input("Press enter to exit:")
+    return statistics
+
+
+def _evaluate_test_case_in_worker(task):
+    # runs in a pool process: seed the deadline generation per test case, silence the planner
+    index, get_path, test_case, question_type, ddl_file, ddl_scale, baseline_pscore, replan, timeout, zero_copy = task
+    random.seed(index)
+    np.random.seed(index)
+    with HiddenPrints():
+        return evaluate_test_case(get_path, test_case, False, False, question_type, ddl_file, ddl_scale,
+                                  baseline_pscore, replan=replan, interactive=False, timeout=timeout,
+                                  zero_copy=zero_copy)
+
+
+def parallel_evaluator(get_path, test_cases: list, question_type: int, ddl: list = None, ddl_scale: int = 0.2,
+                       baseline_pscore={}, save_pscore=None, penalty_scale=2, write=None, replan=None,
+                       processes=None, timeout=None, zero_copy=False):
+    """
+    Same as `evaluator`, with the test cases run in a pool of `processes` worker processes (one per CPU by
+    default) and without debug output, visualization or waiting for the user.
+
+    Each planner and replanner call is interrupted after `timeout` seconds, see `evaluate_test_case`.
+    The rows, the CSV file and the summary are written in the order of `test_cases`, with the same format and
+    statistics as `evaluator`. Deadlines generated for test cases without deadline file are seeded by the index
+    of the test case.
+    """
+    statistics = []
+    runtimes = []
+    pscores = {}
+    print(output_header, flush=True)
+    out = None
+    if write is not None:
+        out = open(write, "w+", 1)
+
+    tasks = [(i, get_path, test_case, question_type, ddl[i] if ddl else None, ddl_scale, baseline_pscore, replan,
+              timeout, zero_copy) for i, test_case in enumerate(test_cases)]
+    with multiprocessing.Pool(processes, maxtasksperchild=1) as pool:
+        # imap yields the results in the order of the test cases
+        for test_case, (statistic_dict, runtime) in zip(test_cases, pool.imap(_evaluate_test_case_in_worker, tasks)):
+            runtimes.append(runtime)
+            pscores[test_case] = statistic_dict["p"]
+            _report_test_case(statistic_dict, runtime, baseline_pscore, out)
+            statistics.append(statistic_dict)
+
+    _report_summary(statistics, runtimes, pscores, question_type, baseline_pscore, save_pscore, out)
+    return statistics
 
 def remote_evaluator(get_path, args, replan=None):
     args = parser.parse_args(args[1:])
@@ -396,13 +760,30 @@ def remote_evaluator(get_path, args, replan=None):
     q =args.q
     tests = glob.glob("{}/level_*/test_*.pkl".format(path))
     tests.sort()
-    if q == 1:
-        evaluator(get_path,tests,False,False,1,mute = True,write=args.o)
+    if args.distance_map_cache:
+        set_distance_map_cache(DistanceMapCache(args.distance_map_cache))
+    if args.processes != 1:
+        processes = args.processes or None
+        if q == 1:
+            parallel_evaluator(get_path, tests, 1, write=args.o, processes=processes, timeout=args.timeout,
+                               zero_copy=args.zero_copy)
+        elif q == 2:
+            parallel_evaluator(get_path, tests, 2, write=args.o, processes=processes, timeout=args.timeout,
+                               zero_copy=args.zero_copy)
+        elif q == 3:
+            deadline_files = [test.replace(".pkl", ".ddl") for test in tests]
+            parallel_evaluator(get_path, tests, 3, deadline_files, penalty_scale=4, write=args.o, replan=replan,
+                               processes=processes, timeout=args.timeout, zero_copy=args.zero_copy)
+    elif q == 1:
+        evaluator(get_path, tests, False, False, 1, mute=True, write=args.o, timeout=args.timeout,
+                  zero_copy=args.zero_copy)
     elif q == 2:
-        evaluator(get_path,tests,False,False,2,mute = True,write=args.o)
+        evaluator(get_path, tests, False, False, 2, mute=True, write=args.o, timeout=args.timeout,
+                  zero_copy=args.zero_copy)
     elif q == 3:
-        deadline_files =  [test.replace(".pkl",".ddl") for test in tests]
-        evaluator(get_path,tests, False, False, 3, deadline_files,penalty_scale=4,mute = True, write=args.o, replan=replan)
+        deadline_files = [test.replace(".pkl", ".ddl") for test in tests]
+        evaluator(get_path, tests, False, False, 3, deadline_files, penalty_scale=4, mute=True, write=args.o,
+                  replan=replan, timeout=args.timeout, zero_copy=args.zero_copy)
 
 
 
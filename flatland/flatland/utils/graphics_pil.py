@@ -12,6 +12,9 @@ from flatland.utils.graphics_layer import GraphicsLayer
 
 from flatland.core.grid.rail_env_grid import RailEnvTransitions  # noqa: E402
 
+# Decoded png resources, by (package, resource)
+_png_cache = {}
+
 
 class PILGL(GraphicsLayer):
     # tk.Tk() must be a singleton!
@@ -70,6 +73,14 @@ class PILGL(GraphicsLayer):
 
         self.firstFrame = True
         self.old_background_image = (None, None, None)
+
+        # Incremental rendering: the last composited frame is kept, and only the pixel boxes drawn in since then
+        # (the dirty boxes) are composited again. begin_frame erases the boxes of the previous frame instead of
+        # clearing the whole agent and prediction layers.
+        self.incremental = False
+        self.frame_image = None
+        self.dirty_boxes = []
+        self.erase_boxes = []
         self.create_layers()
 
         self.font = ImageFont.load_default()
@@ -92,18 +103,18 @@ class PILGL(GraphicsLayer):
 
         if rebuild:
             # rebuild background_grid to control the visualisation of buildings, trees, mountains, lakes and river
-            self.background_grid = np.zeros(shape=(self.width, self.height))
-
-            # build base distance map (distance to targets)
-            for x in range(self.width):
-                for y in range(self.height):
-                    distance = int(np.ceil(np.sqrt(self.width ** 2.0 + self.height ** 2.0)))
-                    for rc in dTargets:
-                        r = rc[1]
-                        c = rc[0]
-                        d = int(np.floor(np.sqrt((x - r) ** 2 + (y - c) ** 2)) / 0.5)
-                        distance = min(d, distance)
-                    self.background_grid[x][y] = distance
+            # base distance map: twice the floor of the euclidean distance to the closest target,
+            # capped by the diagonal of the grid
+            distance = int(np.ceil(np.sqrt(self.width ** 2.0 + self.height ** 2.0)))
+            self.background_grid = np.full((self.width, self.height), distance, dtype=float)
+            if len(dTargets) > 0:
+                x = np.arange(self.width)[:, None]
+                y = np.arange(self.height)[None, :]
+                squared_distance = None
+                for r, c in set((rc[1], rc[0]) for rc in dTargets):
+                    d2 = (x - r) ** 2 + (y - c) ** 2
+                    squared_distance = d2 if squared_distance is None else np.minimum(squared_distance, d2)
+                np.minimum(self.background_grid, np.floor(np.sqrt(squared_distance)) / 0.5, out=self.background_grid)
 
             self.old_background_image = (dTargets, self.width, self.height)
 
@@ -122,6 +133,8 @@ class PILGL(GraphicsLayer):
         elif len(color) == 4:
             color = color[:3] + (opacity,)
         gPoints = np.stack([array(gX), -array(gY)]).T * self.nPixCell
+        if self.incremental:
+            self.add_dirty_box(layer, *gPoints.min(axis=0), *gPoints.max(axis=0), margin=linewidth)
         gPoints = list(gPoints.ravel())
         # the width here was self.linewidth - not really sure of the implications
         self.draws[layer].line(gPoints, fill=color, width=linewidth)
@@ -132,6 +145,8 @@ class PILGL(GraphicsLayer):
         gPoints = np.stack([np.atleast_1d(gX), -np.atleast_1d(gY)]).T * self.nPixCell
         for x, y in gPoints:
             self.draws[layer].rectangle([(x - r, y - r), (x + r, y + r)], fill=color, outline=color)
+            if self.incremental:
+                self.add_dirty_box(layer, x - r, y - r, x + r, y + r)
 
     def draw_image_xy(self, pil_img, xyPixLeftTop, layer=RAIL_LAYER, ):
 
@@ -153,6 +168,9 @@ class PILGL(GraphicsLayer):
             pil_mask = None
         
         self.layers[layer].paste(pil_img, xyPixLeftTop, pil_mask)
+        if self.incremental:
+            self.add_dirty_box(layer, xyPixLeftTop[0], xyPixLeftTop[1],
+                               xyPixLeftTop[0] + self.nPixCell, xyPixLeftTop[1] + self.nPixCell, margin=0)
 
     def draw_image_row_col(self, pil_img, rcTopLeft, layer=RAIL_LAYER, ):
         xyPixLeftTop = tuple((array(rcTopLeft) * self.nPixCell)[[1, 0]])
@@ -167,6 +185,15 @@ class PILGL(GraphicsLayer):
     def text(self, xPx, yPx, strText, layer=RAIL_LAYER):
         xyPixLeftTop = (xPx, yPx)
         self.draws[layer].text(xyPixLeftTop, strText, font=self.font, fill=(0, 0, 0, 255))
+        if self.incremental:
+            self.add_dirty_box(layer, *self.text_box(self.draws[layer], xyPixLeftTop, strText))
+
+    def text_box(self, draw, xyPixLeftTop, strText):
+        """ Pixel box (x0, y0, x1, y1) of strText drawn at xyPixLeftTop, also with Pillow < 8 (no textbbox). """
+        if hasattr(draw, "textbbox"):
+            return draw.textbbox(xyPixLeftTop, strText, font=self.font)
+        width, height = draw.textsize(strText, font=self.font)
+        return xyPixLeftTop[0], xyPixLeftTop[1], xyPixLeftTop[0] + width, xyPixLeftTop[1] + height
 
     def text_rowcol(self, rcTopLeft, strText, layer=AGENT_LAYER):
         xyPixLeftTop = tuple((array(rcTopLeft) * self.nPixCell)[[1, 0]])
@@ -179,10 +206,38 @@ class PILGL(GraphicsLayer):
         pass
 
     def begin_frame(self):
+        if self.incremental and self.frame_image is not None:
+            # Only erase what the previous frame drew in the agent and prediction layers
+            for box in self.erase_boxes:
+                for iLayer in [PILGL.AGENT_LAYER, PILGL.PREDICTION_PATH_LAYER]:
+                    self.layers[iLayer].paste((255, 255, 255, 0), box)
+            self.erase_boxes = []
+            return
         # Create a new agent layer
         self.create_layer(iLayer=PILGL.AGENT_LAYER, clear=True)
         self.create_layer(iLayer=PILGL.PREDICTION_PATH_LAYER, clear=True)
 
+    def set_incremental(self, incremental=True):
+        """ Switch incremental rendering on or off, see `alpha_composite_layers`. """
+        self.incremental = incremental
+        self.invalidate_frame()
+
+    def invalidate_frame(self):
+        """ The next composited frame is built from the whole layers. """
+        self.frame_image = None
+        self.dirty_boxes = []
+        self.erase_boxes = []
+
+    def add_dirty_box(self, iLayer, x0, y0, x1, y1, margin=1):
+        """ Mark the pixel box (x0, y0, x1, y1), extended by margin, as drawn in layer iLayer. """
+        box = (max(0, int(np.floor(x0 - margin))), max(0, int(np.floor(y0 - margin))),
+               min(self.widthPx, int(np.ceil(x1 + margin)) + 1), min(self.heightPx, int(np.ceil(y1 + margin)) + 1))
+        if box[0] >= box[2] or box[1] >= box[3]:
+            return
+        self.dirty_boxes.append(box)
+        if iLayer in (PILGL.AGENT_LAYER, PILGL.PREDICTION_PATH_LAYER):
+            self.erase_boxes.append(box)
+
     def show(self, block=False):
         #print("show() - ", self.__class__)
         pass
@@ -194,9 +249,23 @@ class PILGL(GraphicsLayer):
         pass
 
     def alpha_composite_layers(self):
+        if self.incremental and self.frame_image is not None:
+            # Composite the layers again in the dirty boxes only: those of this frame, and those of the previous
+            # frame which were erased by begin_frame
+            for box in self.dirty_boxes:
+                tile = self.layers[0].crop(box)
+                for img2 in self.layers[1:]:
+                    tile = Image.alpha_composite(tile, img2.crop(box))
+                self.frame_image.paste(tile, box)
+            self.dirty_boxes = list(self.erase_boxes)
+            return self.frame_image
+
         img = self.layers[0]
         for img2 in self.layers[1:]:
             img = Image.alpha_composite(img, img2)
+        if self.incremental:
+            self.frame_image = img if len(self.layers) > 1 else img.copy()
+            self.dirty_boxes = list(self.erase_boxes)
         return img
 
     def get_image(self):
@@ -222,6 +291,7 @@ class PILGL(GraphicsLayer):
     def clear_layer(self, iLayer=0, opacity=None):
         if opacity is None:
             opacity = 0 if iLayer > 0 else 255
+        self.invalidate_frame()
         self.layers[iLayer] = img = self.create_image(opacity)
         # We also need to maintain a Draw object for each layer
         self.draws[iLayer] = ImageDraw.Draw(img)
@@ -257,6 +327,13 @@ class PILSVG(PILGL):
     but for backward compatibility, and to not introduce any breaking changes at this point
     we are sticking to the legacy name of PILSVG (when in practice we are not using SVG anymore)
     """
+    # Images set by load_buildings, load_scenery, load_rail and load_agent; they do not depend on the size of the
+    # grid, so they are loaded once per class and shared, read-only, by all the renderers of that class.
+    TILE_ATLAS_ATTRIBUTES = ["lBuildings", "scenery", "scenery_d2", "scenery_d3", "scenery_water",
+                             "scenery_background_white", "pil_rail", "pil_rail_org", "station_colors",
+                             "cell_occupied", "pil_zug"]
+    _tile_atlases = {}
+
     def __init__(self, width, height, jupyter=False, screen_width=800, screen_height=600):
         oSuper = super()
         oSuper.__init__(width, height, jupyter, screen_width, screen_height)
@@ -264,10 +341,16 @@ class PILSVG(PILGL):
         self.lwAgents = []
         self.agents_prev = []
 
-        self.load_buildings()
-        self.load_scenery()
-        self.load_rail()
-        self.load_agent()
+        atlas = PILSVG._tile_atlases.get(type(self))
+        if atlas is None:
+            self.load_buildings()
+            self.load_scenery()
+            self.load_rail()
+            self.load_agent()
+            atlas = {name: getattr(self, name) for name in self.TILE_ATLAS_ATTRIBUTES}
+            PILSVG._tile_atlases[type(self)] = atlas
+        else:
+            self.__dict__.update(atlas)
 
     def process_events(self):
         time.sleep(0.001)
@@ -283,10 +366,14 @@ class PILSVG(PILGL):
         self.agents_prev = []
 
     def pil_from_png_file(self, package, resource):
-        bytestring = resource_bytes(package, resource)
-        with io.BytesIO(bytestring) as fIn:
-            pil_img = Image.open(fIn)
-            pil_img.load()
+        """ Decoded image of a png resource, cached: it must not be modified in place. """
+        pil_img = _png_cache.get((package, resource))
+        if pil_img is None:
+            bytestring = resource_bytes(package, resource)
+            with io.BytesIO(bytestring) as fIn:
+                pil_img = Image.open(fIn)
+                pil_img.load()
+            _png_cache[(package, resource)] = pil_img
         return pil_img
 
     def load_buildings(self):
@@ -30,7 +30,7 @@ class RenderTool(object):
     def __init__(self, env, gl="PGL", jupyter=False,
                  agent_render_variant=AgentRenderVariant.ONE_STEP_BEHIND,
                  show_debug=False, clear_debug_text=True, screen_width=800, screen_height=600,
-                 host="localhost", port=None):
+                 host="localhost", port=None, incremental=False):
 
         self.env = env
         self.frame_nr = 0
@@ -42,7 +42,7 @@ class RenderTool(object):
         if gl in ["PIL", "PILSVG", "PGL"]:
             self.renderer = RenderLocal(env, gl, jupyter,
                  agent_render_variant,
-                 show_debug, clear_debug_text, screen_width, screen_height)
+                 show_debug, clear_debug_text, screen_width, screen_height, incremental)
             self.gl = self.renderer.gl
         else:
             print("[", gl, "] not found, switch to PGL")
@@ -127,6 +127,10 @@ class RenderLocal(RenderBase):
         Uses two layers, layer 0 for rails (mostly static), layer 1 for agents etc (dynamic)
         The lower / rail layer 0 is only redrawn after set_new_rail() has been called.
         Created with a "GraphicsLayer" or gl - now either PIL or PILSVG
+
+        With incremental=True, the rail is drawn once and each frame only erases, redraws and composites
+        again the cells the agents left or entered (see PILGL.alpha_composite_layers), so that the time to
+        render a frame grows with the number of agents rather than with the size of the grid.
     """
     visit = recordtype("visit", ["rc", "iDir", "iDepth", "prev"])
 
@@ -143,7 +147,8 @@ class RenderLocal(RenderBase):
 
     def __init__(self, env, gl="PILSVG", jupyter=False,
                  agent_render_variant=AgentRenderVariant.ONE_STEP_BEHIND,
-                 show_debug=False, clear_debug_text=True, screen_width=800, screen_height=600):
+                 show_debug=False, clear_debug_text=True, screen_width=800, screen_height=600,
+                 incremental=False):
 
         self.env = env
         self.frame_nr = 0
@@ -165,6 +170,8 @@ class RenderLocal(RenderBase):
             self.gl = PGLGL(env.width, env.height, jupyter, screen_width=screen_width, screen_height=screen_height)
 
         self.new_rail = True
+        self.rail_rendered = False
+        self.gl.set_incremental(incremental)
         self.show_debug = show_debug
         self.clear_debug_text = clear_debug_text
         self.update_background()
@@ -198,6 +205,7 @@ class RenderLocal(RenderBase):
             eg when the rail has been regenerated, or updated in the editor.
         """
         self.new_rail = True
+        self.rail_rendered = False
 
     def plot_agents(self, targets=True, selected_agent=None):
         color_map = self.gl.get_cmap('hsv', lut=(len(self.env.agents) + 1))
@@ -576,7 +584,10 @@ class RenderLocal(RenderBase):
 
         env = self.env
 
-        self.render_rail()
+        # In incremental mode, the rail layer is kept from one frame to the next
+        if not (self.gl.incremental and self.rail_rendered):
+            self.render_rail()
+            self.rail_rendered = True
 
         # Draw each agent + its orientation + its target
         if show_agents:
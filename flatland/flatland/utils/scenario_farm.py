@@ -0,0 +1,230 @@
+"""
+Generation of large suites of test cases in parallel.
+
+A parameter grid is expanded into levels, one per combination of parameters, and each level into tests, one per seed.
+Each test case is generated with `sparse_rail_generator` and `sparse_schedule_generator` seeded by its seed only, so
+the suite does not depend on the number of processes nor on the order in which the test cases are generated.
+Test cases are written in the layout read by `controller.evaluator`: `level{L}_test_{T}.pkl` with the deadlines in
+`level{L}_test_{T}.ddl`, and indexed in a `manifest.json` with feasibility statistics.
+"""
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import time
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from flatland.core.env_observation_builder import DummyObservationBuilder
+from flatland.envs.malfunction_generators import MalfunctionParameters, malfunction_from_params
+from flatland.envs.persistence import RailEnvPersister
+from flatland.envs.rail_env import RailEnv
+from flatland.envs.rail_generators import sparse_rail_generator
+from flatland.envs.schedule_generators import sparse_schedule_generator
+from flatland.utils.controller import generate_test_case_deadlines
+
+MANIFEST_FILENAME = "manifest.json"
+
+
+class ScenarioParameters(NamedTuple):
+    width: int
+    height: int
+    max_num_cities: int
+    number_of_agents: int
+    malfunction_rate: float = 0.
+    min_duration: int = 0
+    max_duration: int = 0
+    max_rails_between_cities: int = 2
+    max_rails_in_city: int = 3
+
+
+class Scenario(NamedTuple):
+    level: int
+    test: int
+    seed: int
+    parameters: ScenarioParameters
+
+    @property
+    def name(self) -> str:
+        return "level{}_test_{}".format(self.level, self.test)
+
+
+def scenario_grid(grid: Dict[str, Sequence], seeds: Sequence[int]) -> List[Scenario]:
+    """
+    Expands a parameter grid into scenarios.
+
+    Parameters
+    ----------
+    grid : dict
+        Values of the fields of `ScenarioParameters`; a single value or a sequence of values per field.
+        The fields without default values are required.
+    seeds : sequence of int
+        Seeds of the tests of every level, positive.
+
+    Returns
+    -------
+    List[Scenario]
+        The scenarios, level by level in the order of the product of the values, then test by test.
+    """
+    unknown = set(grid) - set(ScenarioParameters._fields)
+    if unknown:
+        raise ValueError("Unknown scenario parameters: {}".format(", ".join(sorted(unknown))))
+    if any(seed <= 0 for seed in seeds):
+        raise ValueError("Seeds must be positive, RailEnv does not seed itself with 0")
+    fields = [field for field in ScenarioParameters._fields if field in grid]
+    values = [grid[field] if isinstance(grid[field], (list, tuple)) else [grid[field]] for field in fields]
+    scenarios = []
+    for level, combination in enumerate(itertools.product(*values)):
+        parameters = ScenarioParameters(**dict(zip(fields, combination)))
+        for test, seed in enumerate(seeds):
+            scenarios.append(Scenario(level, test, seed, parameters))
+    return scenarios
+
+
+def create_scenario_env(scenario: Scenario) -> RailEnv:
+    """
+    The environment of a scenario, reset with the scenario seed.
+    """
+    parameters = scenario.parameters
+    malfunction = MalfunctionParameters(parameters.malfunction_rate, parameters.min_duration, parameters.max_duration)
+    env = RailEnv(width=parameters.width,
+                  height=parameters.height,
+                  rail_generator=sparse_rail_generator(max_num_cities=parameters.max_num_cities,
+                                                       grid_mode=False,
+                                                       max_rails_between_cities=parameters.max_rails_between_cities,
+                                                       max_rails_in_city=parameters.max_rails_in_city,
+                                                       seed=scenario.seed),
+                  schedule_generator=sparse_schedule_generator(seed=scenario.seed),
+                  number_of_agents=parameters.number_of_agents,
+                  obs_builder_object=DummyObservationBuilder(),
+                  malfunction_generator_and_process_data=malfunction_from_params(malfunction),
+                  remove_agents_at_target=True,
+                  random_seed=scenario.seed)
+    env.reset(random_seed=scenario.seed)
+    return env
+
+
+def generate_scenario(scenario: Scenario, out_dir: str, ddl_scale: float = 0.2) -> dict:
+    """
+    Generates a test case and its deadlines in `out_dir`.
+
+    A test case where an agent cannot reach its target is not written, it is only reported as infeasible.
+    Errors of the generators are reported in the entry instead of being raised.
+
+    Returns
+    -------
+    dict
+        The manifest entry of the test case.
+    """
+    entry = {"name": scenario.name, "level": scenario.level, "test": scenario.test, "seed": scenario.seed,
+             "parameters": scenario.parameters._asdict(), "status": "ok", "test_case": None, "deadlines": None}
+    start = time.time()
+    try:
+        env = create_scenario_env(scenario)
+        entry.update(_feasibility(env))
+        if entry["unreachable_agents"] > 0:
+            entry["status"] = "infeasible"
+        else:
+            random.seed(scenario.seed)
+            deadlines = generate_test_case_deadlines(env, ddl_scale)
+            distances = _shortest_distances(env)
+            slack = np.array(deadlines) - distances
+            entry.update({"min_deadline_slack": int(slack.min()) if len(slack) else 0,
+                          "deadlines_after_episode_end": int(np.sum(np.array(deadlines) > env._max_episode_steps))})
+
+            filename = os.path.join(out_dir, scenario.name)
+            RailEnvPersister.save(env, filename + ".pkl")
+            env.save_deadlines(filename, deadlines)
+            entry["test_case"] = scenario.name + ".pkl"
+            entry["deadlines"] = scenario.name + ".ddl"
+    except Exception as e:
+        entry["status"] = "error"
+        entry["error"] = "{}: {}".format(type(e).__name__, e)
+    entry["generation_time"] = round(time.time() - start, 3)
+    return entry
+
+
+def _shortest_distances(env: RailEnv) -> np.ndarray:
+    distance_map = env.distance_map.get()
+    return np.array([distance_map[agent.handle][agent.initial_position + (agent.direction,)]
+                     for agent in env.agents])
+
+
+def _feasibility(env: RailEnv) -> dict:
+    distances = _shortest_distances(env)
+    reachable = distances[np.isfinite(distances)]
+    stats = {"number_of_agents": len(env.agents),
+             "unreachable_agents": int(len(distances) - len(reachable)),
+             "max_episode_steps": env._max_episode_steps}
+    if len(reachable) > 0:
+        stats.update({"min_distance": int(reachable.min()),
+                      "mean_distance": round(float(reachable.mean()), 2),
+                      "max_distance": int(reachable.max()),
+                      "distances_after_episode_end": int(np.sum(reachable > env._max_episode_steps))})
+    return stats
+
+
+def _generate_scenario_in_worker(task):
+    return generate_scenario(*task)
+
+
+def generate_scenarios(scenarios: Sequence[Scenario], out_dir: str, ddl_scale: float = 0.2,
+                       processes: Optional[int] = None, verbose: bool = True) -> dict:
+    """
+    Generates the test cases of the scenarios in a process pool and writes their manifest in `out_dir`.
+
+    Parameters
+    ----------
+    scenarios : sequence of Scenario
+        See `scenario_grid`.
+    out_dir : str
+        Directory of the test cases, created if needed.
+    ddl_scale : float
+        Deadline scale, as in `controller.evaluator`.
+    processes : int, optional
+        Number of processes, one per CPU if not given; 1 generates in this process.
+    verbose : bool
+        Print a line per generated test case.
+
+    Returns
+    -------
+    dict
+        The manifest: the entries of the test cases, ordered by level and test, and a summary.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    tasks = [(scenario, out_dir, ddl_scale) for scenario in scenarios]
+    start = time.time()
+    if processes == 1:
+        entries = _collect(map(_generate_scenario_in_worker, tasks), len(tasks), verbose)
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            entries = _collect(pool.imap_unordered(_generate_scenario_in_worker, tasks), len(tasks), verbose)
+    entries.sort(key=lambda entry: (entry["level"], entry["test"]))
+
+    statuses = [entry["status"] for entry in entries]
+    manifest = {"ddl_scale": ddl_scale,
+                "summary": {"test_cases": len(entries),
+                            "ok": statuses.count("ok"),
+                            "infeasible": statuses.count("infeasible"),
+                            "error": statuses.count("error"),
+                            "generation_time": round(time.time() - start, 3)},
+                "test_cases": entries}
+    with open(os.path.join(out_dir, MANIFEST_FILENAME), "w") as file_out:
+        json.dump(manifest, file_out, indent=1)
+    return manifest
+
+
+def _collect(results, n_tasks, verbose) -> List[dict]:
+    entries = []
+    for entry in results:
+        entries.append(entry)
+        if verbose:
+            print("[{}/{}] {}: {}".format(len(entries), n_tasks, entry["name"], entry["status"]))
+    return entries
+
+
+def load_manifest(out_dir: str) -> dict:
+    with open(os.path.join(out_dir, MANIFEST_FILENAME)) as file_in:
+        return json.load(file_in)
@@ -0,0 +1,212 @@
+"""
+Offline rendering of recorded episodes into image sequences and videos.
+
+An episode is read from a file written by `RailEnvPersister.save_episode` (the steps recorded with `record_steps`),
+or from an environment file written by `RailEnvPersister.save` next to the episode log streamed by `EpisodeRecorder`
+(`<filename>.episode`). The frames are rendered from the static rail and the agent states of each step, in worker
+processes which each render a run of consecutive steps with an incremental `RenderTool`, and are either written as
+png files or streamed in order to an encoder process over a pipe.
+"""
+import multiprocessing
+import os
+import subprocess
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+
+from flatland.envs.agent_utils import RailAgentStatus
+from flatland.envs.episode_log import EpisodeReader
+from flatland.envs.persistence import RailEnvPersister
+from flatland.utils.graphics_pil import PILSVG
+from flatland.utils.rendertools import RenderTool
+
+FRAME_FILENAME = "flatland_frame_{:04d}.png"
+
+
+def load_episode_steps(filename: str) -> np.ndarray:
+    """
+    The agent states of a recorded episode, as an int array of shape (steps, agents, 4) holding the row, column,
+    direction and malfunction of every agent after every step; the row and column are -1 when the agent is not on
+    the grid.
+    """
+    if os.path.exists(filename + ".episode"):
+        reader = EpisodeReader(filename + ".episode")
+        steps = np.zeros((len(reader), reader.n_agents, 4), dtype=np.int64)
+        steps[:, :, 0:2] = reader.steps["position"]
+        steps[:, :, 2] = reader.steps["direction"]
+        steps[:, :, 3] = reader.steps["malfunction"]
+        return steps
+
+    env_dict = RailEnvPersister.load_env_dict(filename)
+    episode = env_dict.get("episode")
+    if not episode:
+        raise ValueError("{} holds no recorded episode".format(filename))
+    steps = np.array(episode, dtype=np.int64).reshape(len(episode), -1, 4)
+    # record_steps writes (0, 0) for the agents which are not on the grid
+    grid = np.array(env_dict["grid"])
+    off_grid = grid[steps[:, :, 0], steps[:, :, 1]] == 0
+    steps[off_grid, 0:2] = -1
+    return steps
+
+
+class _EpisodeRenderer:
+    """ Renders the steps of an episode, keeping the renderer between consecutive steps. """
+
+    def __init__(self, filename: str, gl: str, screen_size: int):
+        self.env, _ = RailEnvPersister.load_new(filename)
+        self.steps = load_episode_steps(filename)
+        self.renderer = RenderTool(self.env, gl=gl, screen_width=screen_size, screen_height=screen_size,
+                                   incremental=True)
+        self.last_step = None
+
+    def _set_agents(self, step: int):
+        previous = self.steps[step - 1] if step > 0 else None
+        for handle, agent in enumerate(self.env.agents):
+            row, column, direction, malfunction = self.steps[step, handle].tolist()
+            on_grid = row >= 0
+            agent.position = (row, column) if on_grid else None
+            agent.direction = direction
+            agent.malfunction_data["malfunction"] = malfunction
+            agent.status = RailAgentStatus.ACTIVE if on_grid else RailAgentStatus.READY_TO_DEPART
+            if previous is not None and previous[handle, 0] >= 0:
+                agent.old_position = tuple(previous[handle, 0:2].tolist())
+                agent.old_direction = int(previous[handle, 2])
+            else:
+                agent.old_position = None
+                agent.old_direction = direction
+
+    def render(self, step: int) -> np.ndarray:
+        if self.last_step is None or step != self.last_step + 1:
+            self.renderer.reset()
+        self._set_agents(step)
+        self.renderer.render_env(show=False, show_observations=False, show_predictions=False)
+        self.last_step = step
+        return self.renderer.get_image()
+
+
+# Renderer of the worker process, kept across the runs of steps of the same episode
+_worker_renderer: Optional[Tuple[Tuple[str, str, int], _EpisodeRenderer]] = None
+
+
+def _render_steps(task) -> List[np.ndarray]:
+    global _worker_renderer
+    filename, gl, screen_size, steps, out_dir, first_frame = task
+    key = (filename, gl, screen_size)
+    if _worker_renderer is None or _worker_renderer[0] != key:
+        _worker_renderer = (key, _EpisodeRenderer(filename, gl, screen_size))
+    renderer = _worker_renderer[1]
+    frames = []
+    for step in steps:
+        frame = renderer.render(step)
+        if out_dir is None:
+            frames.append(frame)
+        else:
+            Image.fromarray(frame).save(os.path.join(out_dir, FRAME_FILENAME.format(first_frame + step)))
+    return frames
+
+
+def _load_tiles(gl: str):
+    # Loaded before the pool is created, the tile atlas is inherited by forked workers
+    if gl in ["PILSVG", "PGL"]:
+        PILSVG(1, 1)
+
+
+def _tasks(filename: str, n_steps: int, gl: str, screen_size: int, chunk_size: int, out_dir: Optional[str] = None,
+           first_frame: int = 0):
+    return [(filename, gl, screen_size, range(start, min(start + chunk_size, n_steps)), out_dir, first_frame)
+            for start in range(0, n_steps, chunk_size)]
+
+
+def iter_episode_frames(filename: str, processes: Optional[int] = None, chunk_size: int = 16, gl: str = "PILSVG",
+                        screen_size: int = 800) -> Iterator[np.ndarray]:
+    """
+    The frames of a recorded episode in step order, as RGBA arrays, rendered in a pool of `processes` processes
+    (one per CPU by default, 1 renders in this process) by runs of `chunk_size` steps.
+    """
+    tasks = _tasks(filename, len(load_episode_steps(filename)), gl, screen_size, chunk_size)
+    if processes == 1:
+        for task in tasks:
+            yield from _render_steps(task)
+        return
+    _load_tiles(gl)
+    with multiprocessing.Pool(processes) as pool:
+        for frames in pool.imap(_render_steps, tasks):
+            yield from frames
+
+
+def export_episode_frames(filename: str, out_dir: str, processes: Optional[int] = None, chunk_size: int = 16,
+                          gl: str = "PILSVG", screen_size: int = 800, first_frame: int = 0) -> List[str]:
+    """
+    Renders a recorded episode as png files `flatland_frame_<nnnn>.png` in `out_dir`, numbered from `first_frame`.
+    The workers write the files themselves, so the frames do not go through this process.
+
+    Returns
+    -------
+    List[str]
+        The files written, in step order.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    n_steps = len(load_episode_steps(filename))
+    tasks = _tasks(filename, n_steps, gl, screen_size, chunk_size, out_dir, first_frame)
+    if processes == 1:
+        for task in tasks:
+            _render_steps(task)
+    else:
+        _load_tiles(gl)
+        with multiprocessing.Pool(processes) as pool:
+            pool.map(_render_steps, tasks)
+    return [os.path.join(out_dir, FRAME_FILENAME.format(first_frame + step)) for step in range(n_steps)]
+
+
+def export_episode_video(filename: str, output: str, fps: int = 7, processes: Optional[int] = None,
+                         chunk_size: int = 16, gl: str = "PILSVG", screen_size: int = 800,
+                         encoder_command: Optional[Sequence[str]] = None) -> str:
+    """
+    Renders a recorded episode and streams the raw RGBA frames to an encoder process over its standard input.
+
+    Parameters
+    ----------
+    filename : str
+        The recorded episode, see `load_episode_steps`.
+    output : str
+        The video file.
+    encoder_command : Sequence[str], optional
+        Command of the encoder, formatted with `width`, `height`, `fps` and `output`; ffmpeg encoding to H.264
+        by default.
+
+    Returns
+    -------
+    str
+        The video file.
+
+    Raises
+    ------
+    ValueError
+        If the episode has no recorded step.
+    """
+    if encoder_command is None:
+        encoder_command = ["ffmpeg", "-y", "-loglevel", "error", "-f", "rawvideo", "-pix_fmt", "rgba",
+                           "-s", "{width}x{height}", "-r", "{fps}", "-i", "-",
+                           "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", "-c:v", "libx264", "-pix_fmt", "yuv420p",
+                           "{output}"]
+    encoder = None
+    try:
+        for frame in iter_episode_frames(filename, processes, chunk_size, gl, screen_size):
+            if encoder is None:
+                height, width = frame.shape[:2]
+                command = [part.format(width=width, height=height, fps=fps, output=output)
+                           for part in encoder_command]
+                encoder = subprocess.Popen(command, stdin=subprocess.PIPE)
+            encoder.stdin.write(np.ascontiguousarray(frame).tobytes())
+    except BaseException:
+        if encoder is not None:
+            encoder.kill()
+        raise
+    if encoder is None:
+        raise ValueError("{} holds no recorded step to encode".format(filename))
+    encoder.stdin.close()
+    return_code = encoder.wait()
+    if return_code != 0:
+        raise Exception("Encoder {} failed with return code {}".format(encoder_command[0], return_code))
+    return output
@@ -63,7 +63,8 @@ setup(
     entry_points={
         'console_scripts': [
             'flatland-demo=flatland.cli:demo',
-            'flatland-evaluator=flatland.cli:evaluator'
+            'flatland-evaluator=flatland.cli:evaluator',
+            'flatland-scenario-farm=flatland.cli:scenario_farm'
         ],
     },
     install_requires=requirements,
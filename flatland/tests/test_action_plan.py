@@ -85,6 +85,11 @@ def test_action_plan(rendering: bool = False):
     deterministic_controller = ControllerFromTrainruns(env, chosen_path_dict)
     deterministic_controller.print_action_plan()
     ControllerFromTrainruns.assert_actions_plans_equal(expected_action_plan, deterministic_controller.action_plan)
+    for agent_id, plan in enumerate(expected_action_plan):
+        scheduled = {element.scheduled_at: element.action for element in plan}
+        for step in range(-1, 25):
+            assert deterministic_controller.get_action_at_step(agent_id, step) == scheduled.get(step)
+    assert deterministic_controller.act(3) == {0: RailEnvActions.STOP_MOVING, 1: RailEnvActions.MOVE_FORWARD}
     if rendering:
         renderer = RenderTool(env, gl="PILSVG",
                               agent_render_variant=AgentRenderVariant.AGENT_SHOWS_OPTIONS_AND_BOX,
@@ -98,3 +103,38 @@ def test_action_plan(rendering: bool = False):
             renderer.render_env(show=True, show_observations=False, show_predictions=False)
 
     ControllerFromTrainrunsReplayer.replay_verify(deterministic_controller, env, call_back=render)
+
+
+def test_action_plan_update_trainruns():
+    """Tests that replacing the train run of one agent only changes its row of the compiled action plan."""
+    rail, rail_map = make_simple_rail()
+    env = RailEnv(width=rail_map.shape[1],
+                  height=rail_map.shape[0],
+                  rail_generator=rail_from_grid_transition_map(rail),
+                  schedule_generator=random_schedule_generator(seed=77),
+                  number_of_agents=2,
+                  obs_builder_object=GlobalObsForRailEnv(),
+                  remove_agents_at_target=True
+                  )
+    env.reset()
+    for agent in env.agents:
+        agent.initial_position = (3, 0)
+        agent.initial_direction = Grid4TransitionsEnum.WEST
+        agent.target = (3, 3)
+    env.reset(False, False, False)
+
+    def trainrun(delay):
+        return [TrainrunWaypoint(scheduled_at=0, waypoint=Waypoint(position=(3, 0), direction=3)),
+                TrainrunWaypoint(scheduled_at=2 + delay, waypoint=Waypoint(position=(3, 1), direction=1)),
+                TrainrunWaypoint(scheduled_at=3 + delay, waypoint=Waypoint(position=(3, 2), direction=1)),
+                TrainrunWaypoint(scheduled_at=4 + delay, waypoint=Waypoint(position=(3, 3), direction=1))]
+
+    controller = ControllerFromTrainruns(env, {0: trainrun(0), 1: trainrun(0)})
+    row = controller.action_table[0].copy()
+    controller.update_trainruns({1: trainrun(30)})
+
+    assert (controller.action_table[0, :len(row)] == row).all()
+    assert controller.action_plan[1] == ControllerFromTrainruns(env, {0: trainrun(30), 1: trainrun(30)}).action_plan[1]
+    for element in controller.action_plan[1]:
+        assert controller.get_action_at_step(1, element.scheduled_at) == element.action
+    assert controller.act(32) == {1: RailEnvActions.MOVE_FORWARD}
@@ -2,11 +2,14 @@ import numpy as np
 
 from flatland.core.grid.rail_env_grid import RailEnvTransitions
 from flatland.core.transition_map import GridTransitionMap
+from flatland.envs import distance_map as distance_map_module
+from flatland.envs.distance_map import DistanceMapCache, set_distance_map_cache
 from flatland.envs.observations import TreeObsForRailEnv
 from flatland.envs.predictions import ShortestPathPredictorForRailEnv
 from flatland.envs.rail_env import RailEnv
 from flatland.envs.rail_generators import rail_from_grid_transition_map
 from flatland.envs.schedule_generators import random_schedule_generator
+from flatland.utils.simple_rail import make_simple_rail
 
 
 def test_walker():
@@ -47,3 +50,33 @@ def test_walker():
     assert env.distance_map.get()[(0, *[0, 1], 1)] == 3
     print(env.distance_map.get()[(0, *[0, 2], 3)])
     assert env.distance_map.get()[(0, *[0, 2], 1)] == 2
+
+
+def test_distance_map_cache(tmpdir, monkeypatch):
+    # compute the reference without any cache and restore the module-wide cache state on teardown
+    monkeypatch.setattr(distance_map_module, "_distance_map_cache", None)
+    monkeypatch.setattr(distance_map_module, "_distance_map_cache_configured", True)
+    rail, rail_map = make_simple_rail()
+
+    def distance_map():
+        env = RailEnv(width=rail_map.shape[1], height=rail_map.shape[0],
+                      rail_generator=rail_from_grid_transition_map(rail),
+                      schedule_generator=random_schedule_generator(seed=1), number_of_agents=3)
+        env.reset()
+        return env.distance_map.get()
+
+    expected = distance_map()
+    cache = DistanceMapCache(str(tmpdir), max_bytes=1 << 20)
+    set_distance_map_cache(cache)
+    assert np.array_equal(distance_map(), expected)
+    assert cache.stats["misses"] == 1 and cache.stats["stores"] == 1
+    assert np.array_equal(distance_map(), expected)
+    assert cache.stats["hits"] == 1 and cache.stats["stores"] == 1
+
+    # least recently used entries are evicted above the size cap
+    entry_size = cache.size_bytes()
+    cache.max_bytes = entry_size
+    cache.store(DistanceMapCache.key(rail.grid, [(0, 0)]), np.zeros((1, *rail_map.shape, 4), dtype=np.int32))
+    assert cache.stats["evictions"] == 1
+    assert np.array_equal(distance_map(), expected)
+    assert cache.stats["misses"] == 2
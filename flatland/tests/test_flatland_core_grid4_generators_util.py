@@ -1,9 +1,14 @@
 import numpy as np
 
+from flatland.core.grid.grid4_astar import AStarNode, a_star
+from flatland.core.grid.grid_utils import Vec2dOperations as Vec2d
 from flatland.core.grid.rail_env_grid import RailEnvTransitions
 from flatland.core.transition_map import GridTransitionMap
+from flatland.envs import grid4_generators_utils
 from flatland.envs.grid4_generators_utils import connect_rail_in_grid_map, connect_straight_line_in_grid_map, \
     fix_inner_nodes
+from flatland.envs.rail_generators import complex_rail_generator
+from flatland.utils.ordered_set import OrderedSet
 
 
 def test_build_railway_infrastructure():
@@ -79,6 +84,133 @@ def test_build_railway_infrastructure():
         assert np.all(grid_map.grid[i] == grid_map_grid_expected[i])
 
 
+def test_a_star_forbidden_cells():
+    grid_map = GridTransitionMap(width=10, height=10, transitions=RailEnvTransitions())
+    grid_map.grid.fill(0)
+
+    # a wall in column 4 with a gap in the last row; the start and end cells may be forbidden
+    wall = [(row, 4) for row in range(9)]
+    path = a_star(grid_map, (5, 0), (5, 9), forbidden_cells=wall + [(5, 0), (5, 9)])
+    assert path[0] == (5, 0) and path[-1] == (5, 9)
+    assert (9, 4) in path
+    assert not set(path) & set(wall)
+    assert all(abs(a[0] - b[0]) + abs(a[1] - b[1]) == 1 for a, b in zip(path, path[1:]))
+    assert len(path) == len(set(path))
+
+    assert a_star(grid_map, (5, 0), (5, 9), forbidden_cells=wall + [(9, 4)]) == []
+
+
+def _list_a_star(grid_map, start, end, a_star_distance_function=Vec2d.get_manhattan_distance, avoid_rails=False,
+                 respect_transition_validity=True, forbidden_cells=None):
+    """The list based a_star the heap based one replaced, kept as a reference for its node selection."""
+    rail_shape = grid_map.grid.shape
+    start_node = AStarNode(start, None)
+    end_node = AStarNode(end, None)
+    start_node.h = a_star_distance_function(start_node.pos, end_node.pos)
+    start_f = start_node.g + start_node.h
+    start_node.f = start_node.g + start_node.h
+
+    open_nodes = OrderedSet()
+    closed_nodes = OrderedSet()
+    open_nodes.add(start_node)
+
+    while len(open_nodes) > 0:
+        current_node = None
+        for item in open_nodes:
+            if current_node is None or item.f < current_node.f:
+                current_node = item
+        for item in open_nodes:
+            if item.f < 3 * start_f:
+                if item.merged == 0 and current_node.merged == 0 and item.g < current_node.g:
+                    current_node = item
+                elif item.merged > current_node.merged:
+                    current_node = item
+                elif item.merged == current_node.merged and item.h < current_node.h:
+                    current_node = item
+                elif item.merged == current_node.merged and item.h == current_node.h and item.g > current_node.g:
+                    current_node = item
+            elif current_node.f >= 3 * start_f:
+                if item.f < current_node.f:
+                    current_node = item
+                elif item.f == current_node.f and item.merged > current_node.merged:
+                    current_node = item
+                elif item.f == current_node.f and item.merged == current_node.merged and item.h <= current_node.h:
+                    current_node = item
+
+        open_nodes.remove(current_node)
+        closed_nodes.add(current_node)
+
+        if current_node.pos == end_node.pos:
+            path = []
+            current = current_node
+            while current is not None:
+                path.append(current.pos)
+                current = current.parent
+            return path[::-1]
+
+        prev_pos = current_node.parent.pos if current_node.parent is not None else None
+        children = []
+        for new_pos in [(0, -1), (0, 1), (-1, 0), (1, 0)]:
+            node_pos = Vec2d.add(current_node.pos, new_pos)
+            if node_pos[0] >= rail_shape[0] or node_pos[0] < 0 or node_pos[1] >= rail_shape[1] or node_pos[1] < 0:
+                continue
+            if not grid_map.validate_new_transition(prev_pos, current_node.pos, node_pos, end_node.pos) \
+                    and respect_transition_validity:
+                continue
+            new_node = AStarNode(node_pos, current_node)
+            if forbidden_cells is not None:
+                if node_pos in forbidden_cells and new_node != start_node and new_node != end_node:
+                    continue
+            children.append(new_node)
+
+        for child in children:
+            child.g = current_node.g + 1.0
+            child.merged = child.parent.merged + grid_map.reserve[child.pos] * np.clip(grid_map.grid[child.pos], 0, 1)
+            child.h = a_star_distance_function(child.pos, end_node.pos)
+            if avoid_rails:
+                child.h += np.clip(grid_map.grid[child.pos], 0, 1)
+            child.f = child.g + child.h
+            if child in closed_nodes:
+                continue
+            if child in open_nodes:
+                for key in open_nodes.keys():
+                    if key == child:
+                        if child.merged > key.merged:
+                            open_nodes.remove(key)
+                            open_nodes.add(child)
+                        break
+                continue
+            open_nodes.add(child)
+    return []
+
+
+def test_a_star_matches_list_a_star():
+    def generate_rail():
+        grid_map, _ = complex_rail_generator(nr_start_goal=6, nr_extra=6, min_dist=4, seed=1)(
+            20, 20, 6, np_random=np.random.RandomState(1))
+        return grid_map
+
+    # the generated rail is the same with the reference, which merges into the already reserved rails the same way
+    grid_map = generate_rail()
+    heap_grid = grid_map.grid.copy()
+    grid4_generators_utils.a_star = _list_a_star
+    try:
+        list_grid = generate_rail().grid
+    finally:
+        grid4_generators_utils.a_star = a_star
+    assert np.count_nonzero(heap_grid) > 0
+    assert np.array_equal(heap_grid, list_grid)
+
+    # and so are the paths between seeded random cells of that rail
+    np_random = np.random.RandomState(3)
+    for _ in range(20):
+        start, end = [tuple(int(x) for x in np_random.randint(0, 20, size=2)) for _ in range(2)]
+        forbidden = [tuple(int(x) for x in cell) for cell in np_random.randint(0, 20, size=(10, 2))]
+        for kwargs in [{}, {"avoid_rails": True}, {"respect_transition_validity": False},
+                       {"forbidden_cells": forbidden}]:
+            assert a_star(grid_map, start, end, **kwargs) == _list_a_star(grid_map, start, end, **kwargs)
+
+
 def test_fix_inner_nodes():
     rail_trans = RailEnvTransitions()
     grid_map = GridTransitionMap(width=6, height=10, transitions=rail_trans)
@@ -1,3 +1,5 @@
+import numpy as np
+
 from flatland.core.grid.grid4 import Grid4Transitions, Grid4TransitionsEnum
 from flatland.core.grid.grid8 import Grid8Transitions, Grid8TransitionsEnum
 from flatland.core.grid.rail_env_grid import RailEnvTransitions
@@ -178,3 +180,19 @@ def test_get_entry_directions():
     _assert(vertical_line, [True, False, True, False])
     _assert(south_symmetrical_switch, [True, True, False, True])
     _assert(north_symmetrical_switch, [False, True, True, True])
+
+
+def test_get_transition_bits():
+    rail, rail_map = make_simple_rail()
+
+    bits = rail.get_transition_bits()
+    assert bits.shape == rail_map.shape + (16,)
+    assert bits.dtype == np.uint8
+    assert not bits.flags.writeable
+    for (row, column), transition in np.ndenumerate(rail_map):
+        assert "".join(str(bit) for bit in bits[row, column]) == format(int(transition), "016b")
+    # shared while the grid does not change
+    assert rail.get_transition_bits() is bits
+
+    rail.set_transitions((0, 0), int('1000000000100000', 2))
+    assert rail.get_transition_bits()[0, 0].tolist() == [1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0, 0]
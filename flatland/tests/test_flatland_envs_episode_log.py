@@ -0,0 +1,41 @@
+import numpy as np
+
+from flatland.envs.episode_log import EpisodeReader, EpisodeRecorder
+from flatland.envs.malfunction_generators import malfunction_from_params, MalfunctionParameters
+from flatland.envs.rail_env import RailEnv
+from flatland.envs.rail_generators import rail_from_grid_transition_map
+from flatland.envs.schedule_generators import random_schedule_generator
+from flatland.utils.simple_rail import make_simple_rail
+
+
+def test_episode_log_matches_recorded_steps(tmpdir):
+    rail, rail_map = make_simple_rail()
+    stochastic_data = MalfunctionParameters(malfunction_rate=0.2, min_duration=2, max_duration=5)
+    env = RailEnv(width=rail_map.shape[1], height=rail_map.shape[0], rail_generator=rail_from_grid_transition_map(rail),
+                  schedule_generator=random_schedule_generator(seed=3), number_of_agents=3,
+                  malfunction_generator_and_process_data=malfunction_from_params(stochastic_data),
+                  record_steps=True)
+    env.reset(random_seed=1)
+    filename = str(tmpdir.join("episode.log"))
+    env.episode_recorder = EpisodeRecorder(filename, flush_every=4)
+
+    rng = np.random.RandomState(0)
+    actions = []
+    for _ in range(10):
+        action_dict = {handle: int(rng.randint(5)) for handle in range(2)}
+        actions.append(action_dict)
+        env.step(action_dict)
+
+    # complete blocks of steps are written before the recorder is closed
+    assert len(EpisodeReader(filename)) == 8
+    env.episode_recorder.close()
+
+    reader = EpisodeReader(filename)
+    assert reader.n_agents == 3
+    assert len(reader) == 10
+    for step in reversed(range(10)):
+        assert reader.get_episode_step(step) == env.cur_episode[step]
+        assert reader.get_actions(step) == actions[step]
+    assert (reader[9]["status"] == [agent.status for agent in env.agents]).all()
+    positions = [agent.position if agent.position is not None else (-1, -1) for agent in env.agents]
+    assert reader[9]["position"].tolist() == [list(position) for position in positions]
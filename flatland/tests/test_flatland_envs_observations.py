@@ -2,11 +2,12 @@
 # -*- coding: utf-8 -*-
 
 import numpy as np
+import pytest
 
 from flatland.core.grid.grid4 import Grid4TransitionsEnum
 from flatland.core.grid.grid4_utils import get_new_position
 from flatland.envs.agent_utils import EnvAgent, RailAgentStatus
-from flatland.envs.observations import GlobalObsForRailEnv, TreeObsForRailEnv
+from flatland.envs.observations import GlobalObsForRailEnv, LayerOverlay, LocalObsForRailEnv, Node, TreeObsForRailEnv
 from flatland.envs.predictions import ShortestPathPredictorForRailEnv
 from flatland.envs.rail_env import RailEnv, RailEnvActions
 from flatland.envs.rail_generators import rail_from_grid_transition_map
@@ -314,3 +315,151 @@ def test_reward_function_waiting(rendering=False):
                                                                                                    actual_reward,
                                                                                                    expected_reward)
         iteration += 1
+
+
+def test_tree_obs_segment_cache_matches_walk():
+    rail, rail_map = make_simple_rail()
+
+    observations = []
+    for segment_cache in [False, True]:
+        env = RailEnv(width=rail_map.shape[1], height=rail_map.shape[0],
+                      rail_generator=rail_from_grid_transition_map(rail),
+                      schedule_generator=random_schedule_generator(seed=3), number_of_agents=3,
+                      obs_builder_object=TreeObsForRailEnv(max_depth=2,
+                                                           predictor=ShortestPathPredictorForRailEnv(),
+                                                           segment_cache=segment_cache))
+        obs, _ = env.reset(random_seed=3)
+        episode = [(obs, {handle: list(visited) for handle, visited in env.dev_obs_dict.items()})]
+        for step in range(10):
+            obs, _, _, _ = env.step({handle: RailEnvActions.MOVE_FORWARD for handle in env.get_agent_handles()})
+            episode.append((obs, {handle: list(visited) for handle, visited in env.dev_obs_dict.items()}))
+        observations.append(episode)
+
+    for (walk_obs, walk_visited), (cached_obs, cached_visited) in zip(*observations):
+        assert walk_visited == cached_visited
+        for handle in walk_obs:
+            assert str(walk_obs[handle]) == str(cached_obs[handle])
+
+
+def test_global_obs_batch_and_overlays_match_per_agent():
+    rail, rail_map = make_simple_rail()
+
+    env = RailEnv(width=rail_map.shape[1], height=rail_map.shape[0], rail_generator=rail_from_grid_transition_map(rail),
+                  schedule_generator=random_schedule_generator(seed=1), number_of_agents=3,
+                  obs_builder_object=GlobalObsForRailEnv())
+    env.reset(random_seed=1)
+    global_obs, _, _, _ = env.step({handle: RailEnvActions.MOVE_FORWARD for handle in env.get_agent_handles()})
+
+    handles = env.get_agent_handles()
+    batch = env.obs_builder.get_batch(handles)
+    assert batch.shape == (len(handles),) + rail_map.shape + (23,)
+    overlays = env.obs_builder.get_many_overlays(handles)
+    for handle in handles:
+        rail_obs, obs_agents_state, obs_targets = global_obs[handle]
+        assert type(obs_agents_state) is np.ndarray and type(obs_targets) is np.ndarray
+        # the transition map is shared by all agents
+        assert rail_obs is global_obs[0][0]
+        assert np.array_equal(np.concatenate([rail_obs, obs_agents_state, obs_targets], axis=-1), batch[handle])
+
+        # overlays share the layers of the other agents
+        _, overlay_agents_state, overlay_targets = overlays[handle]
+        assert overlay_agents_state.shared is overlays[0][1].shared
+        assert overlay_targets.shared is overlays[0][2].shared
+        assert len(overlay_agents_state.cells) <= 2 and len(overlay_targets.cells) == 1
+        assert np.array_equal(overlay_agents_state, obs_agents_state)
+        assert np.array_equal(overlay_targets, obs_targets)
+
+        agent = env.agents[handle]
+        assert obs_targets[agent.target][0] == 1
+        if agent.position is not None:
+            assert obs_agents_state[agent.position][0] == agent.direction
+            assert obs_agents_state[agent.position][1] == -1
+            for other in env.agents:
+                if other.position is not None and other.handle != handle:
+                    assert obs_agents_state[other.position][1] == other.direction
+
+
+def test_layer_overlay_negative_indices():
+    shared = np.zeros((3, 4, 2))
+    overlay = LayerOverlay(shared, {(2, 3, 0): 5.})
+    assert overlay[-1, -1, 0] == overlay[2, 3, 0] == 5.
+    assert np.array_equal(overlay[-1, -1], [5., 0.])
+    assert overlay[-3, -4, -2] == 0.
+    with pytest.raises(IndexError):
+        overlay[3, 0, 0]
+    with pytest.raises(IndexError):
+        overlay[-4, 0]
+    # the dense array is only built by other indexing
+    assert overlay._dense is None
+    assert np.array_equal(overlay[-1], np.asarray(overlay)[2])
+
+
+def test_get_batch_matches_get_many():
+    rail, rail_map = make_simple_rail()
+
+    tree_obs = TreeObsForRailEnv(max_depth=2, predictor=ShortestPathPredictorForRailEnv(max_depth=10))
+    env = RailEnv(width=rail_map.shape[1], height=rail_map.shape[0], rail_generator=rail_from_grid_transition_map(rail),
+                  schedule_generator=random_schedule_generator(seed=1), number_of_agents=3,
+                  obs_builder_object=tree_obs)
+    env.reset(random_seed=1)
+    global_obs = GlobalObsForRailEnv()
+    global_obs.set_env(env)
+    global_obs.reset()
+    local_obs = LocalObsForRailEnv(view_width=2, view_height=4, center=1)
+    local_obs.set_env(env)
+    local_obs.reset()
+
+    handles = list(env.get_agent_handles())
+    tree_batch = global_batch = local_batch = None
+    for _ in range(5):
+        obs, _, _, _ = env.step({handle: RailEnvActions.MOVE_FORWARD for handle in handles})
+
+        previous_tree_batch, previous_global_batch = tree_batch, global_batch
+        tree_batch = tree_obs.get_batch()
+        assert tree_batch.shape == (3, 21, 12)
+        for handle in handles:
+            assert np.array_equal(tree_batch[handle], tree_obs.flatten_tree(obs[handle]))
+        root = obs[0]
+        assert np.array_equal(tree_batch[0, 0], [getattr(root, field) for field in Node._fields[:-1]])
+
+        global_batch = global_obs.get_batch()
+        global_obs_many = global_obs.get_many(handles)
+        for handle in handles:
+            assert np.array_equal(global_batch[handle], np.concatenate(global_obs_many[handle], axis=-1))
+
+        local_batch = local_obs.get_batch()
+        for handle, agent in enumerate(env.agents):
+            if agent.position is not None:
+                for batch, expected in zip(local_batch, local_obs.get(handle)):
+                    assert np.array_equal(batch[handle], expected)
+
+        # the buffers are reused
+        assert previous_tree_batch is None or tree_batch is previous_tree_batch
+        assert previous_global_batch is None or global_batch is previous_global_batch
+
+
+def test_flatten_tree_pads_missing_nodes():
+    tree_obs = TreeObsForRailEnv(max_depth=1)
+    leaf = Node(*range(12), childs={})
+    root = Node(*range(100, 112), childs={'L': -np.inf, 'F': leaf, 'R': -np.inf, 'B': -np.inf})
+
+    flat = tree_obs.flatten_tree(root)
+    assert flat.shape == (5, 12)
+    assert np.array_equal(flat[0], range(100, 112))
+    assert np.all(flat[1] == -np.inf)
+    assert np.array_equal(flat[2], range(12))
+    assert np.all(flat[3:] == -np.inf)
+    assert np.all(tree_obs.flatten_tree(None) == -np.inf)
+
+
+def test_step_without_observations():
+    rail, rail_map = make_simple_rail()
+
+    env = RailEnv(width=rail_map.shape[1], height=rail_map.shape[0], rail_generator=rail_from_grid_transition_map(rail),
+                  schedule_generator=random_schedule_generator(seed=1), number_of_agents=2,
+                  obs_builder_object=GlobalObsForRailEnv(), compute_observations=False)
+    obs, _ = env.reset(random_seed=1)
+    assert obs == {}
+    obs, _, _, _ = env.step({handle: RailEnvActions.MOVE_FORWARD for handle in env.get_agent_handles()})
+    assert obs == {}
+    assert env.obs_builder.get_batch().shape == (2,) + rail_map.shape + (23,)
@@ -7,8 +7,9 @@ import numpy as np
 from flatland.core.grid.grid4 import Grid4TransitionsEnum
 from flatland.envs.agent_utils import RailAgentStatus
 from flatland.envs.observations import TreeObsForRailEnv, Node
-from flatland.envs.predictions import DummyPredictorForRailEnv, ShortestPathPredictorForRailEnv
-from flatland.envs.rail_env import RailEnv
+from flatland.envs.predictions import DummyPredictorForRailEnv, ShortestPathPredictorForRailEnv, \
+    CachedShortestPathPredictorForRailEnv
+from flatland.envs.rail_env import RailEnv, RailEnvActions
 from flatland.envs.rail_env_shortest_paths import get_shortest_paths
 from flatland.envs.rail_generators import rail_from_grid_transition_map
 from flatland.envs.rail_trainrun_data_structures import Waypoint
@@ -294,6 +295,33 @@ def test_shortest_path_predictor_conflicts(rendering=False):
     _check_expected_conflicts(expected_conflicts_1, obs_builder, tree_1, "agent[1]: ")
 
 
+def test_cached_shortest_path_predictor():
+    rail, rail_map = make_simple_rail()
+    env = RailEnv(width=rail_map.shape[1],
+                  height=rail_map.shape[0],
+                  rail_generator=rail_from_grid_transition_map(rail),
+                  schedule_generator=random_schedule_generator(seed=2),
+                  number_of_agents=3,
+                  obs_builder_object=TreeObsForRailEnv(max_depth=2,
+                                                       predictor=CachedShortestPathPredictorForRailEnv(max_depth=10)),
+                  )
+    env.reset(random_seed=2)
+    predictor = ShortestPathPredictorForRailEnv(max_depth=10)
+    predictor.set_env(env)
+    cached_predictor = env.obs_builder.predictor
+
+    for step in range(20):
+        expected = predictor.get()
+        predictions = cached_predictor.get()
+        assert cached_predictor.predictions.shape == (env.get_num_agents(), 11, 5)
+        for handle in env.get_agent_handles():
+            assert np.array_equal(predictions[handle], expected[handle], equal_nan=True), (step, handle)
+        # let the last agent wait to leave its prediction untouched
+        actions = {handle: RailEnvActions.MOVE_FORWARD for handle in env.get_agent_handles()}
+        actions[env.get_num_agents() - 1] = RailEnvActions.STOP_MOVING if step % 3 else RailEnvActions.MOVE_LEFT
+        env.step(actions)
+
+
 def _check_expected_conflicts(expected_conflicts, obs_builder, tree: Node, prompt=''):
     assert (tree.num_agents_opposite_direction > 0) == (() in expected_conflicts), "{}[]".format(prompt)
     for a_1 in obs_builder.tree_explored_actions_char:
@@ -10,8 +10,10 @@ from flatland.envs.observations import GlobalObsForRailEnv, TreeObsForRailEnv
 from flatland.envs.predictions import ShortestPathPredictorForRailEnv
 from flatland.envs.rail_env import RailEnv, RailEnvActions
 from flatland.envs.rail_generators import complex_rail_generator, rail_from_file
-from flatland.envs.rail_generators import rail_from_grid_transition_map
+from flatland.envs.malfunction_generators import malfunction_from_params, MalfunctionParameters
+from flatland.envs.rail_generators import rail_from_grid_transition_map, sparse_rail_generator
 from flatland.envs.schedule_generators import random_schedule_generator, complex_schedule_generator, schedule_from_file
+from flatland.envs.schedule_generators import sparse_schedule_generator
 from flatland.utils.simple_rail import make_simple_rail
 from flatland.envs.persistence import RailEnvPersister
 from flatland.utils.rendertools import RenderTool
@@ -87,6 +89,38 @@ def test_save_load_mpk():
         assert(agent1.target == agent2.target)
 
 
+def test_save_load_npz():
+    env = RailEnv(width=10, height=10,
+                  rail_generator=complex_rail_generator(nr_start_goal=2, nr_extra=5, min_dist=6, seed=1),
+                  schedule_generator=complex_schedule_generator(), number_of_agents=2)
+    env.reset()
+
+    os.makedirs("tmp", exist_ok=True)
+
+    RailEnvPersister.save(env, "tmp/test_save.npz", save_distance_maps=True)
+
+    env2, env_dict = RailEnvPersister.load_new("tmp/test_save.npz")
+    assert (env2.rail.grid == env.rail.grid).all()
+    assert np.array_equal(env_dict["distance_map"], env.distance_map.get())
+    assert (len(env2.agents) == len(env.agents))
+    for agent1, agent2 in zip(env.agents, env2.agents):
+        assert agent1.to_agent() == agent2.to_agent()
+
+    # the file is loaded once, every load gets its own agents
+    env_dict2 = RailEnvPersister.load_env_dict("tmp/test_save.npz")
+    assert env_dict2["grid"] is env_dict["grid"]
+    assert not env_dict2["grid"].flags.writeable
+    assert env_dict2["agents"][0] is not env_dict["agents"][0]
+    assert env_dict2["agents"][0].speed_data is not env_dict["agents"][0].speed_data
+
+    # saving again invalidates the cached load
+    RailEnvPersister.convert("tmp/test_save.npz", "tmp/test_save_converted.pkl")
+    env.agents[0].target = (0, 0)
+    RailEnvPersister.save(env, "tmp/test_save.npz")
+    assert RailEnvPersister.load_env_dict("tmp/test_save.npz")["agents"][0].target == (0, 0)
+    assert RailEnvPersister.load_env_dict("tmp/test_save_converted.pkl")["agents"][1].target == env.agents[1].target
+
+
 #@pytest.mark.skip(reason="Some unfortunate behaviour here - agent gets stuck at corners.")
 def test_rail_environment_single_agent(show=False):
     # We instantiate the following map on a 3x3 grid
@@ -363,6 +397,49 @@ def test_rail_env_reset():
     assert agents_initial == agents_loaded
 
 
+def _make_slow_agents_env():
+    env = RailEnv(width=30, height=30,
+                  rail_generator=sparse_rail_generator(max_num_cities=3, seed=5, grid_mode=False),
+                  schedule_generator=sparse_schedule_generator({0.5: 0.5, 0.25: 0.5}, seed=5), number_of_agents=4,
+                  obs_builder_object=TreeObsForRailEnv(max_depth=2),
+                  malfunction_generator_and_process_data=malfunction_from_params(MalfunctionParameters(0.02, 3, 8)),
+                  random_seed=5)
+    env.reset(random_seed=5)
+    return env
+
+
+def test_step_until_decision():
+    env, env_until = _make_slow_agents_env(), _make_slow_agents_env()
+    rng = np.random.RandomState(3)
+
+    calls = 0
+    done = {"__all__": False}
+    while not done["__all__"]:
+        actions = {handle: RailEnvActions.MOVE_FORWARD if rng.rand() < 0.9 else rng.randint(0, 5)
+                   for handle in env.get_agent_handles()}
+        obs_until, rewards_until, done_until, info_until = env_until.step_until_decision(actions)
+        calls += 1
+
+        rewards = dict.fromkeys(env.get_agent_handles(), 0)
+        for step in range(info_until["steps"]):
+            # the actions of the steps skipped by step_until_decision are ignored
+            obs, step_rewards, done, info = env.step(actions if step == 0 else {
+                handle: RailEnvActions.MOVE_LEFT for handle in env.get_agent_handles()})
+            for handle, reward in step_rewards.items():
+                rewards[handle] += reward
+            if step < info_until["steps"] - 1:
+                assert not any(info["action_required"].values())
+
+        assert rewards == rewards_until
+        assert done == done_until
+        assert str(obs) == str(obs_until)
+        assert [(agent.position, agent.direction, agent.status, agent.malfunction_data["malfunction"])
+                for agent in env.agents] == \
+            [(agent.position, agent.direction, agent.status, agent.malfunction_data["malfunction"])
+             for agent in env_until.agents]
+    assert calls < env._elapsed_steps
+
+
 def main():
     test_rail_environment_single_agent(show=True)
 
@@ -5,7 +5,8 @@ import numpy as np
 from flatland.core.grid.grid4 import Grid4TransitionsEnum
 from flatland.envs.observations import GlobalObsForRailEnv
 from flatland.envs.rail_env import RailEnv
-from flatland.envs.rail_env_shortest_paths import get_shortest_paths, get_k_shortest_paths
+from flatland.envs.rail_env_shortest_paths import get_shortest_paths, get_k_shortest_paths, \
+    get_k_shortest_paths_yen
 from flatland.envs.rail_env_utils import load_flatland_environment_from_file
 from flatland.envs.rail_generators import rail_from_grid_transition_map
 from flatland.envs.rail_trainrun_data_structures import Waypoint
@@ -311,6 +312,37 @@ def test_get_k_shortest_paths(rendering=False):
 
     assert actual == expected, "actual={},expected={}".format(actual, expected)
 
+
+def test_get_k_shortest_paths_yen():
+    rail, rail_map = make_simple_rail_with_alternatives()
+
+    env = RailEnv(width=rail_map.shape[1],
+                  height=rail_map.shape[0],
+                  rail_generator=rail_from_grid_transition_map(rail),
+                  schedule_generator=random_schedule_generator(),
+                  number_of_agents=1,
+                  obs_builder_object=GlobalObsForRailEnv(),
+                  )
+    env.reset()
+    agent = env.agents[0]
+    agent.target = (3, 9)
+    env.reset(False, False)
+
+    for source_position, source_direction in [((3, 1), Grid4TransitionsEnum.WEST),
+                                              ((3, 1), Grid4TransitionsEnum.EAST),
+                                              ((0, 4), Grid4TransitionsEnum.WEST)]:
+        expected = get_k_shortest_paths(env, source_position, int(source_direction), agent.target, k=10)
+        actual = get_k_shortest_paths_yen(env, source_position, int(source_direction), agent.target, k=10)
+
+        assert [len(path) for path in actual] == sorted(len(path) for path in expected)
+        assert set(tuple(map(tuple, path)) for path in actual) == \
+            set(tuple((*waypoint.position, waypoint.direction) for waypoint in path) for path in expected)
+
+        shortest = get_k_shortest_paths_yen(env, source_position, int(source_direction), agent.target, k=1)
+        assert len(shortest) == 1
+        assert np.array_equal(shortest[0], actual[0])
+
+
 def main():
     test_get_shortest_paths()
 
@@ -0,0 +1,77 @@
+from flatland.core.grid.grid4 import Grid4TransitionsEnum
+from flatland.envs.observations import GlobalObsForRailEnv
+from flatland.envs.rail_env import RailEnv
+from flatland.envs.rail_env_shortest_paths import get_shortest_paths
+from flatland.envs.rail_generators import rail_from_grid_transition_map
+from flatland.envs.rail_graph import RailGraph, build_rail_graph
+from flatland.envs.schedule_generators import random_schedule_generator
+from flatland.utils.simple_rail import make_simple_rail, make_simple_rail_with_alternatives
+
+
+def _make_env(rail, rail_map):
+    env = RailEnv(width=rail_map.shape[1], height=rail_map.shape[0], rail_generator=rail_from_grid_transition_map(rail),
+                  schedule_generator=random_schedule_generator(), number_of_agents=1,
+                  obs_builder_object=GlobalObsForRailEnv())
+    env.reset()
+    return env
+
+
+def test_rail_graph_compresses_and_locates_all_states():
+    rail, rail_map = make_simple_rail()
+    graph = RailGraph(rail)
+
+    assert graph.num_nodes < graph.num_states
+    for r in range(rail_map.shape[0]):
+        for c in range(rail_map.shape[1]):
+            for d in range(4):
+                if any(rail.get_transitions(r, c, d)):
+                    assert graph.locate((r, c), d) is not None, (r, c, d)
+
+    # edges are chains of consecutive cells ending in their target node
+    for edge in graph.edges:
+        assert edge.length == len(edge.cells)
+        assert edge.cells[-1] == graph.nodes[edge.target]
+
+
+def test_rail_graph_key_cells_are_nodes():
+    rail, rail_map = make_simple_rail()
+    graph = RailGraph(rail, key_cells=[(3, 1)])
+
+    assert graph.locate((3, 1), Grid4TransitionsEnum.EAST).node is not None
+    assert graph.locate((3, 1), Grid4TransitionsEnum.WEST).node is not None
+
+
+def test_rail_graph_shortest_path_matches_distance_map():
+    rail, rail_map = make_simple_rail_with_alternatives()
+    env = _make_env(rail, rail_map)
+    graph = build_rail_graph(env)
+    agent = env.agents[0]
+
+    expected = get_shortest_paths(env.distance_map)[agent.handle]
+    dijkstra_path = graph.dijkstra(agent.initial_position, agent.initial_direction, agent.target)
+    a_star_path = graph.a_star(agent.initial_position, agent.initial_direction, agent.target)
+
+    assert len(dijkstra_path) == len(expected)
+    assert len(a_star_path) == len(expected)
+    assert dijkstra_path[0].position == agent.initial_position
+    assert dijkstra_path[-1].position == agent.target
+
+
+def test_rail_graph_sipp_waits_for_reserved_cells():
+    rail, rail_map = make_simple_rail()
+    graph = RailGraph(rail)
+    source, target = (3, 1), (3, 8)
+
+    free_path = graph.sipp(source, Grid4TransitionsEnum.EAST, target, reserved_cells=set())
+    assert free_path == [(3, c) for c in range(1, 9)]
+
+    # block the cell in front of the source for the first two steps
+    reserved = {(3, 2, 1), (3, 2, 2)}
+    path = graph.sipp(source, Grid4TransitionsEnum.EAST, target, reserved_cells=reserved)
+    assert path[0] == source
+    assert path[-1] == target
+    assert len(path) == len(free_path) + 2
+    for time, position in enumerate(path):
+        assert (*position, time) not in reserved
+
+    assert graph.sipp(source, Grid4TransitionsEnum.EAST, target, reserved_cells=set(), max_time=3) is None
@@ -0,0 +1,31 @@
+import numpy as np
+
+from flatland.core.env_observation_builder import DummyObservationBuilder
+from flatland.envs.rail_env import RailEnv
+from flatland.envs.rail_generators import sparse_rail_generator
+from flatland.envs.reachability import ReachabilityIndex
+from flatland.envs.schedule_generators import sparse_schedule_generator
+
+
+def test_reachability_index_matches_check_path_exists():
+    env = RailEnv(width=40, height=40,
+                  rail_generator=sparse_rail_generator(max_num_cities=4, max_rails_between_cities=2,
+                                                       max_rails_in_city=3, seed=5),
+                  schedule_generator=sparse_schedule_generator(seed=5), number_of_agents=5,
+                  obs_builder_object=DummyObservationBuilder(), random_seed=5)
+    env.reset(random_seed=5)
+    rail_cells = [tuple(cell) for cell in np.argwhere(env.rail.grid > 0)]
+    key_cells = [rail_cells[i] for i in np.random.RandomState(0).choice(len(rail_cells), 25, replace=False)]
+    # a cell without rail is never left
+    key_cells.append(next((row, column) for row in range(40) for column in range(40)
+                          if env.rail.grid[row, column] == 0))
+
+    index = ReachabilityIndex(env.rail, key_cells)
+    assert index.matrix.any() and not index.matrix.all()
+    for start in key_cells:
+        for direction in range(4):
+            for end in key_cells:
+                assert index.path_exists(start, direction, end) == env.rail.check_path_exists(start, direction, end)
+    # cells which are not indexed fall back to the search
+    assert index.path_exists(rail_cells[0], 0, rail_cells[1]) == env.rail.check_path_exists(rail_cells[0], 0,
+                                                                                           rail_cells[1])
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from flatland.envs.observations import TreeObsForRailEnv
+from flatland.envs.rail_env import RailEnv
+from flatland.envs.rail_generators import sparse_rail_generator
+from flatland.envs.schedule_generators import sparse_schedule_generator
+from flatland.envs.vec_rail_env import VecRailEnv, _VecWorker, _probe_specs
+
+
+def _make_env():
+    return RailEnv(width=25, height=25, rail_generator=sparse_rail_generator(max_num_cities=2, grid_mode=False),
+                   schedule_generator=sparse_schedule_generator(), number_of_agents=2,
+                   obs_builder_object=TreeObsForRailEnv(max_depth=1))
+
+
+def test_vec_rail_env_matches_sequential_envs():
+    num_envs = 2
+    actions = np.random.RandomState(1).randint(0, 5, size=(900, num_envs, 2))
+
+    with VecRailEnv([_make_env] * num_envs, seed=3) as vec_env:
+        observations, infos = vec_env.reset()
+        assert observations.shape == (num_envs, 2, 5, 12)
+        steps = [(observations.copy(), None, None, None)]
+        for step_actions in actions:
+            observations, rewards, dones, infos = vec_env.step(step_actions)
+            steps.append((observations.copy(), rewards.copy(), infos["all_done"].copy(), infos["episodes"]))
+
+    n_episodes = 0
+    for index in range(num_envs):
+        env = _make_env()
+        episode = 0
+        env.reset(random_seed=3 + index)
+        assert np.array_equal(env.obs_builder.get_batch(), steps[0][0][index])
+        for step, step_actions in enumerate(actions):
+            observations, vec_rewards, vec_all_done, vec_episodes = steps[step + 1]
+            _, rewards, dones, _ = env.step(dict(enumerate(step_actions[index].tolist())))
+            assert np.array_equal(vec_rewards[index], [rewards[0], rewards[1]])
+            assert vec_all_done[index] == dones["__all__"]
+            if dones["__all__"]:
+                # auto-reset with the seed of the next episode of this env
+                assert vec_episodes[index]["seed"] == 3 + index + num_envs * episode
+                assert vec_episodes[index]["steps"] == env._elapsed_steps
+                episode += 1
+                env.reset(random_seed=3 + index + num_envs * episode)
+            else:
+                assert vec_episodes[index] is None
+            assert np.array_equal(env.obs_builder.get_batch(), observations[index])
+        n_episodes += episode
+    assert n_episodes > 0
+
+
+def test_vec_worker_without_auto_reset():
+    probe_env = _make_env()
+    probe_env.reset(random_seed=3)
+    arrays = {spec.name: np.zeros(spec.shape, dtype=spec.dtype) for spec in _probe_specs(probe_env, 1)}
+    worker = _VecWorker(_make_env, 0, 1, arrays, auto_reset=False)
+    with pytest.raises(Exception, match="call reset"):
+        worker.step()
+
+    worker.reset(3)
+    episodes = [worker.step() for _ in range(worker.env._max_episode_steps + 3)]
+    # the finished episode is reported once, the env is not reset
+    assert [episode["seed"] for episode in episodes if episode is not None] == [3]
+    assert episodes[-1] is None and arrays["all_done"][0]
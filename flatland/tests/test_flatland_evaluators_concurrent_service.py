@@ -0,0 +1,195 @@
+import multiprocessing
+import os
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from flatland.envs.episode_log import EpisodeReader
+from flatland.envs.persistence import RailEnvPersister
+from flatland.envs.rail_env import RailEnv, RailEnvActions
+from flatland.envs.rail_generators import rail_from_grid_transition_map
+from flatland.envs.schedule_generators import random_schedule_generator
+from flatland.evaluators import messages
+from flatland.evaluators import service as evaluation_service
+from flatland.evaluators.concurrent_service import ConcurrentEvaluationService, EpisodeWorker, _Worker, \
+    _run_episode_worker
+from flatland.utils.simple_rail import make_simple_rail
+
+
+@pytest.fixture
+def test_env_folder(tmpdir):
+    rail, rail_map = make_simple_rail()
+    os.makedirs(os.path.join(str(tmpdir), "Test_0"))
+    with open(os.path.join(str(tmpdir), "metadata.csv"), "w") as metadata:
+        metadata.write("test_id,env_id\n")
+        for level in range(3):
+            env = RailEnv(width=rail_map.shape[1], height=rail_map.shape[0],
+                          rail_generator=rail_from_grid_transition_map(rail),
+                          schedule_generator=random_schedule_generator(seed=level), number_of_agents=2)
+            env.reset(random_seed=level + 1)
+            RailEnvPersister.save(env, os.path.join(str(tmpdir), "Test_0", "Level_{}.pkl".format(level)))
+            metadata.write("Test_0,Level_{}\n".format(level))
+    return str(tmpdir)
+
+
+@pytest.fixture
+def concurrent_service(test_env_folder, monkeypatch):
+    """
+    A service without Redis: its responses and errors are recorded and its only worker is a thread.
+    """
+    service = ConcurrentEvaluationService(test_env_folder=test_env_folder, n_workers=1)
+    service.responses = []
+    service.errors = []
+    monkeypatch.setattr(service, "send_response",
+                        lambda response, command, suppress_logs=False: service.responses.append(response))
+    monkeypatch.setattr(service, "send_error",
+                        lambda error, suppress_logs=False, error_channel=None: service.errors.append(
+                            (error, error_channel)))
+    monkeypatch.setattr(service, "handle_aicrowd_info_event", lambda payload: None)
+
+    connection, worker_connection = multiprocessing.Pipe()
+    thread = threading.Thread(target=_run_episode_worker, args=(worker_connection, (test_env_folder,)), daemon=True)
+    thread.start()
+    service.workers = [_Worker(thread, connection)]
+    service.free_workers = list(service.workers)
+    yield service
+    service.stop_workers()
+
+
+def _handle_answers_until(service, condition):
+    deadline = time.time() + 30
+    while not condition():
+        assert time.time() < deadline
+        service.handle_worker_answers()
+        time.sleep(0.001)
+
+
+def _run_episode(service, episode_id):
+    # steps sent before the "done" of the episode arrives are answered by errors, which are dropped
+    while episode_id in service.episodes:
+        service.handle_env_step({"payload": {"episode_id": episode_id, "inference_time": 0.01,
+                                             "action": {0: RailEnvActions.MOVE_FORWARD,
+                                                        1: RailEnvActions.MOVE_FORWARD}}})
+        service.handle_worker_answers()
+
+
+def test_episode_worker(test_env_folder):
+    worker = EpisodeWorker(test_env_folder)
+    assert worker.create("Test_0/Level_0.pkl")[0]
+    result = None
+    steps = 0
+    while result is None:
+        result = worker.step([{0: RailEnvActions.MOVE_FORWARD, 1: RailEnvActions.MOVE_FORWARD}], 0.01)
+        steps += 1
+    assert result["env_file_path"] == "Test_0/Level_0.pkl"
+    assert result["steps"] == steps and not result["timed_out"]
+    assert 0 <= result["percentage_complete"] <= 1
+    assert result["stats"]["internal_env_step_time_counter"] == steps
+    assert result["stats"]["controller_inference_time_counter"] == steps
+    with pytest.raises(Exception):
+        worker.step([{}], 0.01)
+
+    # a timed out episode gets no reward
+    worker.create("Test_0/Level_1.pkl")
+    assert worker.step([{}], None) is None
+    result = worker.time_out()
+    assert result["timed_out"] and result["steps"] == 2
+    assert result["normalized_reward"] == 0.0 and result["percentage_complete"] == 0.0
+    assert "controller_inference_time_counter" not in result["stats"]
+
+
+def test_merge_running_stats(concurrent_service):
+    workers = [EpisodeWorker(None) for _ in range(2)]
+    expected = EpisodeWorker(None)
+    for worker in workers + [expected]:
+        worker.stats = {}
+    for i, value in enumerate([0.3, 0.1, 0.5, 0.2, 0.4]):
+        workers[i % 2].update_running_stats("controller_inference_time", value)
+        expected.update_running_stats("controller_inference_time", value)
+    workers[1].update_running_stats("internal_env_step_time", 0.7)
+
+    for worker in workers:
+        concurrent_service.merge_running_stats(worker.stats)
+    assert concurrent_service.stats["controller_inference_time_counter"] == 5
+    for key in ["min", "mean", "max"]:
+        assert np.isclose(concurrent_service.stats["controller_inference_time_" + key],
+                          expected.stats["controller_inference_time_" + key])
+    assert concurrent_service.stats["internal_env_step_time_counter"] == 1
+    assert concurrent_service.stats["internal_env_step_time_mean"] == 0.7
+
+
+def test_merge_episode_result_and_stale_answers(concurrent_service):
+    concurrent_service.handle_env_create({"type": messages.FLATLAND_RL.ENV_CREATE})
+    _handle_answers_until(concurrent_service, lambda: concurrent_service.responses)
+    assert concurrent_service.responses[0]["payload"]["episode_id"] == 0
+
+    concurrent_service.timeout_counter = 1
+    _run_episode(concurrent_service, 0)
+    # an episode done in time ends the successive timeouts
+    assert concurrent_service.timeout_counter == 0
+    assert concurrent_service.simulation_steps[0] > 0
+    assert concurrent_service.simulation_percentage_complete_per_test[0] == \
+        [concurrent_service.simulation_percentage_complete[0]]
+    row = concurrent_service.evaluation_metadata_df.loc["Test_0/Level_0.pkl"]
+    assert row["steps"] == concurrent_service.simulation_steps[0]
+    assert row["controller_inference_time_mean"] == pytest.approx(0.01)
+    assert concurrent_service.stats["controller_inference_time_counter"] == concurrent_service.simulation_steps[0]
+
+    # a timeout sent when the episode was already done is answered by a second "done", which is dropped
+    rewards = list(concurrent_service.simulation_rewards)
+    concurrent_service.workers[0].connection.send((0, "timeout", ()))
+    concurrent_service.handle_env_create({"type": messages.FLATLAND_RL.ENV_CREATE})
+    _handle_answers_until(concurrent_service, lambda: len(concurrent_service.responses) == 2)
+    assert concurrent_service.responses[1]["payload"]["episode_id"] == 1
+    assert concurrent_service.simulation_rewards[0] == rewards[0]
+    assert concurrent_service.timeout_counter == 0
+
+
+class _StopService(Exception):
+    pass
+
+
+def test_successive_timeouts_stop_evaluation(concurrent_service, monkeypatch):
+    monkeypatch.setattr(evaluation_service, "MAX_SUCCESSIVE_TIMEOUTS", 2)
+    monkeypatch.setattr(evaluation_service, "INTIAL_PLANNING_TIMEOUT", 0)
+    monkeypatch.setattr(concurrent_service, "start_workers", lambda: None)
+    monkeypatch.setattr(concurrent_service, "handle_ping", lambda command: None)
+    deadline = time.time() + 30
+
+    def get_next_command():
+        # a client creating envs it never steps, and another one pinging all the time
+        if concurrent_service.evaluation_done or time.time() > deadline:
+            raise _StopService()
+        if not concurrent_service.episodes and not concurrent_service.pending_creates:
+            return {"type": messages.FLATLAND_RL.ENV_CREATE}
+        return {"type": messages.FLATLAND_RL.PING, "payload": {}}
+
+    monkeypatch.setattr(concurrent_service, "get_next_command", get_next_command)
+    with pytest.raises(_StopService):
+        concurrent_service.run()
+    assert concurrent_service.evaluation_done
+    assert concurrent_service.timeout_counter == 2
+    assert "2 consecutive timeouts" in concurrent_service.termination_cause
+    assert concurrent_service.errors == [({"type": messages.FLATLAND_RL.ENV_RESET_TIMEOUT},
+                                          concurrent_service.episode_error_channel(episode_id))
+                                         for episode_id in [0, 1]]
+
+
+def test_timed_out_episode_log_is_written(test_env_folder, tmpdir, monkeypatch):
+    episode_dir = os.path.join(str(tmpdir), "episodes")
+    service = evaluation_service.FlatlandRemoteEvaluationService(test_env_folder=test_env_folder,
+                                                                 episode_dir=episode_dir, stream_episodes=True)
+    monkeypatch.setattr(service, "send_response", lambda response, command, suppress_logs=False: None)
+    monkeypatch.setattr(service, "handle_aicrowd_info_event", lambda payload: None)
+
+    service.handle_env_create({"type": messages.FLATLAND_RL.ENV_CREATE})
+    for _ in range(3):
+        service.env.step({0: RailEnvActions.MOVE_FORWARD, 1: RailEnvActions.MOVE_FORWARD})
+    episode_log = service.env.episode_recorder.filename
+
+    # the episode times out: the next one is created without saving it
+    service.simulation_done = True
+    service.handle_env_create({"type": messages.FLATLAND_RL.ENV_CREATE})
+    assert len(EpisodeReader(episode_log)) == 3
@@ -0,0 +1,152 @@
+import importlib.util
+import io
+import os
+import time
+
+import numpy as np
+import pytest
+
+from flatland.envs.agent_utils import RailAgentStatus
+from flatland.envs.rail_env import RailEnv
+from flatland.envs.rail_generators import rail_from_grid_transition_map
+from flatland.envs.schedule_generators import random_schedule_generator
+from flatland.utils.controller import PlannerTimeout, agent_columns, call_planner, compile_paths, \
+    compiled_path_controller, evaluate_test_case, find_conflicts, freeze_agents, freeze_rail, path_controller, \
+    recompile_paths, _report_summary, _report_test_case
+from flatland.utils.simple_rail import make_simple_rail
+
+
+def _slow_planner(duration):
+    time.sleep(duration)
+    return [(0, 0)]
+
+
+def test_call_planner_timeout():
+    assert call_planner(None, _slow_planner, 0.01) == [(0, 0)]
+    assert call_planner(1, _slow_planner, 0.01) == [(0, 0)]
+
+    start = time.time()
+    with pytest.raises(PlannerTimeout):
+        call_planner(0.1, _slow_planner, 5)
+    assert time.time() - start < 2
+
+
+def test_freeze_rail_and_agents():
+    rail, rail_map = make_simple_rail()
+    env = RailEnv(width=rail_map.shape[1], height=rail_map.shape[0], rail_generator=rail_from_grid_transition_map(rail),
+                  schedule_generator=random_schedule_generator(), number_of_agents=2)
+    env.reset()
+
+    frozen_rail = freeze_rail(env.rail)
+    assert np.shares_memory(frozen_rail.grid, env.rail.grid)
+    assert frozen_rail.get_full_transitions(3, 4) == env.rail.get_full_transitions(3, 4)
+    with pytest.raises(ValueError):
+        frozen_rail.grid[0, 0] = 1
+    assert env.rail.grid.flags.writeable
+
+    agents = freeze_agents(env.agents)
+    assert len(agents) == 2
+    for agent, record in zip(env.agents, agents):
+        assert record.initial_position == agent.initial_position
+        assert record.target == agent.target
+        assert record.position is None
+        assert record.direction == agent.direction
+        assert record.status is RailAgentStatus.READY_TO_DEPART
+        assert record.malfunction_data["malfunction"] == agent.malfunction_data["malfunction"]
+        # positions are hashable, as planners use them in sets and dict keys
+        assert {(record.initial_position, record.initial_direction, 0)}
+    with pytest.raises(AttributeError):
+        agents[0].status = RailAgentStatus.ACTIVE
+    with pytest.raises(TypeError):
+        agents[0].speed_data["speed"] = 0.5
+
+
+def test_evaluate_test_case_zero_copy_matches_copies():
+    piglet = os.path.join(os.path.dirname(__file__), "..", "..", "piglet-public")
+    if not os.path.isfile(os.path.join(piglet, "question3.py")):
+        pytest.skip("piglet-public planners not found")
+    spec = importlib.util.spec_from_file_location("question3", os.path.join(piglet, "question3.py"))
+    question3 = importlib.util.module_from_spec(spec)
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.syspath_prepend(piglet)
+        spec.loader.exec_module(question3)
+
+    # the planners replan on conflicts of this test case
+    test_case = os.path.join(piglet, "multi_test_case", "level1_test_7.pkl")
+    replans = []
+
+    def replan(*args):
+        replans.append(args[2])
+        return question3.replan(*args)
+
+    statistics = []
+    for zero_copy in [False, True]:
+        statistic_dict, _ = evaluate_test_case(question3.get_path, test_case, False, False, 3,
+                                               ddl_file=test_case[:-4] + ".ddl", mute=True, replan=replan,
+                                               interactive=False, zero_copy=zero_copy)
+        statistic_dict.pop("copy_time")
+        statistics.append(statistic_dict)
+    assert len(replans) > 0
+    assert statistics[0]["num_done"] > 0
+    assert statistics[0] == statistics[1]
+
+
+def test_copy_time_is_reported():
+    statistics = [{"test_case": "level_0/test_{}".format(i), "No. of agents": 2, "num_done": 1, "deadlines_met": 1,
+                   "done_percentage": 0.5, "sum_of_cost": 10, "time_step": 8, "penalty": [0, 1], "sic_final": 11,
+                   "p": 5, "f": 0, "copy_time": copy_time} for i, copy_time in enumerate([0.25, 0.5])]
+    out = io.StringIO()
+    out.close = lambda: None
+    for statistic_dict in statistics:
+        _report_test_case(statistic_dict, 1.5, {}, out)
+    _report_summary(statistics, [1.5, 1.5], {}, 3, {}, None, out)
+    rows = [line.split(",") for line in out.getvalue().splitlines()]
+    assert [row[4] for row in rows] == ["1.5", "1.5", "3.0(sum)"]
+    assert [row[5] for row in rows] == ["0.25", "0.5", "0.75(sum)"]
+
+
+def test_find_conflicts_on_compiled_paths():
+    path_all = [[(0, 0), (0, 1), (0, 2)], [(1, 0), (0, 1)], []]
+    planned_positions, path_lengths = compile_paths(path_all, 3)
+    assert planned_positions.shape == (3, 3, 2)
+    assert path_lengths.tolist() == [3, 2, 0]
+    assert planned_positions[1, 2].tolist() == [-1, -1]
+
+    # agent 1 took the cell planned for agent 0, agent 2 has no path
+    positions = np.array([(0, 0), (0, 1), (2, 2)])
+    assert find_conflicts(1, planned_positions, path_lengths, positions) == (True, [0])
+    assert find_conflicts(2, planned_positions, path_lengths, positions) == (True, [0])
+    # agents not on the grid never fail
+    positions = np.array([(-1, -1), (0, 1), (-1, -1)])
+    assert find_conflicts(1, planned_positions, path_lengths, positions) == (False, [])
+    assert find_conflicts(5, planned_positions, path_lengths, positions) == (False, [])
+
+
+def test_compiled_path_controller_matches_path_controller():
+    rail, rail_map = make_simple_rail()
+    env = RailEnv(width=rail_map.shape[1], height=rail_map.shape[0], rail_generator=rail_from_grid_transition_map(rail),
+                  schedule_generator=random_schedule_generator(), number_of_agents=2)
+    env.reset()
+    env.agents[0].initial_position, env.agents[0].initial_direction, env.agents[0].target = (3, 1), 1, (3, 8)
+    env.agents[1].initial_position, env.agents[1].initial_direction, env.agents[1].target = (3, 8), 3, (0, 3)
+    env.reset(False, False, False)
+
+    # agent 1 waits for two steps, then turns north at (3, 3); the detour of agent 0 is inconsistent
+    path_all = [[(3, c) for c in range(1, 5)] + [(3, 6), (3, 7)],
+                [(3, 8), (3, 8), (3, 8)] + [(3, c) for c in range(7, 2, -1)] + [(2, 3), (1, 3), (0, 3)]]
+    planned_positions, path_lengths = compile_paths(path_all, 2)
+    inconsistent = False
+    for time_step in range(12):
+        status, positions, directions, _ = agent_columns(env.agents)
+        expected = path_controller(time_step, env, path_all)
+        assert compiled_path_controller(time_step, planned_positions, path_lengths, status, positions,
+                                        directions) == expected
+        inconsistent |= expected[2]
+        env.step(expected[0])
+    assert inconsistent
+
+    path_all_replanned = [path_all[0], path_all[1] + [(0, 3)] * 20]
+    planned_positions, path_lengths = recompile_paths(planned_positions, path_lengths, path_all, path_all_replanned)
+    expected_positions, expected_lengths = compile_paths(path_all_replanned, 2)
+    assert (path_lengths == expected_lengths).all()
+    assert (planned_positions == expected_positions).all()
@@ -0,0 +1,68 @@
+import numpy as np
+from PIL import ImageDraw
+
+from flatland.core.env_observation_builder import DummyObservationBuilder
+from flatland.envs.rail_env import RailEnv, RailEnvActions
+from flatland.envs.rail_generators import sparse_rail_generator
+from flatland.envs.schedule_generators import sparse_schedule_generator
+from flatland.utils.graphics_pil import PILGL, PILSVG
+from flatland.utils.rendertools import RenderTool
+
+
+def test_build_background_map():
+    gl = PILGL(7, 5)
+    targets = [(0, 0), (4, 6), (2, 3), (2, 3)]
+    gl.build_background_map(targets)
+    for x in range(7):
+        for y in range(5):
+            expected = min(int(np.floor(np.sqrt((x - c) ** 2 + (y - r) ** 2)) / 0.5) for r, c in targets)
+            assert gl.background_grid[x][y] == min(expected, 9)
+
+    gl.build_background_map([])
+    assert np.all(gl.background_grid == 9)
+
+
+def test_tile_atlas_is_shared():
+    gl = PILSVG(5, 5)
+    gl_2 = PILSVG(8, 8)
+    for name in PILSVG.TILE_ATLAS_ATTRIBUTES:
+        assert getattr(gl_2, name) is getattr(gl, name)
+    assert gl.pil_from_png_file('flatland.png', "Selected_Agent.png") is \
+        gl_2.pil_from_png_file('flatland.png', "Selected_Agent.png")
+
+
+def _render_frames(gl, incremental):
+    env = RailEnv(width=25, height=25,
+                  rail_generator=sparse_rail_generator(max_num_cities=2, max_rails_between_cities=2,
+                                                       max_rails_in_city=3, seed=1),
+                  schedule_generator=sparse_schedule_generator(seed=1), number_of_agents=4,
+                  obs_builder_object=DummyObservationBuilder(), random_seed=1)
+    env.reset(random_seed=1)
+    renderer = RenderTool(env, gl=gl, screen_width=300, screen_height=300, incremental=incremental)
+    images = []
+    for step in range(8):
+        renderer.render_env(show=False, show_observations=False)
+        images.append(renderer.get_image())
+        env.step({handle: RailEnvActions.MOVE_FORWARD for handle in env.get_agent_handles()})
+    return images
+
+
+def test_incremental_rendering():
+    for gl in ["PIL", "PILSVG"]:
+        for full, incremental in zip(_render_frames(gl, False), _render_frames(gl, True)):
+            # the top rows hold the elapsed time and fps texts
+            assert np.array_equal(full[14:], incremental[14:])
+
+
+def test_text_box_without_textbbox(monkeypatch):
+    gl = PILGL(5, 5)
+    gl.incremental = True
+    expected = gl.text_box(gl.draws[PILGL.RAIL_LAYER], (3, 4), "elapsed")
+
+    # Pillow before 8.0 has no textbbox, only textsize
+    monkeypatch.delattr(ImageDraw.ImageDraw, "textbbox")
+    monkeypatch.setattr(ImageDraw.ImageDraw, "textsize",
+                        lambda draw, text, font=None: (expected[2] - 3, expected[3] - 4), raising=False)
+    assert gl.text_box(gl.draws[PILGL.RAIL_LAYER], (3, 4), "elapsed") == (3, 4, expected[2], expected[3])
+    gl.text(3, 4, "elapsed")
+    assert gl.dirty_boxes
@@ -0,0 +1,49 @@
+import os
+
+import pytest
+
+from flatland.envs.rail_env import RailEnv
+from flatland.envs.rail_generators import rail_from_file
+from flatland.envs.schedule_generators import schedule_from_file
+from flatland.utils.scenario_farm import generate_scenarios, load_manifest, scenario_grid
+
+
+def test_scenario_grid():
+    scenarios = scenario_grid({"width": [30, 40], "height": 30, "max_num_cities": 2, "number_of_agents": [2, 3]},
+                              seeds=[1, 2])
+    assert len(scenarios) == 8
+    assert [scenario.name for scenario in scenarios[:3]] == ["level0_test_0", "level0_test_1", "level1_test_0"]
+    assert scenarios[2].parameters.width == 30 and scenarios[2].parameters.number_of_agents == 3
+    assert scenarios[7].parameters.width == 40 and scenarios[7].seed == 2
+
+    with pytest.raises(ValueError):
+        scenario_grid({"width": 30, "heigth": 30}, seeds=[1])
+    with pytest.raises(ValueError):
+        scenario_grid({"width": 30, "height": 30, "max_num_cities": 2, "number_of_agents": 2}, seeds=[0])
+
+
+def test_generate_scenarios_is_deterministic(tmpdir):
+    scenarios = scenario_grid({"width": 30, "height": 30, "max_num_cities": 2, "number_of_agents": [3, 5],
+                               "malfunction_rate": 0.01, "min_duration": 2, "max_duration": 5}, seeds=[1, 2])
+    serial_dir = str(tmpdir.mkdir("serial"))
+    parallel_dir = str(tmpdir.mkdir("parallel"))
+    generate_scenarios(scenarios, serial_dir, processes=1, verbose=False)
+    manifest = generate_scenarios(scenarios, parallel_dir, processes=2, verbose=False)
+
+    assert manifest == load_manifest(parallel_dir)
+    assert manifest["summary"]["test_cases"] == 4
+    assert [entry["name"] for entry in manifest["test_cases"]] == [scenario.name for scenario in scenarios]
+    for entry in manifest["test_cases"]:
+        if entry["status"] != "ok":
+            continue
+        for filename in [entry["test_case"], entry["deadlines"]]:
+            with open(os.path.join(serial_dir, filename), "rb") as serial, \
+                    open(os.path.join(parallel_dir, filename), "rb") as parallel:
+                assert serial.read() == parallel.read()
+
+        test_case = os.path.join(parallel_dir, entry["test_case"])
+        env = RailEnv(width=1, height=1, rail_generator=rail_from_file(test_case),
+                      schedule_generator=schedule_from_file(test_case))
+        env.reset()
+        assert env.get_num_agents() == entry["number_of_agents"]
+        assert len(env.read_deadlines(test_case.replace(".pkl", ".ddl"))) == entry["number_of_agents"]
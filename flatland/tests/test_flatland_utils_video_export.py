@@ -0,0 +1,73 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from flatland.core.env_observation_builder import DummyObservationBuilder
+from flatland.envs.episode_log import EpisodeRecorder
+from flatland.envs.persistence import RailEnvPersister
+from flatland.envs.rail_env import RailEnv, RailEnvActions
+from flatland.envs.rail_generators import sparse_rail_generator
+from flatland.envs.schedule_generators import sparse_schedule_generator
+from flatland.utils.rendertools import RenderTool
+from flatland.utils.video_export import export_episode_frames, export_episode_video, iter_episode_frames, \
+    load_episode_steps
+
+
+def _record_episode(tmpdir, n_steps=10):
+    env = RailEnv(width=25, height=25,
+                  rail_generator=sparse_rail_generator(max_num_cities=2, max_rails_between_cities=2,
+                                                       max_rails_in_city=3, seed=1),
+                  schedule_generator=sparse_schedule_generator(seed=1), number_of_agents=3,
+                  obs_builder_object=DummyObservationBuilder(), random_seed=1, record_steps=True)
+    env.reset(random_seed=1)
+    streamed = os.path.join(tmpdir, "streamed.pkl")
+    env.episode_recorder = EpisodeRecorder(streamed + ".episode")
+    renderer = RenderTool(env, gl="PILSVG", screen_width=300, screen_height=300)
+    live_frames = []
+    for step in range(n_steps):
+        env.step({handle: RailEnvActions.MOVE_FORWARD for handle in env.get_agent_handles()})
+        renderer.render_env(show=False, show_observations=False, show_predictions=False)
+        live_frames.append(renderer.get_image())
+    recorded = os.path.join(tmpdir, "recorded.pkl")
+    RailEnvPersister.save_episode(env, recorded)
+    env.episode_recorder.close()
+    RailEnvPersister.save(env, streamed)
+    return recorded, streamed, live_frames
+
+
+def test_export_episode_frames(tmpdir):
+    recorded, streamed, live_frames = _record_episode(str(tmpdir))
+    steps = load_episode_steps(recorded)
+    assert steps.shape == (10, 3, 4)
+    assert np.array_equal(steps, load_episode_steps(streamed))
+
+    frame_files = export_episode_frames(recorded, os.path.join(str(tmpdir), "frames"), processes=2, chunk_size=4,
+                                        screen_size=300, first_frame=5)
+    assert [os.path.basename(f) for f in frame_files[:2]] == ["flatland_frame_0005.png", "flatland_frame_0006.png"]
+    for frame_file, live_frame in zip(frame_files, live_frames):
+        assert np.array_equal(np.array(Image.open(frame_file)), live_frame)
+
+    for frame, live_frame in zip(iter_episode_frames(streamed, processes=1, chunk_size=3, screen_size=300),
+                                 live_frames):
+        assert np.array_equal(frame, live_frame)
+
+
+def test_export_episode_video(tmpdir):
+    recorded, _, live_frames = _record_episode(str(tmpdir), n_steps=4)
+    output = os.path.join(str(tmpdir), "video.rgba")
+    copy_command = [sys.executable, "-c", "import sys; open(sys.argv[1], 'wb').write(sys.stdin.buffer.read())",
+                    "{output}"]
+    export_episode_video(recorded, output, processes=1, screen_size=300, encoder_command=copy_command)
+    with open(output, "rb") as file_in:
+        assert file_in.read() == b"".join(frame.tobytes() for frame in live_frames)
+
+
+def test_export_episode_video_without_steps(tmpdir):
+    _, streamed, _ = _record_episode(str(tmpdir), n_steps=0)
+    assert len(load_episode_steps(streamed)) == 0
+    with pytest.raises(ValueError):
+        export_episode_video(streamed, os.path.join(str(tmpdir), "video.rgba"), processes=1, screen_size=300,
+                             encoder_command=[sys.executable, "-c", "pass"])
@@ -1,5 +1,5 @@
 from flatland.envs.malfunction_generators import malfunction_from_params, malfunction_from_file, \
-    single_malfunction_generator, MalfunctionParameters
+    single_malfunction_generator, MalfunctionParameters, MalfunctionScheduleGen
 from flatland.envs.rail_env import RailEnv, RailEnvActions
 from flatland.envs.rail_generators import rail_from_grid_transition_map
 from flatland.envs.schedule_generators import random_schedule_generator
@@ -107,3 +107,36 @@ def test_single_malfunction_generator():
             # Go forward all the time
             tot_malfunctions += agent.malfunction_data['nr_malfunctions']
         assert tot_malfunctions == 1
+
+
+def test_malfunction_schedule():
+    """Test that the env breaks the agents exactly as sampled in the malfunction schedule."""
+    stochastic_data = MalfunctionParameters(malfunction_rate=0.1, min_duration=2, max_duration=5)
+    rail, rail_map = make_simple_rail2()
+
+    env = RailEnv(width=25,
+                  height=30,
+                  rail_generator=rail_from_grid_transition_map(rail),
+                  schedule_generator=random_schedule_generator(),
+                  number_of_agents=10,
+                  malfunction_generator=MalfunctionScheduleGen(stochastic_data),
+                  random_seed=7
+                  )
+    env.reset(random_seed=7)
+    schedule = env.malfunction_schedule
+    # no malfunctions are induced in the first two steps
+    assert not schedule.durations[1:3].any()
+
+    malfunctions = {handle: [] for handle in range(env.get_num_agents())}
+    for step in range(1, 60):
+        nr_malfunctions = [agent.malfunction_data['nr_malfunctions'] for agent in env.agents]
+        env.step({handle: RailEnvActions.MOVE_FORWARD for handle in range(env.get_num_agents())})
+        for handle, agent in enumerate(env.agents):
+            if agent.malfunction_data['nr_malfunctions'] > nr_malfunctions[handle]:
+                # the malfunction counter was already decremented once in the step
+                malfunctions[handle].append((step, agent.malfunction_data['malfunction'] + 1))
+
+    assert sum(len(agent_malfunctions) for agent_malfunctions in malfunctions.values()) > 0
+    for handle, agent_malfunctions in malfunctions.items():
+        assert agent_malfunctions == [(step, duration) for step, duration in schedule.get_malfunctions(handle)
+                                      if 0 < step < 60]